@@ -0,0 +1,289 @@
+# benchmarks/ejecutar.py
+
+import os
+
+# Sin acceso a la red: el modelo de sustitución se construye en local
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import argparse
+import base64
+import json
+import logging
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+from io import BytesIO
+
+import numpy as np
+import PIL
+import pydicom
+from PIL import Image
+
+from benchmarks.sinteticos import dicom_sintetico, imagen_sintetica, escribir_conjunto
+from benchmarks.modelo_local import construir_modelo_local
+
+logger = logging.getLogger(__name__)
+
+# Pruebas de rendimiento de los caminos críticos de la aplicación sobre entradas sintéticas.
+# Uso: python -m benchmarks.ejecutar --salida resultados.json [--rapido] [--pruebas leer_dicom,cascada]
+# Cada prueba se repite varias veces tras una ejecución de calentamiento y se guardan el mínimo, la mediana,
+# la media y el p95 en milisegundos. Los datos y el modelo se generan con semillas fijas.
+
+# Tamaño de una mamografía digital completa (columnas x filas = 3328 x 4096) y tamaño reducido para --rapido
+TAMANO_COMPLETO = (4096, 3328)
+TAMANO_RAPIDO = (1024, 832)
+
+PRUEBAS = [
+    'leer_dicom',
+    'convertir_dicom_bytes_a_imagen',
+    'ajustar_brillo_contraste',
+    'visor_ventana',
+    'visor_html',
+    'visor_png',
+    'leer_imagen',
+    'generar_reporte_pdf',
+    'generar_csv',
+    'generar_parquet',
+    'exportar_zip',
+    'cascada'
+]
+
+def casos_dicom(filas, columnas):
+    """
+    Variantes de DICOM: MONOCHROME2 y MONOCHROME1, sin VOI, con ventana y con VOI LUT en tabla, de 12 bits,
+    y una de 16 bits con VOI LUT en tabla (65536 entradas).
+    """
+    return [
+        {'tipo': 'DICOM', 'nombre': f"m2_sin_voi_{columnas}x{filas}", 'filas': filas, 'columnas': columnas, 'bits': 12,
+         'fotometria': 'MONOCHROME2', 'voi': None},
+        {'tipo': 'DICOM', 'nombre': f"m2_tabla_voi_{columnas}x{filas}", 'filas': filas, 'columnas': columnas, 'bits': 12,
+         'fotometria': 'MONOCHROME2', 'voi': 'tabla'},
+        {'tipo': 'DICOM', 'nombre': f"m1_ventana_{columnas}x{filas}", 'filas': filas, 'columnas': columnas, 'bits': 12,
+         'fotometria': 'MONOCHROME1', 'voi': 'ventana'},
+        {'tipo': 'DICOM', 'nombre': f"m1_sin_voi_{columnas}x{filas}", 'filas': filas, 'columnas': columnas, 'bits': 12,
+         'fotometria': 'MONOCHROME1', 'voi': None},
+        {'tipo': 'DICOM', 'nombre': f"m2_16bits_tabla_voi_{columnas}x{filas}", 'filas': filas, 'columnas': columnas,
+         'bits': 16, 'fotometria': 'MONOCHROME2', 'voi': 'tabla'}
+    ]
+
+def casos_imagen(filas, columnas):
+    return [
+        {'tipo': 'PNG_JPG', 'nombre': f"png_{columnas}x{filas}", 'filas': filas, 'columnas': columnas, 'formato': 'PNG'},
+        {'tipo': 'PNG_JPG', 'nombre': f"jpg_{columnas}x{filas}", 'filas': filas, 'columnas': columnas, 'formato': 'JPEG'}
+    ]
+
+def medir(funcion, repeticiones, calentamiento=1):
+    """
+    Ejecuta funcion calentamiento + repeticiones veces y devuelve las estadísticas de tiempo en ms.
+    """
+    for _ in range(calentamiento):
+        funcion()
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        'repeticiones': repeticiones,
+        'min_ms': min(tiempos),
+        'mediana_ms': statistics.median(tiempos),
+        'media_ms': statistics.fmean(tiempos),
+        'p95_ms': float(np.percentile(tiempos, 95))
+    }
+
+def _resultados_reporte(n):
+    # Resultados con la forma de los de procesar_imagenes_masivas; uno de cada siete nombres no es latin-1
+    categorias = ['masas', 'calcificaciones', 'no_encontrado']
+    secundarias = ['benigno', 'maligno', 'sospechoso', None]
+    return [
+        {'nombre_archivo': f"paciente_{indice:05d}_{'乳房' if indice % 7 == 0 else 'mama'}_proyección_mlo.dcm",
+         'categoria_primaria': categorias[indice % 3], 'score_primario': 0.5 + (indice % 50) / 100,
+         'categoria_secundaria': secundarias[indice % 4] if indice % 3 < 2 else None,
+         'score_secundario': 0.4 + (indice % 60) / 100 if indice % 3 < 2 and indice % 4 < 3 else None,
+         'primary_correct': indice % 5 != 0}
+        for indice in range(n)
+    ]
+
+def ejecutar(pruebas=PRUEBAS, rapido=False, repeticiones=5, filas_reporte=10000, imagenes_cascada=32, tamano_lote=8,
+             directorio_trabajo=None):
+    """
+    Ejecuta las pruebas indicadas y devuelve la lista de resultados (un diccionario por prueba y caso).
+    """
+    # Importaciones diferidas: los módulos de la aplicación importan Streamlit y transformers
+    from src.modulos.procesamiento_i import leer_dicom, leer_imagen
+    from src.modulos.gestion_dicom import convertir_dicom_bytes_a_imagen
+    from src.modulos.visor_dicom import ajustar_brillo_contraste, html_visor_imagen
+    from src.modulos.ventana import preparar_ventana, aplicar_ventana, verificar_ventana
+    from src.modulos.codificacion import codificar_vista_previa, codificar_png
+    from src.modulos.configuracion import LADO_VISTA_GENERAL
+    from src.modulos.reportes import generar_reporte_pdf, generar_csv, generar_parquet, parquet_disponible
+    from src.modulos.exportacion import exportar_lote, archivo_temporal_exportacion
+
+    filas, columnas = TAMANO_RAPIDO if rapido else TAMANO_COMPLETO
+    resultados = []
+
+    def registrar(prueba, caso, estadisticas, **extra):
+        fila = {'prueba': prueba, 'caso': caso, **estadisticas, **extra}
+        logger.info(f"{prueba} [{caso}]: mediana {fila['mediana_ms']:.1f} ms")
+        resultados.append(fila)
+
+    dicoms = {caso['nombre']: dicom_sintetico(caso['filas'], caso['columnas'], caso['bits'], caso['fotometria'], caso['voi'])
+              for caso in casos_dicom(filas, columnas)}
+
+    for nombre, datos in dicoms.items():
+        extra = {'bytes_entrada': len(datos)}
+        if 'leer_dicom' in pruebas:
+            registrar('leer_dicom', nombre, medir(lambda: leer_dicom(BytesIO(datos)), repeticiones), **extra)
+        if 'convertir_dicom_bytes_a_imagen' in pruebas:
+            registrar('convertir_dicom_bytes_a_imagen', nombre,
+                      medir(lambda: convertir_dicom_bytes_a_imagen(datos, (224, 224)), repeticiones), **extra)
+
+        if not {'ajustar_brillo_contraste', 'visor_ventana', 'visor_html', 'visor_png'} & set(pruebas):
+            continue
+        imagen, _ = leer_dicom(BytesIO(datos))
+        ds = pydicom.dcmread(BytesIO(datos))
+        if 'ajustar_brillo_contraste' in pruebas:
+            registrar('ajustar_brillo_contraste', nombre, medir(lambda: ajustar_brillo_contraste(imagen, 20, 30), repeticiones))
+        if 'visor_ventana' in pruebas:
+            ventana = preparar_ventana(ds)
+            if ventana is not None:
+                # Diferencia máxima con las referencias: normalización de 8 bits y estados ajustados (debe ser 0)
+                diferencia, _ = verificar_ventana(ventana, ds)
+                registrar('visor_ventana', nombre, medir(lambda: aplicar_ventana(ventana, 20, 30), repeticiones),
+                          diferencia_8bits=diferencia)
+        if 'visor_html' in pruebas:
+            def vista_html():
+                datos_vista, mime, _ = codificar_vista_previa(imagen, LADO_VISTA_GENERAL)
+                return html_visor_imagen(base64.b64encode(datos_vista).decode(), mime, nombre)
+            registrar('visor_html', nombre, medir(vista_html, repeticiones))
+        if 'visor_png' in pruebas:
+            registrar('visor_png', nombre, medir(lambda: codificar_png(imagen), repeticiones))
+
+    if 'leer_imagen' in pruebas:
+        for caso in casos_imagen(filas, columnas):
+            datos = imagen_sintetica(caso['filas'], caso['columnas'], caso['formato'])
+            registrar('leer_imagen', caso['nombre'], medir(lambda: leer_imagen(BytesIO(datos)), repeticiones),
+                      bytes_entrada=len(datos))
+
+    filas_pdf = _resultados_reporte(filas_reporte)
+    if 'generar_reporte_pdf' in pruebas:
+        registrar('generar_reporte_pdf', f"{filas_reporte}_filas",
+                  medir(lambda: generar_reporte_pdf(filas_pdf, 10, 10, 10, 5, 5, 10, 25.0, 25.0, 50.0, filas_reporte), repeticiones),
+                  bytes_salida=len(generar_reporte_pdf(filas_pdf, 10, 10, 10, 5, 5, 10, 25.0, 25.0, 50.0, filas_reporte)))
+    if 'generar_csv' in pruebas:
+        registrar('generar_csv', f"{filas_reporte}_filas", medir(lambda: generar_csv(filas_pdf), repeticiones),
+                  bytes_salida=len(generar_csv(filas_pdf)))
+    if 'generar_parquet' in pruebas and parquet_disponible():
+        registrar('generar_parquet', f"{filas_reporte}_filas", medir(lambda: generar_parquet(filas_pdf), repeticiones),
+                  bytes_salida=len(generar_parquet(filas_pdf)))
+
+    # Archivos sintéticos y modelos locales: en --directorio si se indica (y se conservan) o en un directorio
+    # temporal que se borra al terminar
+    with (nullcontext(directorio_trabajo) if directorio_trabajo
+          else tempfile.TemporaryDirectory(prefix="mamo_benchmark_")) as directorio:
+
+        if 'exportar_zip' in pruebas:
+            rutas = escribir_conjunto(os.path.join(directorio, 'exportar'), casos_dicom(filas, columnas)[:2], por_caso=4)
+            elementos = [(os.path.basename(ruta), ruta) for ruta in rutas]
+            for procesos in sorted({1, os.cpu_count() or 1}):
+                def exportar():
+                    with archivo_temporal_exportacion() as destino:
+                        return exportar_lote(elementos, destino, (512, 512), 'PNG', procesos=procesos)
+                registrar('exportar_zip', f"{len(elementos)}_archivos_{procesos}_procesos",
+                          medir(exportar, max(1, repeticiones // 2)), archivos=len(elementos), procesos=procesos)
+
+        if 'cascada' in pruebas:
+            from src.modulos.registro_modelos import obtener_modelo
+            from src.modulos.cascada import clasificar_cascada
+
+            modelos = [construir_modelo_local(os.path.join(directorio, f"modelo_{semilla}"), semilla) for semilla in range(3)]
+            primario, masas, calcificaciones = (obtener_modelo(ruta, device=-1, backend='pytorch') for ruta in modelos)
+            imagenes = [
+                Image.fromarray(np.asarray(dicom_imagen)).resize((224, 224)).convert('RGB')
+                for dicom_imagen in (leer_dicom(BytesIO(datos))[0] for datos in dicoms.values())
+            ]
+            imagenes = [imagenes[indice % len(imagenes)] for indice in range(imagenes_cascada)]
+            estadisticas = medir(lambda: clasificar_cascada(imagenes, primario, {'masas': masas, 'calcificaciones': calcificaciones},
+                                                            tamano_lote=tamano_lote), repeticiones)
+            registrar('cascada', f"{imagenes_cascada}_imagenes_lote_{tamano_lote}", estadisticas,
+                      imagenes_s=imagenes_cascada / (estadisticas['mediana_ms'] / 1000))
+
+    return resultados
+
+def entorno():
+    """
+    Versiones y características de la máquina, para comparar resultados entre ejecuciones.
+    """
+    import torch
+    import transformers
+    return {
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'procesador': platform.processor() or platform.machine(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pydicom': pydicom.__version__,
+        'pillow': PIL.__version__,
+        'torch': torch.__version__,
+        'transformers': transformers.__version__,
+        'hilos_torch': torch.get_num_threads()
+    }
+
+def construir_parser():
+    parser = argparse.ArgumentParser(description="Pruebas de rendimiento de MamoViewer AI sobre datos sintéticos.")
+    parser.add_argument('-o', '--salida', default='-', help="Archivo JSON de resultados ('-' para la salida estándar)")
+    parser.add_argument('--pruebas', default=','.join(PRUEBAS), help=f"Pruebas a ejecutar, separadas por comas ({', '.join(PRUEBAS)})")
+    parser.add_argument('--rapido', action='store_true', help=f"Imágenes de {TAMANO_RAPIDO[1]}x{TAMANO_RAPIDO[0]} en lugar de "
+                                                               f"{TAMANO_COMPLETO[1]}x{TAMANO_COMPLETO[0]}")
+    parser.add_argument('-r', '--repeticiones', type=int, default=5)
+    parser.add_argument('--filas-reporte', type=int, default=10000, help="Filas de los reportes PDF, CSV y Parquet")
+    parser.add_argument('--imagenes-cascada', type=int, default=32)
+    parser.add_argument('--tamano-lote', type=int, default=8)
+    parser.add_argument('--directorio', help="Directorio de trabajo para los archivos sintéticos y el modelo local "
+                                             "(por defecto, uno temporal)")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser
+
+def main(argv=None):
+    args = construir_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    pruebas = [prueba.strip() for prueba in args.pruebas.split(',') if prueba.strip()]
+    desconocidas = set(pruebas) - set(PRUEBAS)
+    if desconocidas:
+        print(f"Pruebas desconocidas: {', '.join(sorted(desconocidas))}", file=sys.stderr)
+        return 2
+
+    inicio = time.perf_counter()
+    resultados = ejecutar(pruebas, args.rapido, args.repeticiones, args.filas_reporte, args.imagenes_cascada,
+                          args.tamano_lote, args.directorio)
+    informe = {
+        'fecha': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'entorno': entorno(),
+        'parametros': {
+            'pruebas': pruebas,
+            'tamano': list(TAMANO_RAPIDO if args.rapido else TAMANO_COMPLETO),
+            'repeticiones': args.repeticiones,
+            'filas_reporte': args.filas_reporte,
+            'imagenes_cascada': args.imagenes_cascada,
+            'tamano_lote': args.tamano_lote
+        },
+        'duracion_s': time.perf_counter() - inicio,
+        'resultados': resultados
+    }
+
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if args.salida == '-':
+        print(texto)
+    else:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            archivo.write(texto)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
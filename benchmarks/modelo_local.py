@@ -0,0 +1,37 @@
+# benchmarks/modelo_local.py
+
+import os
+
+import torch
+from transformers import ViTConfig, ViTForImageClassification, ViTImageProcessor
+
+# Clasificador de sustitución para medir la inferencia sin descargar los modelos de Hugging Face:
+# un ViT pequeño con pesos aleatorios (deterministas) y las mismas etiquetas '0', '1', '2' que los modelos reales,
+# de modo que los mapeos de la cascada funcionan igual. Sus predicciones no tienen sentido clínico.
+
+ETIQUETAS = {0: '0', 1: '1', 2: '2'}
+
+def construir_modelo_local(directorio, semilla=0, capas=4, dimension=192):
+    """
+    Guarda en directorio un ViT de clasificación de 224x224 con su procesador de imágenes y devuelve la ruta,
+    que se puede pasar a obtener_modelo en lugar del nombre del modelo de Hugging Face.
+    Si ya existe, se reutiliza.
+    """
+    if os.path.exists(os.path.join(directorio, 'config.json')):
+        return directorio
+
+    torch.manual_seed(semilla)
+    config = ViTConfig(
+        image_size=224,
+        patch_size=16,
+        hidden_size=dimension,
+        num_hidden_layers=capas,
+        num_attention_heads=3,
+        intermediate_size=4 * dimension,
+        num_labels=len(ETIQUETAS),
+        id2label=ETIQUETAS,
+        label2id={etiqueta: indice for indice, etiqueta in ETIQUETAS.items()}
+    )
+    ViTForImageClassification(config).save_pretrained(directorio)
+    ViTImageProcessor().save_pretrained(directorio)
+    return directorio
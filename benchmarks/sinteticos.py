@@ -0,0 +1,131 @@
+# benchmarks/sinteticos.py
+
+import os
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+# Generador de mamografías sintéticas para las pruebas de rendimiento.
+# Las imágenes imitan la estructura de una mamografía (mama sobre fondo, textura de baja frecuencia, ruido y
+# microcalcificaciones) para que los códecs y las LUT trabajen con una distribución de valores realista.
+# Todo es determinista a partir de la semilla.
+
+SOP_MAMOGRAFIA = '1.2.840.10008.5.1.4.1.1.1.2'  # Digital Mammography X-Ray Image Storage - For Presentation
+
+def generar_pixeles(filas, columnas, bits=12, semilla=0):
+    """
+    Devuelve una matriz uint16 (filas x columnas) con valores en [0, 2^bits - 1] y fondo 0.
+    """
+    rng = np.random.default_rng(semilla)
+    maximo = (1 << bits) - 1
+
+    # Mama: semielipse apoyada en el borde izquierdo; el espesor decrece hacia la piel
+    y = np.linspace(-1, 1, filas, dtype=np.float32)[:, None] / 0.9
+    x = np.linspace(0, 1, columnas, dtype=np.float32)[None, :] / 0.75
+    espesor = np.clip(1 - (y * y + x * x), 0, 1) ** 0.35
+
+    # Textura de tejido fibroglandular: ruido de baja frecuencia interpolado
+    base = rng.standard_normal((filas // 64 + 2, columnas // 64 + 2)).astype(np.float32)
+    textura = np.asarray(Image.fromarray(base, mode='F').resize((columnas, filas), Image.BICUBIC))
+
+    imagen = espesor * (0.55 + 0.12 * textura)
+    imagen += rng.standard_normal((filas, columnas), dtype=np.float32) * 0.015 * (espesor > 0)
+
+    # Microcalcificaciones: pequeños puntos brillantes dentro de la mama
+    for _ in range(40):
+        fila, columna = rng.integers(0, filas - 4), rng.integers(0, columnas - 4)
+        if espesor[fila, columna] > 0.2:
+            imagen[fila:fila + 3, columna:columna + 3] = 0.95
+
+    return (np.clip(imagen, 0, 1) * maximo).astype(np.uint16)
+
+def _tabla_voi(bits):
+    # VOI LUT sigmoidal de 2^bits entradas y salida de 16 bits
+    entradas = 1 << bits
+    x = np.linspace(-6, 6, entradas)
+    return (65535 / (1 + np.exp(-x))).astype(np.uint16)
+
+def dicom_sintetico(filas=4096, columnas=3328, bits=12, fotometria='MONOCHROME2', voi=None, semilla=0):
+    """
+    Devuelve los bytes de un DICOM de mamografía sintético sin comprimir (16 bits asignados).
+    voi: None (sin VOI), 'ventana' (WindowCenter/WindowWidth) o 'tabla' (VOILUTSequence).
+    Con MONOCHROME1 los valores almacenados se invierten, de modo que la imagen mostrada es la misma.
+    """
+    pixeles = generar_pixeles(filas, columnas, bits, semilla)
+    if fotometria == 'MONOCHROME1':
+        pixeles = ((1 << bits) - 1) - pixeles
+
+    file_meta = FileMetaDataset()
+    file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+    file_meta.MediaStorageSOPClassUID = SOP_MAMOGRAFIA
+    file_meta.MediaStorageSOPInstanceUID = generate_uid()
+
+    ds = Dataset()
+    ds.file_meta = file_meta
+    ds.SOPClassUID = SOP_MAMOGRAFIA
+    ds.SOPInstanceUID = file_meta.MediaStorageSOPInstanceUID
+    ds.Modality = 'MG'
+    ds.PatientID = f"SINTETICO{semilla:04d}"
+    ds.StudyInstanceUID = generate_uid()
+    ds.SeriesInstanceUID = generate_uid()
+    ds.ImageLaterality = 'L' if semilla % 2 == 0 else 'R'
+    ds.ViewPosition = 'CC' if semilla % 4 < 2 else 'MLO'
+    ds.Rows, ds.Columns = filas, columnas
+    ds.BitsAllocated = 16
+    ds.BitsStored = bits
+    ds.HighBit = bits - 1
+    ds.PixelRepresentation = 0
+    ds.SamplesPerPixel = 1
+    ds.PhotometricInterpretation = fotometria
+    ds.PixelSpacing = [0.07, 0.07]
+
+    if voi == 'ventana':
+        ds.WindowCenter = 1 << (bits - 1)
+        ds.WindowWidth = int((1 << bits) * 0.8)
+    elif voi == 'tabla':
+        item = Dataset()
+        # LUTDescriptor: 65536 entradas se codifican como 0 (el valor no cabe en US)
+        item.add_new(0x00283002, 'US', [(1 << bits) & 0xFFFF, 0, 16])
+        # LUTData como OW: con 65536 entradas su longitud no cabe en el campo de 2 bytes de US en VR explícita
+        item.add_new(0x00283006, 'OW', _tabla_voi(bits).astype('<u2').tobytes())
+        ds.VOILUTSequence = [item]
+    elif voi is not None:
+        raise ValueError(f"VOI no soportada: {voi}")
+
+    ds.PixelData = pixeles.tobytes()
+    buffer = BytesIO()
+    ds.save_as(buffer, enforce_file_format=True)
+    return buffer.getvalue()
+
+def imagen_sintetica(filas=4096, columnas=3328, formato='PNG', semilla=0):
+    """
+    Devuelve los bytes de una mamografía sintética de 8 bits en PNG o JPEG.
+    """
+    pixeles = (generar_pixeles(filas, columnas, 12, semilla) >> 4).astype(np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(pixeles).save(buffer, format=formato)
+    return buffer.getvalue()
+
+def escribir_conjunto(directorio, casos, por_caso=1):
+    """
+    Escribe en un directorio los archivos de una lista de casos (diccionarios con tipo, nombre y parámetros)
+    y devuelve sus rutas.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    rutas = []
+    for caso in casos:
+        for indice in range(por_caso):
+            if caso['tipo'] == 'DICOM':
+                datos = dicom_sintetico(caso['filas'], caso['columnas'], caso['bits'], caso['fotometria'], caso['voi'], indice)
+                extension = 'dcm'
+            else:
+                datos = imagen_sintetica(caso['filas'], caso['columnas'], caso['formato'], indice)
+                extension = 'png' if caso['formato'] == 'PNG' else 'jpg'
+            ruta = os.path.join(directorio, f"{caso['nombre']}_{indice:03d}.{extension}")
+            with open(ruta, 'wb') as archivo:
+                archivo.write(datos)
+            rutas.append(ruta)
+    return rutas
@@ -0,0 +1,8 @@
+# clasificar.py
+
+import sys
+
+from src.modulos.clasificacion_lotes import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,8 @@
+# exportar.py
+
+import sys
+
+from src.modulos.exportacion import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,266 @@
+# src/modulos/backends.py
+
+import logging
+import os
+import statistics
+import time
+from io import BytesIO
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+from PIL import Image
+from transformers import pipeline
+
+from src.modulos.configuracion import BACKENDS_INFERENCIA, DIRECTORIO_ONNX
+from src.modulos.metricas import intervalo
+
+logger = logging.getLogger(__name__)
+
+# Backends de inferencia de los clasificadores:
+#   pytorch       pipeline de transformers en fp32 (el comportamiento original)
+#   pytorch_int8  el mismo pipeline con las capas lineales cuantizadas dinámicamente a int8 (solo CPU)
+#   onnx          el modelo exportado a ONNX y ejecutado con ONNX Runtime (CPU)
+# Todos devuelven el mismo formato que el pipeline ([{'label', 'score'}, ...] por imagen, ordenado por score),
+# de modo que los mapeos de etiquetas y la cascada no dependen del backend.
+
+BACKENDS = ('pytorch', 'pytorch_int8', 'onnx')
+
+def backend_modelo(model_name, configuracion=BACKENDS_INFERENCIA):
+    """
+    Devuelve el backend configurado para un modelo.
+    La configuración es un backend para todos los modelos ("onnx") o una lista "modelo=backend,..." en la
+    que "*=backend" se aplica al resto.
+    """
+    por_defecto = 'pytorch'
+    for parte in filter(None, (parte.strip() for parte in configuracion.split(','))):
+        if '=' not in parte:
+            por_defecto = parte
+            continue
+        modelo, backend = (valor.strip() for valor in parte.split('=', 1))
+        if modelo == model_name:
+            return _validar(backend)
+        if modelo == '*':
+            por_defecto = backend
+    return _validar(por_defecto)
+
+def _validar(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de inferencia no soportado: {backend} (opciones: {', '.join(BACKENDS)})")
+    return backend
+
+def _es_cpu(device):
+    return str(device) in ('-1', 'cpu')
+
+def resultados_desde_logits(logits, config, top_k=5):
+    """
+    Convierte los logits (numpy, una fila por imagen) en la salida del pipeline de image-classification:
+    sigmoide para modelos multietiqueta o de una sola salida y softmax en el resto, ordenado por score.
+    """
+    logits = np.asarray(logits, dtype=np.float32)
+    if config.problem_type == 'multi_label_classification' or config.num_labels == 1:
+        probabilidades = 1.0 / (1.0 + np.exp(-logits))
+    else:
+        # Softmax estable, igual que el posprocesado del pipeline
+        probabilidades = np.exp(logits - logits.max(axis=1, keepdims=True))
+        probabilidades /= probabilidades.sum(axis=1, keepdims=True)
+    top_k = min(top_k, probabilidades.shape[1])
+    resultados = []
+    for fila in probabilidades:
+        orden = np.argsort(-fila, kind='stable')[:top_k]
+        resultados.append([{'label': config.id2label[int(i)], 'score': float(fila[i])} for i in orden])
+    return resultados
+
+def admite_pixel_values(classifier):
+    """
+    Indica si el clasificador puede recibir directamente el tensor preprocesado (pipeline o ClasificadorOnnx).
+    """
+    return getattr(classifier, 'image_processor', None) is not None and getattr(classifier, 'model', None) is not None
+
+def etapa_inferencia(classifier):
+    """
+    Nombre de la etapa de métricas de la inferencia de un clasificador ("inferencia:<modelo>").
+    """
+    return f"inferencia:{getattr(getattr(classifier, 'model', None), 'name_or_path', None) or 'modelo'}"
+
+def preprocesar(imagenes, classifier):
+    """
+    Aplica el procesador de imágenes del clasificador y devuelve pixel_values (tensor de PyTorch en CPU).
+    """
+    with intervalo('preprocesado'):
+        return classifier.image_processor(
+            images=[imagen.convert('RGB') for imagen in imagenes], return_tensors='pt')['pixel_values']
+
+def clasificar_pixel_values(classifier, pixel_values, top_k=5):
+    """
+    Clasifica un tensor ya preprocesado, sin volver a pasar por el procesador de imágenes.
+    Devuelve lo mismo que el pipeline para una lista de imágenes.
+    """
+    with intervalo(etapa_inferencia(classifier)):
+        if isinstance(classifier, ClasificadorOnnx):
+            logits = classifier.sesion.run(None, {'pixel_values': pixel_values.numpy().astype(np.float32)})[0]
+        else:
+            modelo = classifier.model
+            with torch.inference_mode():
+                logits = modelo(pixel_values=pixel_values.to(classifier.device, dtype=modelo.dtype)).logits
+            logits = logits.float().cpu().numpy()
+    return resultados_desde_logits(logits, classifier.model.config, top_k)
+
+class ClasificadorOnnx:
+    """
+    Clasificador con la misma interfaz que el pipeline de image-classification, ejecutado con ONNX Runtime.
+    Reutiliza el procesador de imágenes y la configuración (id2label) del pipeline original; los pesos de
+    PyTorch no se conservan.
+    """
+
+    backend = 'onnx'
+
+    def __init__(self, clasificador_pytorch, ruta_onnx, sesion):
+        # model solo expone el nombre y la configuración (huella de la caché, id2label)
+        self.model = SimpleNamespace(name_or_path=clasificador_pytorch.model.name_or_path,
+                                     config=clasificador_pytorch.model.config)
+        self.image_processor = clasificador_pytorch.image_processor
+        self.ruta_onnx = ruta_onnx
+        self.sesion = sesion
+        self._id2label = self.model.config.id2label
+
+    def _clasificar(self, imagenes, top_k):
+        return clasificar_pixel_values(self, preprocesar(imagenes, self), top_k)
+
+    def __call__(self, imagenes, batch_size=None, top_k=5):
+        top_k = min(top_k, len(self._id2label))
+        if isinstance(imagenes, Image.Image):
+            return self._clasificar([imagenes], top_k)[0]
+        imagenes = list(imagenes)
+        batch_size = batch_size or 1
+        resultados = []
+        for inicio in range(0, len(imagenes), batch_size):
+            resultados.extend(self._clasificar(imagenes[inicio:inicio + batch_size], top_k))
+        return resultados
+
+class _SoloLogits(torch.nn.Module):
+    # El exportador de ONNX necesita una salida tensorial, no un ModelOutput
+    def __init__(self, modelo):
+        super().__init__()
+        self.modelo = modelo
+
+    def forward(self, pixel_values):
+        return self.modelo(pixel_values=pixel_values).logits
+
+def _ruta_onnx(clasificador_pytorch):
+    modelo = clasificador_pytorch.model
+    nombre = modelo.name_or_path.strip('/').replace('/', '__')
+    revision = getattr(modelo.config, '_commit_hash', None) or 'local'
+    return os.path.join(DIRECTORIO_ONNX, f"{nombre}@{revision}.onnx")
+
+def _exportar_onnx(clasificador_pytorch, ruta):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    # Las dimensiones de entrada las fija el procesador de imágenes del modelo
+    ejemplo = clasificador_pytorch.image_processor(
+        images=Image.new('RGB', (224, 224)), return_tensors='pt')['pixel_values']
+    temporal = f"{ruta}.tmp"
+    with torch.no_grad():
+        torch.onnx.export(
+            _SoloLogits(clasificador_pytorch.model.eval()),
+            (ejemplo,),
+            temporal,
+            input_names=['pixel_values'],
+            output_names=['logits'],
+            dynamic_axes={'pixel_values': {0: 'lote'}, 'logits': {0: 'lote'}},
+            opset_version=17,
+            dynamo=False
+        )
+    os.replace(temporal, ruta)
+
+def _crear_onnx(clasificador_pytorch):
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError("El backend 'onnx' requiere el paquete onnxruntime (pip install onnxruntime onnx).") from e
+
+    ruta = _ruta_onnx(clasificador_pytorch)
+    if not os.path.exists(ruta):
+        inicio = time.perf_counter()
+        _exportar_onnx(clasificador_pytorch, ruta)
+        logger.info(f"Modelo {clasificador_pytorch.model.name_or_path} exportado a ONNX en {time.perf_counter() - inicio:.2f} s")
+    sesion = onnxruntime.InferenceSession(ruta, providers=['CPUExecutionProvider'])
+    return ClasificadorOnnx(clasificador_pytorch, ruta, sesion)
+
+def crear_clasificador(model_name, revision, device, backend):
+    """
+    Carga el clasificador de un modelo con el backend indicado.
+    Los backends pytorch_int8 y onnx se ejecutan siempre en CPU.
+    """
+    backend = _validar(backend)
+    if backend != 'pytorch' and not _es_cpu(device):
+        logger.warning(f"El backend {backend} solo se ejecuta en CPU; se ignora el dispositivo {device}")
+        device = -1
+
+    classifier = pipeline("image-classification", model=model_name, revision=revision, device=device)
+    if backend == 'pytorch_int8':
+        classifier.model = torch.ao.quantization.quantize_dynamic(classifier.model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif backend == 'onnx':
+        return _crear_onnx(classifier)
+    classifier.backend = backend
+    return classifier
+
+def tamano_modelo(classifier):
+    """
+    Tamaño serializado del modelo en bytes: el archivo ONNX o el state_dict de PyTorch.
+    """
+    ruta_onnx = getattr(classifier, 'ruta_onnx', None)
+    if ruta_onnx is not None:
+        return os.path.getsize(ruta_onnx)
+    buffer = BytesIO()
+    torch.save(classifier.model.state_dict(), buffer)
+    return buffer.tell()
+
+def _top1(salidas):
+    return [(salida[0]['label'], salida[0]['score']) if salida else (None, None) for salida in salidas]
+
+def comparar_backends(model_name, imagenes, backends=BACKENDS, tamano_lote=8, revision=None, muestras_latencia=20):
+    """
+    Compara los backends de un modelo sobre una lista de imágenes PIL, todos en CPU.
+    Para cada backend devuelve el tiempo de carga, el tamaño serializado, la latencia de una imagen (mediana),
+    el rendimiento por lotes y la concordancia top-1 y la diferencia media de score frente a pytorch fp32.
+    Los modelos se cargan fuera del registro y se liberan al terminar cada medida.
+    """
+    referencia = None
+    etiquetas_referencia = None
+    resultados = []
+    for backend in ('pytorch',) + tuple(b for b in backends if b != 'pytorch'):
+        fila = {'modelo': model_name, 'backend': backend}
+        try:
+            inicio = time.perf_counter()
+            classifier = crear_clasificador(model_name, revision, -1, backend)
+            fila['tiempo_carga_s'] = time.perf_counter() - inicio
+            fila['tamano_mb'] = tamano_modelo(classifier) / (1024 * 1024)
+
+            # Calentamiento, latencia de una imagen y rendimiento por lotes
+            classifier(imagenes[:1], batch_size=1)
+            latencias = []
+            for imagen in imagenes[:muestras_latencia]:
+                inicio = time.perf_counter()
+                classifier([imagen], batch_size=1)
+                latencias.append((time.perf_counter() - inicio) * 1000)
+            inicio = time.perf_counter()
+            top1 = _top1(classifier(imagenes, batch_size=tamano_lote))
+            tiempo = time.perf_counter() - inicio
+
+            fila['latencia_ms'] = statistics.median(latencias)
+            fila['imagenes_s'] = len(imagenes) / tiempo if tiempo > 0 else 0.0
+            etiquetas = set(classifier.model.config.id2label.values())
+            del classifier
+            if backend == 'pytorch':
+                referencia, etiquetas_referencia = top1, etiquetas
+            if referencia is not None:
+                fila['mismas_etiquetas'] = etiquetas == etiquetas_referencia
+                coincidencias = [(a, b) for a, b in zip(top1, referencia) if a[0] is not None and a[0] == b[0]]
+                fila['concordancia_top1'] = len(coincidencias) / len(imagenes)
+                fila['diferencia_media_score'] = (
+                    float(np.mean([abs(a[1] - b[1]) for a, b in coincidencias])) if coincidencias else None)
+        except Exception as e:
+            logger.error(f"Error al comparar el backend {backend} de {model_name}: {e}")
+            fila['error'] = str(e)
+        resultados.append(fila)
+    return resultados
@@ -0,0 +1,270 @@
+# src/modulos/cache_clasificacion.py
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+from src.modulos.configuracion import RUTA_CACHE_CLASIFICACION, MAX_ENTRADAS_CACHE_CLASIFICACION
+
+logger = logging.getLogger(__name__)
+
+# Caché persistente de clasificaciones, direccionada por contenido:
+# clave = hash de los píxeles decodificados que recibe el modelo, huella = modelos y revisiones usados.
+# Las entradas de cada huella conviven (otro backend o un modelo secundario que no cargó no borran las demás)
+# y la expulsión LRU retira las que dejan de usarse; solo se invalidan al momento las de una huella con
+# un modelo del mismo nombre en otra revisión, que ya no volverán a ser válidas.
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS clasificaciones (
+    clave TEXT NOT NULL,
+    huella TEXT NOT NULL,
+    categoria_primaria TEXT NOT NULL,
+    score_primario REAL NOT NULL,
+    categoria_secundaria TEXT,
+    score_secundario REAL,
+    ultimo_acceso REAL NOT NULL,
+    PRIMARY KEY (clave, huella)
+);
+CREATE INDEX IF NOT EXISTS idx_clasificaciones_acceso ON clasificaciones (ultimo_acceso);
+CREATE TABLE IF NOT EXISTS huellas (
+    huella TEXT PRIMARY KEY,
+    modelos TEXT NOT NULL
+);
+"""
+
+# Modelos (nombre -> revisión) de cada huella calculada por huella_modelos() en este proceso
+_modelos_por_huella = {}
+
+# Ficheros cuyo nombre, tamaño y fecha de modificación identifican los pesos de un modelo local
+_EXTENSIONES_PESOS = ('.safetensors', '.bin', '.onnx', '.pt', '.pth', '.msgpack', '.h5', '.json')
+
+# Firma de los pesos locales de cada modelo cargado (se calcula una vez por objeto modelo)
+_firmas_pesos = weakref.WeakKeyDictionary()
+
+def clave_imagen(imagen):
+    """
+    Calcula el hash SHA-256 de los píxeles de una imagen PIL (incluye modo y tamaño).
+    """
+    digest = hashlib.sha256(f"{imagen.mode}:{imagen.size[0]}x{imagen.size[1]}:".encode())
+    digest.update(imagen.tobytes())
+    return digest.hexdigest()
+
+def _firma_directorio(ruta):
+    """
+    Resume nombre, tamaño y fecha de modificación de los ficheros de pesos y configuración de un directorio.
+    """
+    digest = hashlib.sha256()
+    for raiz, directorios, ficheros in os.walk(ruta):
+        directorios.sort()
+        for fichero in sorted(ficheros):
+            if not fichero.endswith(_EXTENSIONES_PESOS):
+                continue
+            ruta_fichero = os.path.join(raiz, fichero)
+            try:
+                info = os.stat(ruta_fichero)
+            except OSError:
+                continue
+            digest.update(f"{os.path.relpath(ruta_fichero, ruta)}:{info.st_size}:{info.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+def _firma_pesos(modelo, ruta):
+    try:
+        firma = _firmas_pesos.get(modelo)
+    except TypeError:
+        return _firma_directorio(ruta)
+    if firma is None:
+        firma = _firma_directorio(ruta)
+        _firmas_pesos[modelo] = firma
+    return firma
+
+def revision_efectiva(classifier):
+    """
+    Devuelve el identificador de la revisión del modelo cargado: el commit de Hugging Face si está disponible;
+    si el modelo se cargó de un directorio local, su ruta más una firma de los pesos (nombre, tamaño y fecha
+    de modificación), de modo que sustituir los pesos en el mismo directorio invalida las entradas de la caché.
+    """
+    modelo = getattr(classifier, 'model', None)
+    config = getattr(modelo, 'config', None)
+    revision = getattr(config, '_commit_hash', None)
+    if revision:
+        return revision
+    ruta = getattr(config, 'name_or_path', None)
+    if ruta and os.path.isdir(ruta):
+        return f"{ruta}#{_firma_pesos(modelo, ruta)}"
+    return ruta or type(classifier).__name__
+
+def _backend(classifier):
+    # El backend fp32 no se añade a la huella para conservar las entradas guardadas antes de existir los backends
+    backend = getattr(classifier, 'backend', 'pytorch')
+    return "" if backend == 'pytorch' else f"+{backend}"
+
+def huella_modelos(classifier_primary, clasificadores_secundarios):
+    """
+    Identifica el conjunto de modelos de la cascada: nombre, revisión y backend de cada uno.
+    """
+    partes = [f"primario={getattr(getattr(classifier_primary, 'model', None), 'name_or_path', '')}@{revision_efectiva(classifier_primary)}{_backend(classifier_primary)}"]
+    for categoria in sorted(clasificadores_secundarios):
+        classifier = clasificadores_secundarios[categoria]
+        if classifier:
+            nombre = getattr(getattr(classifier, 'model', None), 'name_or_path', '')
+            partes.append(f"{categoria}={nombre}@{revision_efectiva(classifier)}{_backend(classifier)}")
+    huella = hashlib.sha256("|".join(partes).encode()).hexdigest()
+    if huella not in _modelos_por_huella:
+        clasificadores = [classifier_primary, *(c for c in clasificadores_secundarios.values() if c)]
+        _modelos_por_huella[huella] = {
+            getattr(getattr(classifier, 'model', None), 'name_or_path', ''): revision_efectiva(classifier)
+            for classifier in clasificadores
+        }
+    return huella
+
+class CacheClasificacion:
+    """
+    Caché SQLite de resultados de la cascada con expulsión LRU por número de entradas.
+    """
+
+    def __init__(self, ruta, max_entradas):
+        self.ruta = ruta
+        self.max_entradas = max_entradas
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.invalidaciones = 0
+        self._huella = None
+        self._candado = threading.Lock()
+
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.executescript(_ESQUEMA)
+        self._conexion.commit()
+
+    def _validar_huella(self, huella):
+        # Registrar los modelos de una huella nueva e invalidar las huellas con alguno de esos modelos
+        # en otra revisión; las demás entradas se conservan hasta que las expulse el LRU
+        if huella == self._huella:
+            return
+        self._huella = huella
+        modelos = _modelos_por_huella.get(huella)
+        if modelos is None or self._conexion.execute(
+                "SELECT 1 FROM huellas WHERE huella = ?", (huella,)).fetchone() is not None:
+            return
+        for otra, modelos_otra in self._conexion.execute("SELECT huella, modelos FROM huellas").fetchall():
+            modelos_otra = json.loads(modelos_otra)
+            if any(nombre in modelos and modelos[nombre] != revision for nombre, revision in modelos_otra.items()):
+                borradas = self._conexion.execute("DELETE FROM clasificaciones WHERE huella = ?", (otra,)).rowcount
+                self._conexion.execute("DELETE FROM huellas WHERE huella = ?", (otra,))
+                self.invalidaciones += borradas
+                logger.info(f"Caché de clasificaciones: {borradas} entradas invalidadas por una nueva revisión de modelos")
+        self._conexion.execute("INSERT INTO huellas (huella, modelos) VALUES (?, ?)", (huella, json.dumps(modelos)))
+        self._conexion.commit()
+
+    def buscar(self, claves, huella):
+        """
+        Devuelve {clave: (resultado_primario, resultado_secundario)} para las claves almacenadas.
+        El resultado secundario es None si aún no se calculó.
+        """
+        encontrados = {}
+        with self._candado:
+            self._validar_huella(huella)
+            claves_unicas = list(dict.fromkeys(claves))
+            for inicio in range(0, len(claves_unicas), 500):
+                bloque = claves_unicas[inicio:inicio + 500]
+                filas = self._conexion.execute(
+                    f"SELECT clave, categoria_primaria, score_primario, categoria_secundaria, score_secundario "
+                    f"FROM clasificaciones WHERE huella = ? AND clave IN ({','.join('?' * len(bloque))})",
+                    [huella, *bloque]
+                ).fetchall()
+                for clave, primaria, score_primario, secundaria, score_secundario in filas:
+                    resultado_secundario = {'label': secundaria, 'score': score_secundario} if secundaria else None
+                    encontrados[clave] = ({'label': primaria, 'score': score_primario}, resultado_secundario)
+
+            if encontrados:
+                ahora = time.time()
+                self._conexion.executemany("UPDATE clasificaciones SET ultimo_acceso = ? WHERE clave = ? AND huella = ?",
+                                           [(ahora, clave, huella) for clave in encontrados])
+                self._conexion.commit()
+            self.aciertos += sum(1 for clave in claves if clave in encontrados)
+            self.fallos += sum(1 for clave in claves if clave not in encontrados)
+        return encontrados
+
+    def guardar(self, entradas, huella):
+        """
+        Almacena una lista de (clave, resultado_primario, resultado_secundario).
+        """
+        if not entradas:
+            return
+        ahora = time.time()
+        filas = [
+            (clave, huella, primario['label'], float(primario['score']),
+             secundario['label'] if secundario else None, float(secundario['score']) if secundario else None, ahora)
+            for clave, primario, secundario in entradas if primario
+        ]
+        with self._candado:
+            self._validar_huella(huella)
+            self._conexion.executemany(
+                "INSERT OR REPLACE INTO clasificaciones (clave, huella, categoria_primaria, score_primario, "
+                "categoria_secundaria, score_secundario, ultimo_acceso) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                filas
+            )
+            self._expulsar()
+            self._conexion.commit()
+
+    def _expulsar(self):
+        # Expulsar las entradas usadas hace más tiempo hasta respetar el límite
+        total = self._conexion.execute("SELECT COUNT(*) FROM clasificaciones").fetchone()[0]
+        exceso = total - self.max_entradas
+        if exceso > 0:
+            self._conexion.execute(
+                "DELETE FROM clasificaciones WHERE rowid IN "
+                "(SELECT rowid FROM clasificaciones ORDER BY ultimo_acceso ASC LIMIT ?)",
+                (exceso,)
+            )
+            self.expulsiones += exceso
+
+    def vaciar(self):
+        with self._candado:
+            self._conexion.execute("DELETE FROM clasificaciones")
+            self._conexion.execute("DELETE FROM huellas")
+            self._conexion.commit()
+            self._huella = None
+
+    def estadisticas(self):
+        with self._candado:
+            entradas = self._conexion.execute("SELECT COUNT(*) FROM clasificaciones").fetchone()[0]
+        consultas = self.aciertos + self.fallos
+        return {
+            'entradas': entradas,
+            'max_entradas': self.max_entradas,
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'tasa_aciertos': self.aciertos / consultas if consultas else 0.0,
+            'expulsiones': self.expulsiones,
+            'invalidaciones': self.invalidaciones,
+            'ruta': self.ruta
+        }
+
+_caches = {}
+_candado_caches = threading.Lock()
+
+def obtener_cache_clasificacion(ruta=None):
+    """
+    Devuelve la caché de clasificaciones compartida por el proceso, o None si está desactivada.
+    """
+    ruta = ruta or RUTA_CACHE_CLASIFICACION
+    if not ruta:
+        return None
+    with _candado_caches:
+        if ruta not in _caches:
+            try:
+                _caches[ruta] = CacheClasificacion(ruta, MAX_ENTRADAS_CACHE_CLASIFICACION)
+            except Exception as e:
+                logger.error(f"No se pudo abrir la caché de clasificaciones en {ruta}: {e}")
+                return None
+        return _caches[ruta]
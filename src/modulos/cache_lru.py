@@ -0,0 +1,89 @@
+# src/modulos/cache_lru.py
+
+import threading
+from collections import OrderedDict
+
+class CacheLRU:
+    """
+    Caché en memoria con presupuesto en bytes y expulsión LRU, segura entre hilos.
+    Se comparte entre reruns y sesiones porque vive a nivel de módulo.
+    """
+
+    def __init__(self, max_bytes, al_expulsar=None):
+        self.max_bytes = max_bytes
+        self.al_expulsar = al_expulsar  # al_expulsar(clave, valor) se llama al expulsar o eliminar una entrada
+        self.bytes_usados = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self._entradas = OrderedDict()  # clave -> (valor, tamano)
+        self._candado = threading.Lock()
+
+    def obtener(self, clave):
+        """
+        Devuelve el valor almacenado para la clave (marcándolo como usado recientemente) o None.
+        """
+        with self._candado:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[0]
+
+    def guardar(self, clave, valor, tamano):
+        """
+        Almacena un valor que ocupa tamano bytes, expulsando las entradas menos usadas si hace falta.
+        Los valores más grandes que el presupuesto completo no se almacenan.
+        """
+        expulsadas = []
+        with self._candado:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self.bytes_usados -= anterior[1]
+                if anterior[0] is not valor:
+                    expulsadas.append((clave, anterior[0]))
+            if tamano > self.max_bytes:
+                expulsadas.append((clave, valor))
+            else:
+                self._entradas[clave] = (valor, tamano)
+                self.bytes_usados += tamano
+                while self.bytes_usados > self.max_bytes:
+                    clave_expulsada, (valor_expulsado, tamano_expulsado) = self._entradas.popitem(last=False)
+                    self.bytes_usados -= tamano_expulsado
+                    self.expulsiones += 1
+                    expulsadas.append((clave_expulsada, valor_expulsado))
+        self._notificar(expulsadas)
+
+    def _notificar(self, expulsadas):
+        # El callback se ejecuta fuera del candado porque puede ser lento (por ejemplo, borrar archivos)
+        if self.al_expulsar:
+            for clave, valor in expulsadas:
+                self.al_expulsar(clave, valor)
+
+    def eliminar(self, clave):
+        with self._candado:
+            entrada = self._entradas.pop(clave, None)
+            if entrada is not None:
+                self.bytes_usados -= entrada[1]
+        if entrada is not None:
+            self._notificar([(clave, entrada[0])])
+
+    def vaciar(self):
+        with self._candado:
+            expulsadas = [(clave, valor) for clave, (valor, _) in self._entradas.items()]
+            self._entradas.clear()
+            self.bytes_usados = 0
+        self._notificar(expulsadas)
+
+    def estadisticas(self):
+        with self._candado:
+            return {
+                'entradas': len(self._entradas),
+                'bytes_usados': self.bytes_usados,
+                'max_bytes': self.max_bytes,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'expulsiones': self.expulsiones
+            }
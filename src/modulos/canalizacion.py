@@ -0,0 +1,184 @@
+# src/modulos/canalizacion.py
+
+import logging
+import queue
+import threading
+import time
+
+from src.modulos.metricas import memoria_rss, reiniciar_pico_rss, propagar
+
+logger = logging.getLogger(__name__)
+
+# Centinela que indica que un trabajador de decodificación terminó
+_FIN = object()
+
+class ElementoDescartado(ValueError):
+    """
+    Error que lanza decodificar() para un elemento que se descarta sin intentar decodificarlo (por ejemplo, un
+    archivo no soportado): cuenta como fallido, pero no en el rendimiento de la decodificación.
+    """
+
+def _poner(cola, elemento, detener):
+    # Espera a que haya espacio en la cola sin bloquearse si el consumidor se detuvo
+    while not detener.is_set():
+        try:
+            cola.put(elemento, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def ejecutar_canalizacion(elementos, decodificar, inferir, num_trabajadores=4, profundidad_cola=16, tamano_lote=8,
+                          al_procesar_lote=None, al_fallar=None, medir_memoria=False, cancelar=None):
+    """
+    Decodifica e infiere una lista de elementos solapando ambas etapas.
+    Un grupo de num_trabajadores hilos ejecuta decodificar(elemento) y deja las imágenes listas en una cola
+    acotada a profundidad_cola elementos; el hilo que llama vacía la cola en lotes de tamano_lote y ejecuta
+    inferir(indices, imagenes), que debe devolver un resultado por imagen.
+    al_procesar_lote(completados, total) se invoca en el hilo que llama tras cada lote, y
+    al_fallar(indice, mensaje) cada vez que falla la decodificación de un elemento.
+    Si decodificar lanza ElementoDescartado, el elemento falla sin contar en el rendimiento de la decodificación.
+    Con medir_memoria se registra el pico de RSS del proceso durante cada lote (decodificación incluida).
+    cancelar es un threading.Event opcional: si se activa, la canalización se detiene tras el lote en curso
+    y los elementos pendientes quedan sin resultado ni error.
+    Devuelve la lista de resultados en el orden de entrada (None para los elementos fallidos),
+    un diccionario {indice: mensaje} con los errores y las estadísticas de rendimiento de cada etapa.
+    """
+    total = len(elementos)
+    resultados = [None] * total
+    errores = {}
+    num_trabajadores = max(1, min(num_trabajadores, total or 1))
+
+    cola = queue.Queue(maxsize=max(1, profundidad_cola))
+    detener = threading.Event()
+    candado = threading.Lock()
+    pendientes = iter(range(total))
+    # Tiempo acumulado de decodificación (s) y elementos cuya decodificación se intentó
+    tiempo_decodificacion = [0.0]
+    intentos = [0]
+
+    def trabajador():
+        try:
+            while not detener.is_set():
+                with candado:
+                    idx = next(pendientes, None)
+                if idx is None:
+                    break
+                inicio = time.perf_counter()
+                intentado = True
+                try:
+                    imagen, error = decodificar(elementos[idx]), None
+                except ElementoDescartado as e:
+                    imagen, error, intentado = None, str(e), False
+                except Exception as e:
+                    imagen, error = None, str(e)
+                duracion = time.perf_counter() - inicio
+                if intentado:
+                    with candado:
+                        tiempo_decodificacion[0] += duracion
+                        intentos[0] += 1
+                if not _poner(cola, (idx, imagen, error), detener):
+                    break
+        finally:
+            _poner(cola, _FIN, detener)
+
+    picos_rss = []
+    if medir_memoria:
+        reiniciar_pico_rss()
+
+    inicio_total = time.perf_counter()
+    hilos = [threading.Thread(target=propagar(trabajador), name=f"decodificacion-{n}", daemon=True) for n in range(num_trabajadores)]
+    for hilo in hilos:
+        hilo.start()
+
+    tiempo_inferencia = 0.0
+    tiempo_espera = 0.0
+    completados = 0
+    decodificados = 0
+    trabajadores_activos = num_trabajadores
+    lote = []
+
+    def procesar_lote():
+        nonlocal tiempo_inferencia, completados
+        inicio = time.perf_counter()
+        try:
+            salidas = inferir([idx for idx, _ in lote], [imagen for _, imagen in lote])
+        except Exception as e:
+            logger.error(f"Error durante la inferencia del lote: {e}")
+            salidas = [None] * len(lote)
+            for idx, _ in lote:
+                errores[idx] = str(e)
+                if al_fallar:
+                    al_fallar(idx, errores[idx])
+        tiempo_inferencia += time.perf_counter() - inicio
+        for (idx, _), salida in zip(lote, salidas):
+            resultados[idx] = salida
+        completados += len(lote)
+        lote.clear()
+        if medir_memoria:
+            # Pico desde el lote anterior; sin reinicio posible (fuera de Linux) es el pico acumulado
+            _, pico = memoria_rss()
+            if pico is not None:
+                picos_rss.append(pico / (1024 * 1024))
+            reiniciar_pico_rss()
+        if al_procesar_lote:
+            al_procesar_lote(completados, total)
+
+    try:
+        while trabajadores_activos:
+            if cancelar is not None and cancelar.is_set():
+                logger.info(f"Canalización cancelada tras {completados} de {total} elementos")
+                lote.clear()
+                break
+            inicio_espera = time.perf_counter()
+            elemento = cola.get()
+            tiempo_espera += time.perf_counter() - inicio_espera
+
+            if elemento is _FIN:
+                trabajadores_activos -= 1
+                continue
+
+            idx, imagen, error = elemento
+            if imagen is None:
+                errores[idx] = error or "No se pudo decodificar el archivo."
+                completados += 1
+                if al_fallar:
+                    al_fallar(idx, errores[idx])
+                continue
+
+            decodificados += 1
+            lote.append((idx, imagen))
+            if len(lote) >= tamano_lote:
+                procesar_lote()
+
+        if lote:
+            procesar_lote()
+    finally:
+        # Liberar a los trabajadores si el consumidor se interrumpe (por ejemplo, por un rerun)
+        detener.set()
+
+    tiempo_total = time.perf_counter() - inicio_total
+    estadisticas = {
+        'imagenes': total,
+        'completadas': completados,
+        'cancelada': cancelar is not None and cancelar.is_set(),
+        'decodificadas': decodificados,
+        'intentos_decodificacion': intentos[0],
+        'errores': len(errores),
+        'trabajadores': num_trabajadores,
+        'profundidad_cola': cola.maxsize,
+        'tiempo_total': tiempo_total,
+        'tiempo_decodificacion': tiempo_decodificacion[0],
+        'tiempo_inferencia': tiempo_inferencia,
+        'tiempo_espera_inferencia': tiempo_espera,
+        # Rendimiento de cada etapa: imágenes procesadas por segundo de trabajo efectivo (en la decodificación,
+        # por hilo y solo con los elementos cuya decodificación se intentó)
+        'decodificacion_img_s': intentos[0] / tiempo_decodificacion[0] if tiempo_decodificacion[0] > 0 else 0.0,
+        'inferencia_img_s': decodificados / tiempo_inferencia if tiempo_inferencia > 0 else 0.0,
+        'global_img_s': total / tiempo_total if tiempo_total > 0 else 0.0,
+        # Pico de RSS (MB) de cada lote y máximo de la ejecución; vacíos si no se midió la memoria
+        'pico_rss_mb_lotes': picos_rss,
+        'pico_rss_mb': max(picos_rss) if picos_rss else None
+    }
+    logger.info(f"Canalización completada: {estadisticas}")
+    return resultados, errores, estadisticas
@@ -0,0 +1,336 @@
+# src/modulos/cascada.py
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+from src.modulos.cache_clasificacion import clave_imagen, huella_modelos
+from src.modulos.backends import admite_pixel_values, preprocesar, clasificar_pixel_values, etapa_inferencia
+from src.modulos.metricas import intervalo, propagar
+
+logger = logging.getLogger(__name__)
+
+# Latencias recientes (ms) de la clasificación de una imagen, por modo; las respuestas que salieron completas
+# de la caché (sin inferencia) van aparte para no mezclarlas con las de los modos
+_latencias = {'secuencial': deque(maxlen=500), 'especulativo': deque(maxlen=500), 'caché': deque(maxlen=500)}
+_candado_latencias = threading.Lock()
+
+# Mapeos de las etiquetas predichas por los modelos
+MAPEO_PRIMARIO = {
+    '0': 'calcificaciones',
+    '1': 'masas',
+    '2': 'no_encontrado'
+}
+
+MAPEO_SECUNDARIO = {
+    '0': 'benigno',
+    '1': 'maligno',
+    '2': 'sospechoso'
+}
+
+def mapear_resultado(top_result, prediction_mapping):
+    """
+    Traduce la etiqueta del resultado principal de un modelo según el mapeo indicado.
+    """
+    pred_label_normalized = top_result['label'].lower()
+    mapped_label = prediction_mapping.get(pred_label_normalized, pred_label_normalized)
+    return {
+        'label': mapped_label,
+        'score': top_result['score']
+    }
+
+def _clasificar_individual(image, classifier, prediction_mapping):
+    try:
+        # El pipeline incluye el preprocesado de la imagen
+        with intervalo(etapa_inferencia(classifier)):
+            resultado = classifier(image)
+        if len(resultado) == 0:
+            return None
+        return mapear_resultado(resultado[0], prediction_mapping)
+    except Exception as e:
+        logger.error(f"Error durante la clasificación: {e}")
+        return None
+
+def clasificar_lote(imagenes, classifier, prediction_mapping, tamano_lote=8):
+    """
+    Clasifica una lista de imágenes en lotes de tamano_lote y devuelve el resultado principal de cada una.
+    Si un lote falla, se clasifica imagen por imagen para aislar el error.
+    """
+    resultados = []
+    for inicio in range(0, len(imagenes), tamano_lote):
+        lote = imagenes[inicio:inicio + tamano_lote]
+        try:
+            with intervalo(etapa_inferencia(classifier)):
+                salidas = classifier(lote, batch_size=len(lote))
+            for salida in salidas:
+                resultados.append(mapear_resultado(salida[0], prediction_mapping) if salida else None)
+        except Exception as e:
+            logger.error(f"Error durante la clasificación por lotes, se reintenta imagen por imagen: {e}")
+            resultados.extend(_clasificar_individual(image, classifier, prediction_mapping) for image in lote)
+    return resultados
+
+def procesadores_compatibles(classifier_a, classifier_b):
+    """
+    Indica si dos clasificadores preprocesan igual las imágenes (mismo tipo y configuración del procesador
+    de imágenes), de modo que el tensor preparado para uno sirve para el otro.
+    """
+    if not (admite_pixel_values(classifier_a) and admite_pixel_values(classifier_b)):
+        return False
+    procesador_a, procesador_b = classifier_a.image_processor, classifier_b.image_processor
+    return type(procesador_a) is type(procesador_b) and procesador_a.to_dict() == procesador_b.to_dict()
+
+def clasificar_lote_preprocesado(pixel_values, classifier, prediction_mapping, tamano_lote=8):
+    """
+    Igual que clasificar_lote, pero a partir del tensor ya preprocesado (una fila por imagen).
+    """
+    resultados = []
+    for inicio in range(0, len(pixel_values), tamano_lote):
+        lote = pixel_values[inicio:inicio + tamano_lote]
+        try:
+            salidas = clasificar_pixel_values(classifier, lote)
+        except Exception as e:
+            logger.error(f"Error durante la clasificación por lotes, se reintenta imagen por imagen: {e}")
+            salidas = []
+            for fila in lote:
+                try:
+                    salidas.append(clasificar_pixel_values(classifier, fila.unsqueeze(0))[0])
+                except Exception as e:
+                    logger.error(f"Error durante la clasificación: {e}")
+                    salidas.append(None)
+        resultados.extend(mapear_resultado(salida[0], prediction_mapping) if salida else None for salida in salidas)
+    return resultados
+
+def clasificar_cascada(imagenes, classifier_primary, clasificadores_secundarios, tamano_lote=8, enrutar=None, cache=None,
+                       inferidas=None):
+    """
+    Ejecuta la cascada primaria/secundaria por lotes.
+    clasificadores_secundarios asocia cada categoría primaria ('masas', 'calcificaciones') a su
+    clasificador; las imágenes predichas en cada categoría se agrupan y se envían juntas a su modelo.
+    enrutar(indice, etiqueta_primaria) permite restringir qué imágenes pasan al modelo secundario;
+    si es None se enruta solo por la predicción primaria.
+    Si se indica una caché de clasificaciones, solo se infieren los resultados que no estén almacenados;
+    si se indica el conjunto inferidas, se le añaden los índices de las imágenes que pasaron por algún modelo.
+    Cada imagen se preprocesa una sola vez con el procesador del modelo primario y el tensor se reutiliza en los
+    modelos secundarios con un procesador idéntico; los demás preprocesan la imagen por su cuenta.
+    Devuelve una lista de tuplas (resultado_primario, resultado_secundario) en el orden de entrada.
+    """
+    primarios = [None] * len(imagenes)
+    secundarios = [None] * len(imagenes)
+
+    claves = None
+    if cache is not None:
+        huella = huella_modelos(classifier_primary, clasificadores_secundarios)
+        claves = [clave_imagen(imagen) for imagen in imagenes]
+        almacenados = cache.buscar(claves, huella)
+        for idx, clave in enumerate(claves):
+            if clave in almacenados:
+                primarios[idx], secundarios[idx] = almacenados[clave]
+
+    # Tensores preprocesados por índice de imagen, compartidos con los secundarios compatibles
+    compatibles = {
+        categoria: bool(classifier_secondary) and procesadores_compatibles(classifier_primary, classifier_secondary)
+        for categoria, classifier_secondary in clasificadores_secundarios.items()
+    }
+    tensores = {} if any(compatibles.values()) else None
+
+    def pixel_values_de(indices):
+        pendientes = [idx for idx in indices if idx not in tensores]
+        if pendientes:
+            for idx, fila in zip(pendientes, preprocesar([imagenes[idx] for idx in pendientes], classifier_primary)):
+                tensores[idx] = fila
+        return torch.stack([tensores[idx] for idx in indices])
+
+    # Clasificación primaria de las imágenes sin resultado almacenado
+    faltantes = [idx for idx, primario in enumerate(primarios) if primario is None]
+    nuevos = set(faltantes)
+    if tensores is not None and faltantes:
+        resultados_primarios = clasificar_lote_preprocesado(pixel_values_de(faltantes), classifier_primary, MAPEO_PRIMARIO, tamano_lote)
+    else:
+        resultados_primarios = clasificar_lote([imagenes[idx] for idx in faltantes], classifier_primary, MAPEO_PRIMARIO, tamano_lote)
+    for idx, resultado in zip(faltantes, resultados_primarios):
+        primarios[idx] = resultado
+
+    enrutadas = set()
+    for categoria, classifier_secondary in clasificadores_secundarios.items():
+        if not classifier_secondary:
+            continue
+        indices = [
+            idx for idx, primario in enumerate(primarios)
+            if primario and primario['label'] == categoria and (enrutar is None or enrutar(idx, categoria))
+        ]
+        enrutadas.update(indices)
+        indices = [idx for idx in indices if secundarios[idx] is None]
+        if not indices:
+            continue
+        if compatibles[categoria]:
+            resultados_grupo = clasificar_lote_preprocesado(pixel_values_de(indices), classifier_secondary, MAPEO_SECUNDARIO, tamano_lote)
+        else:
+            resultados_grupo = clasificar_lote([imagenes[idx] for idx in indices], classifier_secondary, MAPEO_SECUNDARIO, tamano_lote)
+        for idx, resultado in zip(indices, resultados_grupo):
+            secundarios[idx] = resultado
+            nuevos.add(idx)
+
+    if claves is not None:
+        cache.guardar([(claves[idx], primarios[idx], secundarios[idx]) for idx in sorted(nuevos)], huella)
+    if inferidas is not None:
+        inferidas.update(nuevos)
+
+    # Un resultado secundario almacenado solo se devuelve si la imagen se enrutó al modelo secundario
+    return [
+        (primario, secundario if idx in enrutadas else None)
+        for idx, (primario, secundario) in enumerate(zip(primarios, secundarios))
+    ]
+
+def _clasificar_imagen(image, pixel_values, classifier, prediction_mapping):
+    if pixel_values is not None:
+        return clasificar_lote_preprocesado(pixel_values, classifier, prediction_mapping, tamano_lote=1)[0]
+    return _clasificar_individual(image, classifier, prediction_mapping)
+
+def clasificar_especulativo(image, classifier_primary, clasificadores_secundarios, cache=None, inferidas=None):
+    """
+    Clasifica una imagen ejecutando a la vez el modelo primario y todos los secundarios, y conserva solo el
+    resultado secundario de la categoría que predice el primario. La latencia pasa a ser la del modelo más lento
+    en lugar de la suma de dos, a cambio de inferencias secundarias que se descartan.
+    Devuelve (resultado_primario, resultado_secundario), igual que clasificar_cascada para una imagen
+    (e igual que ella añade el índice 0 a inferidas si la imagen pasó por los modelos).
+    """
+    clave = huella = None
+    if cache is not None:
+        huella = huella_modelos(classifier_primary, clasificadores_secundarios)
+        clave = clave_imagen(image)
+        almacenado = cache.buscar([clave], huella).get(clave)
+        if almacenado is not None:
+            primario, secundario = almacenado
+            # Igual que en clasificar_cascada: el secundario solo cuenta si la categoría tiene modelo secundario
+            if not clasificadores_secundarios.get(primario['label']):
+                return primario, None
+            if secundario is not None:
+                return primario, secundario
+
+    # Un solo preprocesado para todos los modelos con el procesador del primario
+    if inferidas is not None:
+        inferidas.add(0)
+    pixel_values = preprocesar([image], classifier_primary) if admite_pixel_values(classifier_primary) else None
+    secundarios = {categoria: classifier_secondary for categoria, classifier_secondary in clasificadores_secundarios.items()
+                   if classifier_secondary}
+
+    # Cada llamada tiene sus propios hilos para los secundarios y el primario se ejecuta en el hilo que clasifica:
+    # las inferencias descartadas, que no se pueden interrumpir una vez empezadas, no retrasan las de otras sesiones
+    ejecutor = ThreadPoolExecutor(max_workers=len(secundarios), thread_name_prefix="especulativo") if secundarios else None
+    try:
+        # Los hilos del ejecutor registran sus tiempos en las medidas de quien clasifica
+        clasificar = propagar(_clasificar_imagen)
+        futuros_secundarios = {
+            categoria: ejecutor.submit(
+                clasificar, image,
+                pixel_values if procesadores_compatibles(classifier_primary, classifier_secondary) else None,
+                classifier_secondary, MAPEO_SECUNDARIO)
+            for categoria, classifier_secondary in secundarios.items()
+        }
+        primario = _clasificar_imagen(image, pixel_values, classifier_primary, MAPEO_PRIMARIO)
+        secundario = None
+        if primario and primario['label'] in futuros_secundarios:
+            secundario = futuros_secundarios[primario['label']].result()
+    finally:
+        # Las inferencias descartadas terminan en sus hilos sin que se espere por ellas
+        if ejecutor is not None:
+            ejecutor.shutdown(wait=False)
+
+    if cache is not None and primario is not None:
+        cache.guardar([(clave, primario, secundario)], huella)
+    return primario, secundario
+
+def clasificar_imagen_cascada(image, classifier_primary, clasificadores_secundarios, especulativo=False, cache=None):
+    """
+    Clasifica una imagen en modo secuencial (clasificar_cascada) o especulativo (clasificar_especulativo)
+    y registra la latencia en las estadísticas del modo, o en las de la caché si no hizo falta inferir.
+    """
+    inicio = time.perf_counter()
+    inferidas = set()
+    if especulativo:
+        resultado = clasificar_especulativo(image, classifier_primary, clasificadores_secundarios, cache=cache,
+                                            inferidas=inferidas)
+    else:
+        resultado = clasificar_cascada([image], classifier_primary, clasificadores_secundarios, tamano_lote=1, cache=cache,
+                                       inferidas=inferidas)[0]
+    modo = ('especulativo' if especulativo else 'secuencial') if inferidas else 'caché'
+    with _candado_latencias:
+        _latencias[modo].append((time.perf_counter() - inicio) * 1000)
+    return resultado
+
+def _percentiles(latencias):
+    if not latencias:
+        return {'n': 0, 'p50_ms': None, 'p95_ms': None}
+    p50, p95 = np.percentile(latencias, [50, 95])
+    return {'n': len(latencias), 'p50_ms': float(p50), 'p95_ms': float(p95)}
+
+def estadisticas_latencia():
+    """
+    Devuelve p50 y p95 de las latencias recientes de clasificación de una imagen en cada modo.
+    """
+    with _candado_latencias:
+        return {modo: _percentiles(list(latencias)) for modo, latencias in _latencias.items()}
+
+def medir_latencia_modos(image, classifier_primary, clasificadores_secundarios, repeticiones=20):
+    """
+    Mide la latencia de los dos modos sobre la misma imagen, sin caché y alternando los modos,
+    y devuelve p50 y p95 de cada uno.
+    """
+    medidas = {'secuencial': [], 'especulativo': []}
+    # Calentamiento de los modelos y de los hilos
+    clasificar_especulativo(image, classifier_primary, clasificadores_secundarios)
+    for _ in range(repeticiones):
+        for modo in medidas:
+            inicio = time.perf_counter()
+            if modo == 'especulativo':
+                clasificar_especulativo(image, classifier_primary, clasificadores_secundarios)
+            else:
+                clasificar_cascada([image], classifier_primary, clasificadores_secundarios, tamano_lote=1)
+            medidas[modo].append((time.perf_counter() - inicio) * 1000)
+    return {modo: _percentiles(latencias) for modo, latencias in medidas.items()}
+
+def determinar_ground_truth(nombre_archivo):
+    """
+    Determina la etiqueta verdadera primaria basada en el prefijo del nombre del archivo.
+    """
+    nombre_archivo = nombre_archivo.lower()
+    if nombre_archivo.startswith('mass_'):
+        return 'masas'
+    elif nombre_archivo.startswith('calc_'):
+        return 'calcificaciones'
+    elif nombre_archivo.startswith('no_'):
+        return 'no_encontrado'
+    else:
+        return 'no_encontrado'
+
+def determinar_ground_truth_secondary(nombre_archivo, categoria_primaria):
+    """
+    Determina la etiqueta verdadera secundaria basada en el nombre del archivo y la categoría primaria.
+    """
+    nombre_archivo = nombre_archivo.lower()
+    partes = nombre_archivo.split('_')
+
+    if categoria_primaria == 'masas' and len(partes) >= 2:
+        return partes[1]
+    elif categoria_primaria == 'calcificaciones' and len(partes) >= 2:
+        return partes[1]
+    else:
+        return None  # No aplica o no está definido
+
+def enrutar_por_nombre(nombres):
+    """
+    Devuelve una función de enrutamiento para clasificar_cascada que solo envía al modelo secundario
+    las predicciones primarias correctas según el nombre del archivo y con etiqueta secundaria conocida.
+    nombres contiene el nombre de archivo de cada imagen, en el mismo orden que las imágenes.
+    """
+    def enrutar(posicion, etiqueta_primaria):
+        nombre = os.path.basename(nombres[posicion])
+        return (etiqueta_primaria == determinar_ground_truth(nombre)
+                and bool(determinar_ground_truth_secondary(nombre, etiqueta_primaria)))
+    return enrutar
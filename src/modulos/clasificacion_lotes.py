@@ -0,0 +1,390 @@
+# src/modulos/clasificacion_lotes.py
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import zipfile
+from io import BytesIO
+
+import numpy as np
+
+from src.modulos.configuracion import MODELO_PRIMARIO, MODELO_SECUNDARIO_MASAS, MODELO_SECUNDARIO_CALCIFICACIONES
+from src.modulos.configuracion import TAMANO_LOTE, NUM_TRABAJADORES_DECODIFICACION, PROFUNDIDAD_COLA
+from src.modulos.registro_modelos import obtener_modelo
+from src.modulos.cascada import clasificar_cascada, clasificar_lote, enrutar_por_nombre, determinar_ground_truth, MAPEO_PRIMARIO
+from src.modulos.lectura import tipo_de_archivo, decodificar_archivo
+from src.modulos.canalizacion import ejecutar_canalizacion, ElementoDescartado
+from src.modulos.cache_clasificacion import obtener_cache_clasificacion
+from src.modulos.indice_cabeceras import indexar_cabeceras, resumir_indice
+from src.modulos.backends import BACKENDS, comparar_backends
+from src.modulos import metricas
+from src.modulos.reportes import EscritorParquet
+from src.modulos.triaje import TriajeIncremental
+
+logger = logging.getLogger(__name__)
+
+# Clasificación masiva sin interfaz: recorre un directorio o un ZIP y escribe un resultado por línea.
+# Uso: python clasificar.py <directorio|archivo.zip> --salida resultados.jsonl (o .csv, .parquet)
+
+CAMPOS_SALIDA = [
+    'archivo',
+    'categoria_primaria',
+    'score_primario',
+    'categoria_secundaria',
+    'score_secundario',
+    'primary_correct',
+    'error'
+]
+
+# Tipos de las columnas en la salida Parquet
+TIPOS_PARQUET = {
+    'archivo': 'string',
+    'categoria_primaria': 'string',
+    'score_primario': 'float64',
+    'categoria_secundaria': 'string',
+    'score_secundario': 'float64',
+    'primary_correct': 'bool',
+    'error': 'string'
+}
+
+def listar_directorio(directorio):
+    """
+    Recorre un directorio de forma recursiva y devuelve (nombre relativo, abrir) para cada imagen soportada.
+    """
+    elementos = []
+    for raiz, carpetas, archivos in os.walk(directorio):
+        carpetas.sort()
+        for archivo in sorted(archivos):
+            if tipo_de_archivo(archivo) is None:
+                continue
+            ruta = os.path.join(raiz, archivo)
+            elementos.append((os.path.relpath(ruta, directorio), lambda ruta=ruta: open(ruta, 'rb')))
+    return elementos
+
+def listar_zip(ruta_zip):
+    """
+    Devuelve (nombre, abrir) para cada imagen soportada dentro de un archivo ZIP.
+    Los miembros se leen bajo un candado porque el ZipFile se comparte entre los hilos de decodificación.
+    """
+    zip_file = zipfile.ZipFile(ruta_zip)
+    candado = threading.Lock()
+
+    def abrir(nombre):
+        with candado:
+            return BytesIO(zip_file.read(nombre))
+
+    return [
+        (info.filename, lambda nombre=info.filename: abrir(nombre))
+        for info in sorted(zip_file.infolist(), key=lambda info: info.filename)
+        if not info.is_dir() and tipo_de_archivo(info.filename) is not None
+    ]
+
+class _EscritorResultados:
+    """
+    Escribe los resultados en JSONL o CSV a medida que se producen, o en Parquet por grupos de filas.
+    """
+
+    def __init__(self, salida, formato):
+        self.salida = salida
+        self.formato = formato
+        if formato == 'csv':
+            self.csv = csv.DictWriter(salida, fieldnames=CAMPOS_SALIDA)
+            self.csv.writeheader()
+        elif formato == 'parquet':
+            self.parquet = EscritorParquet(salida, TIPOS_PARQUET)
+
+    def escribir(self, registro):
+        if self.formato == 'parquet':
+            self.parquet.escribir(registro)
+            return
+        if self.formato == 'csv':
+            self.csv.writerow(registro)
+        else:
+            self.salida.write(json.dumps(registro, ensure_ascii=False) + '\n')
+        self.salida.flush()
+
+    def cerrar(self):
+        if self.formato == 'parquet':
+            self.parquet.cerrar()
+
+def _registro(nombre, mapped_result_primary, mapped_result_secondary, evaluar_con_nombres, error=None):
+    registro = dict.fromkeys(CAMPOS_SALIDA)
+    registro['archivo'] = nombre
+    registro['error'] = error
+    if mapped_result_primary:
+        registro['categoria_primaria'] = mapped_result_primary['label']
+        registro['score_primario'] = round(float(mapped_result_primary['score']), 6)
+        if evaluar_con_nombres:
+            registro['primary_correct'] = mapped_result_primary['label'] == determinar_ground_truth(os.path.basename(nombre))
+    elif error is None:
+        registro['error'] = "No se pudo obtener la clasificación primaria."
+    if mapped_result_secondary:
+        registro['categoria_secundaria'] = mapped_result_secondary['label']
+        registro['score_secundario'] = round(float(mapped_result_secondary['score']), 6)
+    return registro
+
+def comparar_decodificacion(elementos, classifier_primary, tamano_lote=TAMANO_LOTE, evaluar_con_nombres=False):
+    """
+    Compara la decodificación reducida (solo clasificación) con la completa sobre un conjunto de referencia:
+    tiempo de decodificación, diferencia media de píxeles de la entrada del modelo y concordancia
+    de la clasificación primaria (y exactitud de cada camino si se evalúa con los nombres).
+    """
+    tiempos = {'completa': 0.0, 'reducida': 0.0}
+    imagenes = {'completa': [], 'reducida': []}
+    nombres = []
+    for nombre, abrir in elementos:
+        decodificadas = {}
+        duraciones = {}
+        try:
+            for modo, solo_clasificacion in (('completa', False), ('reducida', True)):
+                inicio = time.perf_counter()
+                with abrir() as fuente:
+                    decodificadas[modo] = decodificar_archivo(nombre, fuente, solo_clasificacion=solo_clasificacion)[1]
+                duraciones[modo] = time.perf_counter() - inicio
+        except Exception as e:
+            logger.warning(f"Se omite {nombre} en la comparación: {e}")
+            continue
+        # Los tiempos solo cuentan para las imágenes decodificadas en ambos modos, para comparar lo mismo
+        nombres.append(nombre)
+        for modo, imagen in decodificadas.items():
+            imagenes[modo].append(imagen)
+            tiempos[modo] += duraciones[modo]
+
+    if not nombres:
+        return None
+
+    diferencias = [
+        float(np.abs(np.asarray(completa, dtype=np.int16) - np.asarray(reducida, dtype=np.int16)).mean())
+        for completa, reducida in zip(imagenes['completa'], imagenes['reducida'])
+    ]
+    resultados = {modo: clasificar_lote(imagenes[modo], classifier_primary, MAPEO_PRIMARIO, tamano_lote) for modo in imagenes}
+    pares = [(c, r) for c, r in zip(resultados['completa'], resultados['reducida']) if c and r]
+    comparacion = {
+        'imagenes': len(nombres),
+        'tiempo_completa': tiempos['completa'],
+        'tiempo_reducida': tiempos['reducida'],
+        'aceleracion': tiempos['completa'] / tiempos['reducida'] if tiempos['reducida'] else float('inf'),
+        'diferencia_media_pixeles': float(np.mean(diferencias)),
+        'concordancia_primaria': sum(c['label'] == r['label'] for c, r in pares) / len(pares) if pares else 0.0,
+        'diferencia_media_score': float(np.mean([abs(c['score'] - r['score']) for c, r in pares])) if pares else 0.0
+    }
+    if evaluar_con_nombres:
+        verdad = [determinar_ground_truth(os.path.basename(nombre)) for nombre in nombres]
+        for modo in imagenes:
+            aciertos = sum(bool(r) and r['label'] == v for r, v in zip(resultados[modo], verdad))
+            comparacion[f'exactitud_{modo}'] = aciertos / len(nombres)
+        comparacion['delta_exactitud'] = comparacion['exactitud_reducida'] - comparacion['exactitud_completa']
+    return comparacion
+
+def construir_parser():
+    parser = argparse.ArgumentParser(
+        description="Clasifica mamografías (DICOM, PNG, JPG) de un directorio o un ZIP sin interfaz gráfica."
+    )
+    parser.add_argument('entrada', help="Directorio (se recorre de forma recursiva) o archivo .zip")
+    parser.add_argument('-o', '--salida', default='-', help="Archivo de salida ('-' para la salida estándar)")
+    parser.add_argument('-f', '--formato', choices=['jsonl', 'csv', 'parquet'],
+                        help="Formato de salida (por defecto se deduce de la extensión, o jsonl)")
+    parser.add_argument('--tamano-lote', type=int, default=TAMANO_LOTE)
+    parser.add_argument('--trabajadores', type=int, default=NUM_TRABAJADORES_DECODIFICACION,
+                        help="Hilos de decodificación")
+    parser.add_argument('--profundidad-cola', type=int, default=PROFUNDIDAD_COLA)
+    parser.add_argument('--evaluar-con-nombres', action='store_true',
+                        help="Enrutar y evaluar con las etiquetas del prefijo del nombre de archivo (mass_, calc_, no_)")
+    parser.add_argument('--sin-cache', action='store_true', help="No consultar ni actualizar la caché de clasificaciones")
+    parser.add_argument('--decodificacion-completa', action='store_true',
+                        help="Decodificar a resolución completa en lugar de la decodificación reducida para clasificación")
+    parser.add_argument('--comparar-decodificacion', action='store_true',
+                        help="No clasificar: comparar la decodificación reducida con la completa sobre la entrada")
+    parser.add_argument('--comparar-backends', nargs='?', const=','.join(BACKENDS), metavar='BACKENDS',
+                        help="No clasificar: comparar los backends de inferencia de los tres modelos frente a pytorch fp32 "
+                             f"(por defecto {','.join(BACKENDS)})")
+    parser.add_argument('--metricas', metavar='ARCHIVO',
+                        help="Guarda los tiempos por etapa en ARCHIVO (formato Prometheus si termina en .prom, JSON si no)")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser
+
+def main(argv=None):
+    """
+    Punto de entrada de la línea de comandos.
+    Devuelve 0 si todas las imágenes se clasificaron, 1 si alguna falló y 2 si no se pudo iniciar.
+    """
+    args = construir_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    if os.path.isdir(args.entrada):
+        elementos = listar_directorio(args.entrada)
+    elif zipfile.is_zipfile(args.entrada):
+        elementos = listar_zip(args.entrada)
+    else:
+        print(f"La entrada {args.entrada} no es un directorio ni un archivo ZIP.", file=sys.stderr)
+        return 2
+
+    if not elementos:
+        print(f"No se encontraron imágenes DICOM, PNG o JPG en {args.entrada}.", file=sys.stderr)
+        return 2
+
+    # Pre-paso sobre las cabeceras: los archivos no soportados se marcan antes de decodificar.
+    # En un ZIP cada cabecera se lee de un flujo del miembro, con un ZipFile propio del pre-paso,
+    # para que la lectura se detenga tras la cabecera en lugar de descomprimir el archivo completo
+    if os.path.isdir(args.entrada):
+        indice, tiempo_indice = indexar_cabeceras(elementos)
+    else:
+        with zipfile.ZipFile(args.entrada) as zip_cabeceras:
+            indice, tiempo_indice = indexar_cabeceras(elementos, abrir_flujo=zip_cabeceras.open)
+    resumen = resumir_indice(indice)
+    no_soportados = dict(resumen['no_soportados'])
+    logger.info(
+        f"{resumen['archivos']} cabeceras en {tiempo_indice:.2f} s: {resumen['pacientes']} pacientes, "
+        f"{resumen['estudios']} estudios, {resumen['series']} series, {len(no_soportados)} no soportados; "
+        f"sintaxis {resumen['por_sintaxis']}"
+    )
+
+    if args.comparar_decodificacion:
+        elementos = [elemento for elemento in elementos if elemento[0] not in no_soportados]
+        try:
+            classifier_primary = obtener_modelo(MODELO_PRIMARIO)
+        except Exception as e:
+            print(f"Ocurrió un error al cargar el modelo primario: {e}", file=sys.stderr)
+            return 2
+        comparacion = comparar_decodificacion(elementos, classifier_primary, args.tamano_lote, args.evaluar_con_nombres)
+        if comparacion is None:
+            print("No se pudo decodificar ninguna imagen de la entrada.", file=sys.stderr)
+            return 1
+        print(json.dumps(comparacion, indent=2, ensure_ascii=False))
+        return 0
+
+    if args.comparar_backends:
+        imagenes = []
+        for nombre, abrir in elementos:
+            if nombre in no_soportados:
+                continue
+            try:
+                with abrir() as fuente:
+                    imagenes.append(decodificar_archivo(nombre, fuente, solo_clasificacion=True)[1])
+            except Exception as e:
+                logger.warning(f"Se omite {nombre} en la comparación: {e}")
+        if not imagenes:
+            print("No se pudo decodificar ninguna imagen de la entrada.", file=sys.stderr)
+            return 1
+        backends = [backend.strip() for backend in args.comparar_backends.split(',') if backend.strip()]
+        comparacion = []
+        for modelo in (MODELO_PRIMARIO, MODELO_SECUNDARIO_MASAS, MODELO_SECUNDARIO_CALCIFICACIONES):
+            comparacion.extend(comparar_backends(modelo, imagenes, backends, args.tamano_lote))
+        print(json.dumps(comparacion, indent=2, ensure_ascii=False))
+        return 0
+
+    try:
+        classifier_primary = obtener_modelo(MODELO_PRIMARIO)
+        clasificadores_secundarios = {
+            'masas': obtener_modelo(MODELO_SECUNDARIO_MASAS),
+            'calcificaciones': obtener_modelo(MODELO_SECUNDARIO_CALCIFICACIONES)
+        }
+    except Exception as e:
+        print(f"Ocurrió un error al cargar los modelos: {e}", file=sys.stderr)
+        return 2
+
+    cache = None if args.sin_cache else obtener_cache_clasificacion()
+
+    extension = os.path.splitext(args.salida.lower())[1]
+    formato = args.formato or {'.csv': 'csv', '.parquet': 'parquet'}.get(extension, 'jsonl')
+    if formato == 'parquet' and args.salida == '-':
+        print("La salida Parquet debe ser un archivo.", file=sys.stderr)
+        return 2
+    if args.salida == '-':
+        salida = sys.stdout
+    elif formato == 'parquet':
+        salida = open(args.salida, 'wb')
+    else:
+        salida = open(args.salida, 'w', encoding='utf-8', newline='')
+    try:
+        escritor = _EscritorResultados(salida, formato)
+    except ImportError as e:
+        salida.close()
+        print(str(e), file=sys.stderr)
+        return 2
+    fallidos = [0]
+    inicio = time.perf_counter()
+    # Solo se usan los contadores y el tiempo hasta el primer hallazgo: los resultados ya se escriben en la salida
+    triaje = TriajeIncremental(len(elementos), max_destacados=0, inicio=inicio, campo_nombre='archivo')
+
+    def decodificar(elemento):
+        nombre, abrir = elemento
+        if nombre in no_soportados:
+            raise ElementoDescartado(no_soportados[nombre])
+        with abrir() as fuente:
+            return decodificar_archivo(nombre, fuente, solo_clasificacion=not args.decodificacion_completa)[1]
+
+    def inferir(indices, imagenes):
+        nombres = [elementos[idx][0] for idx in indices]
+        resultados = clasificar_cascada(
+            imagenes,
+            classifier_primary,
+            clasificadores_secundarios,
+            tamano_lote=args.tamano_lote,
+            enrutar=enrutar_por_nombre(nombres) if args.evaluar_con_nombres else None,
+            cache=cache
+        )
+        registros = []
+        for nombre, (mapped_result_primary, mapped_result_secondary) in zip(nombres, resultados):
+            registro = _registro(nombre, mapped_result_primary, mapped_result_secondary, args.evaluar_con_nombres)
+            fallidos[0] += registro['error'] is not None
+            escritor.escribir(registro)
+            registros.append(registro)
+        triaje.agregar(registros)
+        return resultados
+
+    def al_fallar(idx, mensaje):
+        fallidos[0] += 1
+        registro = _registro(elementos[idx][0], None, None, args.evaluar_con_nombres, error=mensaje)
+        escritor.escribir(registro)
+        triaje.agregar([registro])
+
+    def al_procesar_lote(completados, total):
+        transcurrido = time.perf_counter() - inicio
+        logger.info(f"{completados}/{total} imágenes ({completados / transcurrido:.2f} img/s)")
+
+    try:
+        _, _, estadisticas = ejecutar_canalizacion(
+            elementos,
+            decodificar,
+            inferir,
+            num_trabajadores=args.trabajadores,
+            profundidad_cola=args.profundidad_cola,
+            tamano_lote=args.tamano_lote,
+            al_procesar_lote=al_procesar_lote,
+            al_fallar=al_fallar,
+            medir_memoria=True
+        )
+    finally:
+        escritor.cerrar()
+        if salida is not sys.stdout:
+            salida.close()
+
+    if args.metricas:
+        metricas.guardar(args.metricas)
+
+    resumen_triaje = triaje.resumen()
+    if resumen_triaje['tiempo_primer_hallazgo_s'] is not None:
+        print(
+            f"{resumen_triaje['malignas']} malignas y {resumen_triaje['sospechosas']} sospechosas; primer hallazgo "
+            f"a los {resumen_triaje['tiempo_primer_hallazgo_s']:.2f} s ({triaje.primer_hallazgo['archivo']}).",
+            file=sys.stderr
+        )
+
+    if cache is not None:
+        estadisticas_cache = cache.estadisticas()
+        print(f"Caché: {estadisticas_cache['aciertos']} aciertos, {estadisticas_cache['fallos']} fallos.", file=sys.stderr)
+    print(
+        f"{estadisticas['imagenes']} imágenes en {estadisticas['tiempo_total']:.2f} s "
+        f"({estadisticas['global_img_s']:.2f} img/s; decodificación {estadisticas['decodificacion_img_s']:.2f} img/s por hilo, "
+        f"inferencia {estadisticas['inferencia_img_s']:.2f} img/s), {fallidos[0]} con errores." +
+        (f" Pico de RSS: {estadisticas['pico_rss_mb']:.0f} MB." if estadisticas['pico_rss_mb'] is not None else ""),
+        file=sys.stderr
+    )
+    return 1 if fallidos[0] else 0
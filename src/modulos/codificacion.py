@@ -0,0 +1,66 @@
+# src/modulos/codificacion.py
+
+import logging
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from src.modulos.configuracion import FORMATO_VISTA_PREVIA, CALIDAD_VISTA_PREVIA
+
+logger = logging.getLogger(__name__)
+
+# Codificación de imágenes para el visor.
+# La vista en pantalla usa una versión reducida con compresión con pérdida (rápida);
+# la exportación PNG sin pérdida a resolución completa solo se hace cuando se descarga.
+
+FORMATOS_VISTA_PREVIA = {
+    'JPEG': ('jpg', 'image/jpeg'),
+    'WEBP': ('webp', 'image/webp'),
+    'PNG': ('png', 'image/png')
+}
+
+def _opciones_guardado(formato, calidad):
+    if formato == 'JPEG':
+        return {'quality': calidad}
+    if formato == 'WEBP':
+        # method=0 es el modo de compresión más rápido de WebP
+        return {'quality': calidad, 'method': 0}
+    return {}
+
+def guardar_vista_previa(imagen, destino, formato=FORMATO_VISTA_PREVIA, calidad=CALIDAD_VISTA_PREVIA):
+    """
+    Guarda una imagen PIL (ruta o archivo) en el formato de vista previa indicado.
+    """
+    formato = formato if formato in FORMATOS_VISTA_PREVIA else 'JPEG'
+    if imagen.mode not in ('L', 'RGB'):
+        imagen = imagen.convert('RGB')
+    imagen.save(destino, format=formato, **_opciones_guardado(formato, calidad))
+
+def codificar_vista_previa(imagen, lado_maximo, formato=FORMATO_VISTA_PREVIA, calidad=CALIDAD_VISTA_PREVIA):
+    """
+    Reduce la imagen para que su lado mayor no supere lado_maximo y la codifica para mostrarla en pantalla.
+    Devuelve los bytes, el tipo MIME y el tiempo empleado en milisegundos.
+    """
+    inicio = time.perf_counter()
+    if max(imagen.size) > lado_maximo:
+        imagen = imagen.copy()
+        imagen.thumbnail((lado_maximo, lado_maximo), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    buffer = BytesIO()
+    guardar_vista_previa(imagen, buffer, formato, calidad)
+    tiempo_ms = (time.perf_counter() - inicio) * 1000
+    mime = FORMATOS_VISTA_PREVIA.get(formato, FORMATOS_VISTA_PREVIA['JPEG'])[1]
+    logger.debug(f"Vista previa {formato} ({imagen.width}x{imagen.height}) codificada en {tiempo_ms:.1f} ms")
+    return buffer.getvalue(), mime, tiempo_ms
+
+def codificar_png(imagen):
+    """
+    Codifica la imagen a resolución completa en PNG sin pérdida.
+    Devuelve los bytes y el tiempo empleado en milisegundos.
+    """
+    inicio = time.perf_counter()
+    buffer = BytesIO()
+    imagen.save(buffer, format="PNG")
+    tiempo_ms = (time.perf_counter() - inicio) * 1000
+    logger.info(f"PNG de resolución completa ({imagen.width}x{imagen.height}) codificado en {tiempo_ms:.1f} ms")
+    return buffer.getvalue(), tiempo_ms
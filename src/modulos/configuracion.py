@@ -0,0 +1,103 @@
+# src/modulos/configuracion.py
+
+import os
+
+# Nombres de los modelos en Hugging Face
+MODELO_PRIMARIO = "nc7777/clasificador_primario"
+MODELO_SECUNDARIO_MASAS = "nc7777/clasificador_masas"
+MODELO_SECUNDARIO_CALCIFICACIONES = "nc7777/clasificador_calcificaciones"
+
+# Revisión (rama, etiqueta o commit) de los modelos; None usa la rama principal
+REVISION_MODELOS = os.environ.get("MAMO_REVISION_MODELOS") or None
+
+# Dispositivo de inferencia forzado ("cpu", "cuda", "mps"); None lo detecta automáticamente
+DISPOSITIVO = os.environ.get("MAMO_DISPOSITIVO") or None
+
+# Número de imágenes por lote en la inferencia masiva
+TAMANO_LOTE = int(os.environ.get("MAMO_TAMANO_LOTE", "8"))
+
+# Modo ligero del procesamiento masivo: solo se construye la imagen para clasificación, sin la imagen para mostrar
+# a resolución completa, y los buffers decodificados se liberan en cuanto está lista (mismos resultados)
+MODO_LIGERO_MASIVO = os.environ.get("MAMO_MODO_LIGERO", "1").lower() not in ("0", "no", "false")
+
+# Decodificación reducida en el procesamiento masivo: las imágenes se decodifican directamente a la resolución de
+# clasificación (más rápido y con menos memoria, pero la entrada del modelo difiere ligeramente del camino completo)
+DECODIFICACION_REDUCIDA_MASIVA = os.environ.get("MAMO_DECODIFICACION_REDUCIDA", "0").lower() in ("1", "si", "sí", "true", "yes")
+
+# Hallazgos (malignos y sospechosos) que se mantienen destacados mientras avanza la clasificación masiva
+MAX_HALLAZGOS_DESTACADOS = int(os.environ.get("MAMO_HALLAZGOS_DESTACADOS", "20"))
+
+# Filas de la tabla por imagen del reporte PDF (las primeras por prioridad); fpdf guarda el documento entero en
+# memoria, así que el PDF se acota y el listado completo queda en el CSV y el Parquet
+MAX_FILAS_REPORTE_PDF = int(os.environ.get("MAMO_REPORTE_PDF_FILAS", "2000"))
+
+# Trabajos de clasificación masiva en segundo plano: cuántos se ejecutan a la vez en el servidor (el resto espera
+# en cola), cuántos terminados se conservan con sus resultados y cada cuántos segundos la interfaz consulta su estado
+NUM_TRABAJOS_SIMULTANEOS = int(os.environ.get("MAMO_TRABAJOS_SIMULTANEOS", "1"))
+MAX_TRABAJOS_TERMINADOS = int(os.environ.get("MAMO_TRABAJOS_TERMINADOS", "10"))
+INTERVALO_SONDEO_TRABAJOS = float(os.environ.get("MAMO_TRABAJOS_SONDEO", "1.0"))
+
+# Hilos de decodificación y profundidad de la cola de imágenes listas para clasificar
+NUM_TRABAJADORES_DECODIFICACION = int(os.environ.get("MAMO_TRABAJADORES_DECODIFICACION", str(min(4, os.cpu_count() or 1))))
+PROFUNDIDAD_COLA = int(os.environ.get("MAMO_PROFUNDIDAD_COLA", "16"))
+
+# Caché persistente de clasificaciones (SQLite); "0" la desactiva
+RUTA_CACHE_CLASIFICACION = os.environ.get(
+    "MAMO_CACHE_CLASIFICACION",
+    os.path.join(os.path.expanduser("~"), ".cache", "mamoviewer", "clasificaciones.sqlite3")
+)
+if RUTA_CACHE_CLASIFICACION.lower() in ("", "0", "no", "false"):
+    RUTA_CACHE_CLASIFICACION = None
+MAX_ENTRADAS_CACHE_CLASIFICACION = int(os.environ.get("MAMO_CACHE_CLASIFICACION_MAX", "200000"))
+
+# Puntos de control de la clasificación masiva (SQLite); "0" los desactiva. Cada cuántos segundos se guardan los
+# resultados ya obtenidos y cuántos días se conservan los de ejecuciones que no llegaron a terminar
+RUTA_PUNTOS_CONTROL = os.environ.get(
+    "MAMO_PUNTOS_CONTROL",
+    os.path.join(os.path.expanduser("~"), ".cache", "mamoviewer", "puntos_control.sqlite3")
+)
+if RUTA_PUNTOS_CONTROL.lower() in ("", "0", "no", "false"):
+    RUTA_PUNTOS_CONTROL = None
+INTERVALO_PUNTOS_CONTROL = float(os.environ.get("MAMO_PUNTOS_CONTROL_INTERVALO", "10"))
+DIAS_PUNTOS_CONTROL = float(os.environ.get("MAMO_PUNTOS_CONTROL_DIAS", "7"))
+
+# Presupuesto de memoria de la caché de imágenes decodificadas del visor DICOM
+MAX_BYTES_CACHE_VISOR = int(os.environ.get("MAMO_CACHE_VISOR_MB", "1024")) * 1024 * 1024
+
+# Pirámide de teselas del visor (PNG sin pérdida con los índices de la LUT): lado de tesela,
+# lado máximo de la vista general y presupuesto de disco para las teselas generadas
+TAMANO_TESELA = int(os.environ.get("MAMO_TAMANO_TESELA", "256"))
+LADO_VISTA_GENERAL = int(os.environ.get("MAMO_LADO_VISTA_GENERAL", "1024"))
+MAX_BYTES_TESELAS = int(os.environ.get("MAMO_TESELAS_MB", "2048")) * 1024 * 1024
+
+# Vista previa en pantalla del visor sin pirámide de teselas (JPEG, WEBP o PNG) y su calidad de compresión
+FORMATO_VISTA_PREVIA = os.environ.get("MAMO_FORMATO_VISTA_PREVIA", "JPEG").upper()
+CALIDAD_VISTA_PREVIA = int(os.environ.get("MAMO_CALIDAD_VISTA_PREVIA", "85"))
+
+# Presupuesto de memoria de los archivos de descarga generados por el visor (DICOM y PNG modificados)
+MAX_BYTES_CACHE_DESCARGAS = int(os.environ.get("MAMO_CACHE_DESCARGAS_MB", "256")) * 1024 * 1024
+
+# Procesos de conversión de la exportación masiva a PNG/JPG
+NUM_PROCESOS_EXPORTACION = int(os.environ.get("MAMO_PROCESOS_EXPORTACION", str(os.cpu_count() or 1)))
+
+# Compresión de los ZIP exportados: "auto" guarda sin comprimir los formatos ya comprimidos (PNG, JPG),
+# "deflated" o "stored" la fuerzan; nivel de compresión (0-9) y memoria máxima antes de volcar el ZIP a disco
+COMPRESION_EXPORTACION = os.environ.get("MAMO_COMPRESION_EXPORTACION", "auto").lower()
+NIVEL_COMPRESION_EXPORTACION = int(os.environ.get("MAMO_NIVEL_COMPRESION_EXPORTACION", "6"))
+MAX_BYTES_MEMORIA_EXPORTACION = int(os.environ.get("MAMO_EXPORTACION_MEMORIA_MB", "32")) * 1024 * 1024
+
+# Tiempo máximo que se publica un ZIP exportado en la carpeta static/: se borra al terminar la sesión que lo generó,
+# al exportar de nuevo o, como muy tarde, a los MAMO_EXPORTACION_MINUTOS minutos
+DURACION_EXPORTACION_ESTATICA = float(os.environ.get("MAMO_EXPORTACION_MINUTOS", "30")) * 60
+
+# Backend de inferencia de los clasificadores ("pytorch", "pytorch_int8" u "onnx"): uno para todos los modelos
+# o una lista "modelo=backend,..." ("*=backend" para el resto); carpeta de los modelos exportados a ONNX
+BACKENDS_INFERENCIA = os.environ.get("MAMO_BACKENDS", "pytorch")
+DIRECTORIO_ONNX = os.environ.get("MAMO_DIRECTORIO_ONNX", os.path.join(os.path.expanduser("~"), ".cache", "mamoviewer", "onnx"))
+
+# Clasificación de una imagen en modo especulativo: primario y secundarios en paralelo (menos latencia, más CPU)
+CLASIFICACION_ESPECULATIVA = os.environ.get("MAMO_CLASIFICACION_ESPECULATIVA", "0").lower() in ("1", "si", "sí", "true", "yes")
+
+# Medición de tiempos por etapa ("0" la desactiva) y duraciones recientes que se conservan por etapa para los cuantiles
+METRICAS_ACTIVAS = os.environ.get("MAMO_METRICAS", "1").lower() not in ("0", "no", "false")
+MAX_MUESTRAS_METRICAS = int(os.environ.get("MAMO_METRICAS_MUESTRAS", "10000"))
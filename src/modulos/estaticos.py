@@ -0,0 +1,56 @@
+# src/modulos/estaticos.py
+
+import logging
+import os
+import shutil
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Archivos generados que Streamlit sirve desde la carpeta static/ de la aplicación en /app/static/
+# (server.enableStaticServing): teselas del visor y ZIP de la exportación. Cada proceso escribe en su propia
+# carpeta static/<categoria>/<pid>, de modo que varios servidores pueden compartir la carpeta static/
+# y cada uno solo borra las carpetas de procesos que ya terminaron.
+
+RAIZ_APLICACION = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DIRECTORIO_ESTATICOS = os.path.join(RAIZ_APLICACION, "static")
+RUTA_URL_ESTATICOS = "app/static"
+
+_categorias_preparadas = set()
+_candado = threading.Lock()
+
+def _proceso_activo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _limpiar_directorios_huerfanos(raiz):
+    """
+    Borra las carpetas de procesos que ya terminaron (y la de un proceso anterior con el mismo pid),
+    sin tocar las de otros servidores en marcha.
+    """
+    try:
+        entradas = os.listdir(raiz)
+    except FileNotFoundError:
+        return
+    for nombre in entradas:
+        if nombre.isdigit() and (int(nombre) == os.getpid() or not _proceso_activo(int(nombre))):
+            shutil.rmtree(os.path.join(raiz, nombre), ignore_errors=True)
+            logger.info(f"Borrados los archivos estáticos del proceso terminado {nombre} en {raiz}")
+
+def directorio_proceso(categoria):
+    """
+    Devuelve (directorio, ruta_url) de la carpeta de este proceso en static/<categoria>.
+    La primera vez borra las carpetas de la categoría que pertenecían a procesos terminados.
+    """
+    raiz = os.path.join(DIRECTORIO_ESTATICOS, categoria)
+    with _candado:
+        if categoria not in _categorias_preparadas:
+            _limpiar_directorios_huerfanos(raiz)
+            _categorias_preparadas.add(categoria)
+    pid = str(os.getpid())
+    return os.path.join(raiz, pid), f"{RUTA_URL_ESTATICOS}/{categoria}/{pid}"
@@ -0,0 +1,265 @@
+# src/modulos/exportacion.py
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import pydicom
+from PIL import Image
+
+from src.modulos.configuracion import NUM_PROCESOS_EXPORTACION, COMPRESION_EXPORTACION, NIVEL_COMPRESION_EXPORTACION
+from src.modulos.configuracion import MAX_BYTES_MEMORIA_EXPORTACION
+from src.modulos.lectura import EXTENSIONES_DICOM
+from src.modulos.preprocesamiento import normalizar_dicom
+from src.modulos.metricas import intervalo, registrar, guardar as guardar_metricas
+
+logger = logging.getLogger(__name__)
+
+# Exportación masiva de DICOM a PNG/JPG.
+# Un grupo de procesos decodifica, normaliza, redimensiona y codifica cada archivo; el proceso principal es el
+# único que escribe en el ZIP, en el orden de entrada, de modo que el archivo resultante es reproducible.
+# Cada imagen se añade al ZIP en cuanto está lista, así que la memoria no crece con el tamaño del lote.
+# Uso: python exportar.py <directorio|archivo.zip> --salida imagenes.zip --tamano 512 --formato PNG
+
+# Formato de salida -> (formato de PIL, extensión)
+FORMATOS_EXPORTACION = {
+    'PNG': ('PNG', 'png'),
+    'JPG': ('JPEG', 'jpg'),
+    'JPEG': ('JPEG', 'jpg')
+}
+
+# Formatos de PIL cuya salida ya está comprimida: volver a comprimirla con deflate no reduce el tamaño
+_FORMATOS_COMPRIMIDOS = {'PNG', 'JPEG'}
+
+_METODOS_COMPRESION = {
+    'stored': zipfile.ZIP_STORED,
+    'deflated': zipfile.ZIP_DEFLATED
+}
+
+# Fecha fija de las entradas del ZIP: el mismo lote produce siempre el mismo archivo
+_FECHA_ZIP = (1980, 1, 1, 0, 0, 0)
+
+def nombre_exportado(nombre, formato):
+    """
+    Nombre de la imagen exportada dentro del ZIP: el del archivo DICOM con la extensión del formato.
+    """
+    return f"{os.path.splitext(nombre)[0]}.{FORMATOS_EXPORTACION[formato][1]}"
+
+def metodo_compresion(formato, compresion=COMPRESION_EXPORTACION):
+    """
+    Método de compresión del ZIP para las imágenes de un formato: con 'auto', ZIP_STORED si el formato
+    ya está comprimido y ZIP_DEFLATED en otro caso.
+    """
+    if compresion == 'auto':
+        return zipfile.ZIP_STORED if FORMATOS_EXPORTACION[formato][0] in _FORMATOS_COMPRIMIDOS else zipfile.ZIP_DEFLATED
+    if compresion not in _METODOS_COMPRESION:
+        raise ValueError(f"Compresión no soportada: {compresion}")
+    return _METODOS_COMPRESION[compresion]
+
+def archivo_temporal_exportacion(max_bytes_memoria=MAX_BYTES_MEMORIA_EXPORTACION):
+    """
+    Destino para exportar_lote: se mantiene en memoria hasta max_bytes_memoria y después se vuelca a un archivo
+    temporal en disco, que se borra al cerrarlo.
+    """
+    return tempfile.SpooledTemporaryFile(max_size=max_bytes_memoria, suffix='.zip')
+
+def convertir_dicom(dicom_bytes, tamano, formato):
+    """
+    Convierte los bytes de un archivo DICOM en los bytes de la imagen exportada (tamano = (ancho, alto)).
+    Lanza una excepción si el archivo no se puede convertir.
+    """
+    with intervalo('parseo_dicom'):
+        dicom = pydicom.dcmread(BytesIO(dicom_bytes))
+    imagen = Image.fromarray(normalizar_dicom(dicom))
+    with intervalo('redimensionado'):
+        imagen = imagen.resize(tamano)
+    salida = BytesIO()
+    imagen.save(salida, format=FORMATOS_EXPORTACION[formato][0])
+    return salida.getvalue()
+
+def _convertir_tarea(tarea):
+    # Se ejecuta en los procesos de trabajo: nunca lanza, el error viaja con el resultado
+    nombre, fuente, tamano, formato = tarea
+    inicio = time.perf_counter()
+    try:
+        # Las métricas de los procesos de trabajo no llegan al principal, que registra el tiempo total de la tarea
+        with intervalo('conversion_exportacion'):
+            if isinstance(fuente, str):
+                with intervalo('lectura_archivo'), open(fuente, 'rb') as archivo:
+                    fuente = archivo.read()
+            return convertir_dicom(fuente, tamano, formato), None, time.perf_counter() - inicio
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}", time.perf_counter() - inicio
+
+def _leer_fuente(fuente):
+    # Las fuentes que no se pueden enviar a otro proceso (funciones abrir) se leen en el proceso principal
+    if callable(fuente):
+        with intervalo('lectura_archivo'), fuente() as archivo:
+            return archivo.read()
+    if hasattr(fuente, 'getvalue'):
+        return fuente.getvalue()
+    return fuente
+
+def _tareas(elementos, tamano, formato):
+    for nombre, fuente in elementos:
+        yield nombre, _leer_fuente(fuente), tamano, formato
+
+def _resultados_en_orden(tareas, procesos, max_pendientes):
+    # Mantiene como mucho max_pendientes conversiones en curso y entrega los resultados en el orden de entrada
+    if procesos <= 1:
+        for tarea in tareas:
+            yield tarea[0], _convertir_tarea(tarea)
+        return
+
+    # spawn: no se heredan los hilos ni los modelos del proceso de Streamlit
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as ejecutor:
+        pendientes = deque()
+        for tarea in tareas:
+            pendientes.append((tarea[0], ejecutor.submit(_convertir_tarea, tarea)))
+            if len(pendientes) >= max_pendientes:
+                nombre, futuro = pendientes.popleft()
+                yield nombre, futuro.result()
+        while pendientes:
+            nombre, futuro = pendientes.popleft()
+            yield nombre, futuro.result()
+
+def exportar_lote(elementos, destino, tamano=(224, 224), formato='PNG', procesos=NUM_PROCESOS_EXPORTACION,
+                  al_progresar=None, compresion=COMPRESION_EXPORTACION, nivel_compresion=NIVEL_COMPRESION_EXPORTACION):
+    """
+    Exporta una lista de archivos DICOM a un ZIP de imágenes PNG o JPG.
+    Cada elemento es un par (nombre, fuente), donde fuente son los bytes del archivo, su ruta, un objeto con
+    getvalue() (UploadedFile) o una función que lo abre. destino es una ruta o un archivo binario con seek
+    (por ejemplo, archivo_temporal_exportacion()). compresion es 'auto', 'stored' o 'deflated'.
+    Los errores de un archivo no detienen la exportación: se devuelven en el resumen y se notifican con
+    al_progresar(completados, total, nombre, error).
+    """
+    formato = formato.upper()
+    if formato not in FORMATOS_EXPORTACION:
+        raise ValueError(f"Formato de exportación no soportado: {formato}")
+    metodo = metodo_compresion(formato, compresion)
+    elementos = list(elementos)
+    total = len(elementos)
+    procesos = max(1, min(procesos, total))
+
+    errores = []
+    exportados = 0
+    bytes_salida = 0
+    tiempo_conversion = 0.0
+    inicio = time.perf_counter()
+
+    with zipfile.ZipFile(destino, 'w', metodo, compresslevel=nivel_compresion) as zip_file:
+        tareas = _tareas(elementos, tuple(tamano), formato)
+        resultados = _resultados_en_orden(tareas, procesos, max_pendientes=2 * procesos)
+        for completados, (nombre, (imagen_bytes, error, tiempo)) in enumerate(resultados, start=1):
+            tiempo_conversion += tiempo
+            if procesos > 1:
+                registrar('conversion_exportacion', tiempo)
+            if error is None:
+                info = zipfile.ZipInfo(nombre_exportado(nombre, formato), date_time=_FECHA_ZIP)
+                info.compress_type = metodo
+                with intervalo('exportacion_zip'):
+                    zip_file.writestr(info, imagen_bytes, compresslevel=nivel_compresion)
+                exportados += 1
+                bytes_salida += len(imagen_bytes)
+            else:
+                logger.error(f"Error al exportar {nombre}: {error}")
+                errores.append((nombre, error))
+            if al_progresar is not None:
+                al_progresar(completados, total, nombre, error)
+
+    tiempo_total = time.perf_counter() - inicio
+    bytes_zip = os.path.getsize(destino) if isinstance(destino, str) else destino.tell()
+    return {
+        'archivos': total,
+        'exportados': exportados,
+        'errores': errores,
+        'procesos': procesos,
+        'tiempo_total': tiempo_total,
+        # Suma de los tiempos de conversión de cada archivo; dividido entre el tiempo total da el paralelismo efectivo
+        'tiempo_conversion': tiempo_conversion,
+        'imagenes_s': total / tiempo_total if tiempo_total > 0 else 0.0,
+        'mb_salida': bytes_salida / (1024 * 1024),
+        'mb_zip': bytes_zip / (1024 * 1024),
+        'compresion': 'stored' if metodo == zipfile.ZIP_STORED else 'deflated'
+    }
+
+def listar_dicom(entrada):
+    """
+    Devuelve (nombre relativo, fuente) para cada archivo DICOM de un directorio (recursivo) o un ZIP.
+    En un directorio la fuente es la ruta, que leen directamente los procesos de trabajo.
+    """
+    elementos = []
+    if os.path.isdir(entrada):
+        for raiz, carpetas, archivos in os.walk(entrada):
+            carpetas.sort()
+            for archivo in sorted(archivos):
+                if os.path.splitext(archivo)[1].lower() in EXTENSIONES_DICOM:
+                    ruta = os.path.join(raiz, archivo)
+                    elementos.append((os.path.relpath(ruta, entrada), ruta))
+    else:
+        zip_entrada = zipfile.ZipFile(entrada)
+        for nombre in sorted(zip_entrada.namelist()):
+            if os.path.splitext(nombre)[1].lower() in EXTENSIONES_DICOM:
+                elementos.append((nombre, lambda nombre=nombre: zip_entrada.open(nombre)))
+    return elementos
+
+def construir_parser():
+    parser = argparse.ArgumentParser(
+        description="Exporta archivos DICOM de un directorio o un ZIP a un ZIP de imágenes PNG o JPG."
+    )
+    parser.add_argument('entrada', help="Directorio (se recorre de forma recursiva) o archivo .zip")
+    parser.add_argument('-o', '--salida', required=True, help="Archivo ZIP de salida")
+    parser.add_argument('-t', '--tamano', type=int, default=224, help="Lado de las imágenes exportadas")
+    parser.add_argument('-f', '--formato', choices=['PNG', 'JPG'], default='PNG', type=str.upper)
+    parser.add_argument('-p', '--procesos', type=int, default=NUM_PROCESOS_EXPORTACION,
+                        help="Procesos de conversión (1 = sin grupo de procesos)")
+    parser.add_argument('--compresion', choices=['auto', 'stored', 'deflated'], default=COMPRESION_EXPORTACION,
+                        help="Compresión del ZIP ('auto': sin comprimir para PNG y JPG)")
+    parser.add_argument('--nivel-compresion', type=int, default=NIVEL_COMPRESION_EXPORTACION, choices=range(10),
+                        metavar='0-9', help="Nivel de compresión con deflated")
+    parser.add_argument('--metricas', metavar='ARCHIVO',
+                        help="Guarda los tiempos por etapa en ARCHIVO (formato Prometheus si termina en .prom, JSON si no)")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    return parser
+
+def main(argv=None):
+    """
+    Punto de entrada de la línea de comandos.
+    Devuelve 0 si se exportaron todos los archivos, 1 si alguno falló y 2 si no se pudo iniciar.
+    """
+    args = construir_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    if not os.path.isdir(args.entrada) and not zipfile.is_zipfile(args.entrada):
+        print(f"La entrada {args.entrada} no es un directorio ni un archivo ZIP.", file=sys.stderr)
+        return 2
+    elementos = listar_dicom(args.entrada)
+    if not elementos:
+        print(f"No se encontraron archivos DICOM en {args.entrada}.", file=sys.stderr)
+        return 2
+
+    def al_progresar(completados, total, nombre, error):
+        if completados % 100 == 0 or completados == total:
+            logger.info(f"{completados}/{total} archivos exportados")
+
+    resumen = exportar_lote(elementos, args.salida, (args.tamano, args.tamano), args.formato, args.procesos, al_progresar,
+                            args.compresion, args.nivel_compresion)
+    if args.metricas:
+        guardar_metricas(args.metricas)
+    print(
+        f"{resumen['exportados']} de {resumen['archivos']} archivos exportados en {resumen['tiempo_total']:.2f} s "
+        f"({resumen['imagenes_s']:.2f} img/s, {resumen['procesos']} procesos, ZIP de {resumen['mb_zip']:.1f} MB {resumen['compresion']}), "
+        f"{len(resumen['errores'])} con errores.",
+        file=sys.stderr
+    )
+    return 1 if resumen['errores'] else 0
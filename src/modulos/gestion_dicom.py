@@ -2,16 +2,23 @@
 
 import streamlit as st
 import os
+import shutil
+import threading
+import uuid
+import weakref
 import numpy as np
 import pydicom
 import logging
 from PIL import Image
 from io import BytesIO
-import zipfile
 
 from src.modulos.procesamiento_i import procesamiento_individual
 from src.modulos.procesamiento_m import procesamiento_masivo
 from src.modulos.visor_dicom import visualizar_dicom
+from src.modulos.preprocesamiento import normalizar_dicom, normalizar_dicom_unitario
+from src.modulos.exportacion import exportar_lote, archivo_temporal_exportacion
+from src.modulos.estaticos import directorio_proceso
+from src.modulos.configuracion import DURACION_EXPORTACION_ESTATICA
 
 logger = logging.getLogger(__name__)
 
@@ -82,44 +89,89 @@ def exportar_imagenes_png_jpg(opciones):
             progress_bar = st.progress(0)
             status_text = st.empty()
 
-            # Crear un archivo ZIP en memoria
-            zip_buffer = BytesIO()
-            with zipfile.ZipFile(zip_buffer, "a", zipfile.ZIP_DEFLATED) as zip_file:
-                for idx, dicom_file in enumerate(uploaded_files):
-                    dicom_bytes = dicom_file.getvalue()
-                    image = convertir_dicom_bytes_a_imagen(
-                        dicom_bytes,
-                        selected_size,
-                        # aplicar_transformaciones,
-                        # opciones_transformaciones
-                        aplicar_transformaciones=False,
-                        opciones_transformaciones={}
-                    )
-                    if image is not None:
-                        output_filename = f"{os.path.splitext(dicom_file.name)[0]}.{selected_format.lower()}"
-                        img_bytes = BytesIO()
-                        image.save(img_bytes, format=selected_format)
-                        img_bytes.seek(0)
-                        zip_file.writestr(output_filename, img_bytes.read())
-                    else:
-                        st.error(f"No se pudo procesar el archivo: {dicom_file.name}")
-
-                    # Actualizar barra de progreso
-                    progress = (idx + 1) / total_files
-                    progress_bar.progress(progress)
-                    status_text.text(f"Procesando {idx + 1} de {total_files} imágenes...")
-
-            st.success("Conversión completada.")
-
-            # Preparar el ZIP para descarga
-            zip_buffer.seek(0)
-            st.download_button(
-                label="Descargar Imágenes Convertidas",
-                data=zip_buffer,
-                file_name="imagenes_convertidas.zip",
-                mime="application/zip"
+            def al_progresar(completados, total, nombre, error):
+                progress_bar.progress(completados / total)
+                status_text.text(f"Procesando {completados} de {total} imágenes...")
+
+            # Conversión en paralelo (procesos); el ZIP se escribe en el orden de carga. Con archivos estáticos,
+            # en la carpeta static/ del proceso, desde donde el navegador lo descarga sin pasar por la memoria
+            # del servidor; si no, en un archivo temporal que pasa a disco al superar el umbral de memoria.
+            # El de la exportación anterior de la sesión se borra.
+            cerrar_exportacion(st.session_state.pop('zip_exportacion', None))
+            estatico = st.get_option("server.enableStaticServing")
+            if estatico:
+                zip_exportacion = ExportacionEstatica()
+                destino = zip_exportacion.ruta
+            else:
+                zip_exportacion = destino = archivo_temporal_exportacion()
+            st.session_state['zip_exportacion'] = zip_exportacion
+            resumen = exportar_lote(
+                [(dicom_file.name, dicom_file) for dicom_file in uploaded_files],
+                destino,
+                selected_size,
+                selected_format,
+                al_progresar=al_progresar
             )
 
+            for nombre, error in resumen['errores']:
+                st.error(f"No se pudo procesar el archivo: {nombre} ({error})")
+            st.success(
+                f"Conversión completada: {resumen['exportados']} de {resumen['archivos']} imágenes en "
+                f"{resumen['tiempo_total']:.2f} s ({resumen['imagenes_s']:.2f} img/s con {resumen['procesos']} procesos)."
+            )
+
+            etiqueta = f"Descargar Imágenes Convertidas ({resumen['mb_zip']:.1f} MB)"
+            if estatico:
+                url_base = "/" + (st.get_option("server.baseUrlPath") or "").strip("/")
+                st.markdown(
+                    f'<a href="{url_base.rstrip("/")}/{zip_exportacion.ruta_url}" download="imagenes_convertidas.zip">{etiqueta}</a>',
+                    unsafe_allow_html=True
+                )
+                st.caption(f"El enlace caduca al cerrar la sesión o a los {DURACION_EXPORTACION_ESTATICA / 60:.0f} minutos.")
+            else:
+                # st.download_button necesita los bytes: el ZIP solo se lee al pulsar el botón, pero se lee completo
+                # en memoria. Sin rerun para que el botón siga disponible
+                def leer_zip():
+                    zip_exportacion.seek(0)
+                    return zip_exportacion.read()
+
+                st.download_button(
+                    label=etiqueta,
+                    data=leer_zip,
+                    file_name="imagenes_convertidas.zip",
+                    mime="application/zip",
+                    on_click="ignore"
+                )
+
+class ExportacionEstatica:
+    """
+    ZIP de una exportación en la carpeta static/ del proceso, dentro de una subcarpeta con un nombre aleatorio
+    que solo conoce la sesión que lo genera. La subcarpeta se borra al cerrarla, cuando el objeto se descarta
+    (al terminar la sesión que lo guarda en session_state) o, como muy tarde, a los duracion segundos.
+    """
+
+    def __init__(self, duracion=DURACION_EXPORTACION_ESTATICA):
+        directorio, ruta_url = directorio_proceso("exportaciones")
+        token = uuid.uuid4().hex
+        os.makedirs(os.path.join(directorio, token), exist_ok=True)
+        self.ruta = os.path.join(directorio, token, "imagenes_convertidas.zip")
+        self.ruta_url = f"{ruta_url}/{token}/imagenes_convertidas.zip"
+        # El finalizador no mantiene vivo el objeto y solo borra la carpeta una vez, lo llame quien lo llame
+        self._finalizador = weakref.finalize(self, shutil.rmtree, os.path.join(directorio, token), True)
+        caducidad = threading.Timer(duracion, self._finalizador)
+        caducidad.daemon = True
+        caducidad.start()
+
+    def close(self):
+        self._finalizador()
+
+def cerrar_exportacion(zip_exportacion):
+    """
+    Libera el ZIP de una exportación anterior: cierra (y borra) el archivo temporal o el ZIP estático.
+    """
+    if zip_exportacion is not None:
+        zip_exportacion.close()
+
 # Funciones auxiliares
 
 def procesar_imagen_dicom_cached(dicom_file_bytes, opciones):
@@ -135,32 +187,22 @@ def procesar_imagen_dicom_cached(dicom_file_bytes, opciones):
             logger.warning("Dataset DICOM no pudo ser leído.")
             return None, None
 
-        # Obtener los datos de píxeles
-        data = ds.pixel_array
-
-        # Aplicar VOI LUT si está seleccionado
-        if opciones.get("aplicar_voilut", True):
-            data = apply_voi_lut(data, ds)
-
-        # Si la interpretación es MONOCHROME1, invertimos la imagen y cambiamos a MONOCHROME2
-        if ds.PhotometricInterpretation == 'MONOCHROME1':
-            data = np.max(data) - data
-            ds.PhotometricInterpretation = 'MONOCHROME2'
-
-        # Normalizar la imagen
-        data = data - np.min(data)
-        if np.max(data) != 0:
-            data = data / np.max(data)
-        else:
-            data = np.zeros(data.shape)
-
-        # Aplicar transformaciones si está seleccionado
+        # VOI LUT (si está seleccionado), MONOCHROME1 y normalización
+        aplicar_voilut = opciones.get("aplicar_voilut", True)
         if opciones.get("aplicar_transformaciones", False):
+            # Las transformaciones trabajan sobre valores en [0, 1]
+            data = normalizar_dicom_unitario(ds, aplicar_voilut=aplicar_voilut)
             transformaciones_seleccionadas = opciones.get('transformaciones_seleccionadas', {})
             data = aplicar_transformaciones(data, transformaciones_seleccionadas)
 
-        # Convertir a uint8
-        image = (data * 255).astype(np.uint8)
+            # Convertir a uint8
+            image = (data * 255).astype(np.uint8)
+        else:
+            image = normalizar_dicom(ds, aplicar_voilut=aplicar_voilut)
+
+        # La imagen ya está invertida: pasa a ser MONOCHROME2
+        if ds.PhotometricInterpretation == 'MONOCHROME1':
+            ds.PhotometricInterpretation = 'MONOCHROME2'
 
         # Convertir a imagen PIL
         image = Image.fromarray(image).convert('L')
@@ -189,25 +231,17 @@ def convertir_dicom_bytes_a_imagen(dicom_bytes, output_size=(224, 224), aplicar_
     try:
         # Leer el dataset DICOM
         dicom = pydicom.dcmread(BytesIO(dicom_bytes))
-        original_image = dicom.pixel_array
-
-        # Aplicar VOI LUT
-        img_windowed = apply_voi_lut(original_image, dicom)
-
-        # Manejar Photometric Interpretation
-        photometric_interpretation = dicom.get('PhotometricInterpretation', 'UNKNOWN')
-        if photometric_interpretation == 'MONOCHROME1':
-            img_windowed = img_windowed.max() - img_windowed
 
-        # Normalizar la imagen
-        img_normalized = (img_windowed - img_windowed.min()) / (img_windowed.max() - img_windowed.min())
-
-        # Aplicar transformaciones si está seleccionado
+        # VOI LUT, MONOCHROME1 y normalización
         if aplicar_transformaciones and opciones_transformaciones:
+            # Las transformaciones trabajan sobre valores en [0, 1]
+            img_normalized = normalizar_dicom_unitario(dicom)
             img_normalized = aplicar_transformaciones_a_imagen(img_normalized, opciones_transformaciones)
 
-        # Escalar a 0-255 y convertir a uint8
-        img_normalized = (img_normalized * 255).astype(np.uint8)
+            # Escalar a 0-255 y convertir a uint8
+            img_normalized = (img_normalized * 255).astype(np.uint8)
+        else:
+            img_normalized = normalizar_dicom(dicom)
 
         # Redimensionar la imagen
         img_resized = Image.fromarray(img_normalized).resize(output_size)
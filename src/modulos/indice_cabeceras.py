@@ -0,0 +1,263 @@
+# src/modulos/indice_cabeceras.py
+
+import logging
+import struct
+import time
+from collections import Counter
+
+import pydicom
+from pydicom.filereader import data_element_generator
+from pydicom.uid import UID
+from PIL import Image
+
+try:
+    from pydicom.pixels import get_decoder
+except ImportError:  # pydicom < 3
+    get_decoder = None
+
+from src.modulos.lectura import tipo_de_archivo
+
+logger = logging.getLogger(__name__)
+
+# Índice de cabeceras de un lote: se lee solo la cabecera DICOM (sin los píxeles) de cada archivo
+# para conocer la composición del lote, marcar los archivos no soportados antes de decodificarlos
+# y estimar el coste de decodificación de cada uno.
+
+ETIQUETAS_CABECERA = [
+    'PatientID',
+    'StudyInstanceUID',
+    'SeriesInstanceUID',
+    'SOPInstanceUID',
+    'Modality',
+    'ImageLaterality',
+    'Laterality',
+    'ViewPosition',
+    'Rows',
+    'Columns',
+    'BitsStored',
+    'SamplesPerPixel',
+    'PhotometricInterpretation',
+    'NumberOfFrames'
+]
+
+COLUMNAS_INDICE = [
+    'archivo',
+    'tipo',
+    'paciente',
+    'estudio',
+    'serie',
+    'lateralidad',
+    'vista',
+    'filas',
+    'columnas',
+    'bits',
+    'sintaxis',
+    'soportado',
+    'motivo'
+]
+
+# Etiquetas leídas por el lector rápido: (palabra clave, tipo de valor). Todas están antes de (0028,0102).
+_ETIQUETAS_RAPIDAS = {
+    0x00100020: ('PatientID', 'texto'),
+    0x00185101: ('ViewPosition', 'texto'),
+    0x0020000D: ('StudyInstanceUID', 'texto'),
+    0x0020000E: ('SeriesInstanceUID', 'texto'),
+    0x00200060: ('Laterality', 'texto'),
+    0x00200062: ('ImageLaterality', 'texto'),
+    0x00280002: ('SamplesPerPixel', 'US'),
+    0x00280004: ('PhotometricInterpretation', 'texto'),
+    0x00280008: ('NumberOfFrames', 'texto'),
+    0x00280010: ('Rows', 'US'),
+    0x00280011: ('Columns', 'US'),
+    0x00280101: ('BitsStored', 'US')
+}
+_ULTIMA_ETIQUETA = 0x00280101
+
+_SINTAXIS_IMPLICITA = '1.2.840.10008.1.2'
+_SINTAXIS_BIG_ENDIAN = '1.2.840.10008.1.2.2'
+_SINTAXIS_DEFLATE = {'1.2.840.10008.1.2.1.99', '1.2.840.10008.1.2.8.1'}
+
+FOTOMETRIAS_SOPORTADAS = {'MONOCHROME1', 'MONOCHROME2', 'RGB', 'YBR_FULL', 'YBR_FULL_422'}
+
+_decodificables = {}
+
+def _rebobinar(fuente):
+    if hasattr(fuente, 'seek'):
+        fuente.seek(0)
+    return fuente
+
+def _sintaxis_decodificable(sintaxis):
+    # Resultado cacheado por sintaxis: consultar los plugins de pydicom tiene un coste apreciable
+    if sintaxis not in _decodificables:
+        if get_decoder is None:
+            _decodificables[sintaxis] = True
+        else:
+            try:
+                _decodificables[sintaxis] = get_decoder(sintaxis).is_available
+            except NotImplementedError:
+                _decodificables[sintaxis] = False
+    return _decodificables[sintaxis]
+
+def _texto(valor):
+    # Los valores de pydicom (UID, PersonName, MultiValue) se guardan como texto para poder tabularlos
+    return str(valor) if valor not in (None, '') else None
+
+def _entero(valor):
+    try:
+        return int(valor) if valor not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+def _valor_crudo(valor, tipo, little_endian):
+    if valor is None:
+        return None
+    if tipo == 'US':
+        return struct.unpack('<H' if little_endian else '>H', valor[:2])[0] if len(valor) >= 2 else None
+    return valor.decode('latin-1').strip('\x00 ') or None
+
+def _leer_cabecera_rapida(fuente):
+    # Lector mínimo: recorre los elementos sin construir el Dataset de pydicom y se detiene en (0028,0101).
+    # Devuelve None si el archivo no tiene el formato habitual (preámbulo + DICM, sintaxis sin deflate).
+    fuente.seek(128)
+    if fuente.read(4) != b'DICM':
+        return None
+    meta = {
+        elemento.tag: elemento.value
+        for elemento in data_element_generator(fuente, False, True, stop_when=lambda tag, vr, longitud: tag.group != 2)
+    }
+    sintaxis = meta.get(0x00020010)
+    if not sintaxis:
+        return None
+    sintaxis = sintaxis.decode('ascii').strip('\x00 ')
+    if sintaxis in _SINTAXIS_DEFLATE:
+        return None
+    little_endian = sintaxis != _SINTAXIS_BIG_ENDIAN
+    valores = {'TransferSyntaxUID': sintaxis}
+    for elemento in data_element_generator(fuente, sintaxis == _SINTAXIS_IMPLICITA, little_endian,
+                                           stop_when=lambda tag, vr, longitud: tag > _ULTIMA_ETIQUETA,
+                                           specific_tags=list(_ETIQUETAS_RAPIDAS)):
+        palabra_clave, tipo = _ETIQUETAS_RAPIDAS[elemento.tag]
+        valores[palabra_clave] = _valor_crudo(elemento.value, tipo, little_endian)
+    return valores
+
+def _leer_cabecera_pydicom(fuente):
+    ds = pydicom.dcmread(fuente, stop_before_pixels=True, specific_tags=ETIQUETAS_CABECERA)
+    valores = {palabra_clave: ds.get(palabra_clave) for palabra_clave in ETIQUETAS_CABECERA}
+    valores['TransferSyntaxUID'] = getattr(getattr(ds, 'file_meta', None), 'TransferSyntaxUID', None)
+    return valores
+
+def leer_cabecera(nombre, fuente):
+    """
+    Lee la cabecera de un archivo DICOM, PNG o JPG sin decodificar los píxeles.
+    Devuelve un diccionario con las columnas de COLUMNAS_INDICE.
+    """
+    fila = dict.fromkeys(COLUMNAS_INDICE)
+    fila['archivo'] = nombre
+    fila['tipo'] = tipo_de_archivo(nombre)
+    fila['soportado'] = False
+
+    if fila['tipo'] is None:
+        fila['motivo'] = "Extensión no soportada"
+        return fila
+
+    try:
+        if fila['tipo'] == 'PNG_JPG':
+            # PIL solo lee la cabecera hasta que se accede a los píxeles
+            with Image.open(_rebobinar(fuente)) as imagen:
+                fila['columnas'], fila['filas'] = imagen.size
+                fila['sintaxis'] = imagen.format
+            fila['soportado'] = True
+            return fila
+
+        try:
+            valores = _leer_cabecera_rapida(_rebobinar(fuente))
+        except Exception as e:
+            logger.debug(f"Lector rápido de cabeceras no aplicable a {nombre}: {e}")
+            valores = None
+        if valores is None:
+            valores = _leer_cabecera_pydicom(_rebobinar(fuente))
+    except Exception as e:
+        fila['motivo'] = f"Cabecera ilegible: {e}"
+        return fila
+    finally:
+        _rebobinar(fuente)
+
+    sintaxis = UID(str(valores['TransferSyntaxUID'])) if valores.get('TransferSyntaxUID') else None
+    fila.update({
+        'paciente': _texto(valores.get('PatientID')),
+        'estudio': _texto(valores.get('StudyInstanceUID')),
+        'serie': _texto(valores.get('SeriesInstanceUID')),
+        'lateralidad': _texto(valores.get('ImageLaterality') or valores.get('Laterality')),
+        'vista': _texto(valores.get('ViewPosition')),
+        'filas': _entero(valores.get('Rows')),
+        'columnas': _entero(valores.get('Columns')),
+        'bits': _entero(valores.get('BitsStored')),
+        'sintaxis': sintaxis.name if sintaxis is not None else None
+    })
+
+    fotometria = _texto(valores.get('PhotometricInterpretation'))
+    if fila['filas'] is None or fila['columnas'] is None:
+        fila['motivo'] = "Sin dimensiones de imagen (Rows/Columns)"
+    elif (_entero(valores.get('NumberOfFrames')) or 1) > 1:
+        fila['motivo'] = "Imagen multicuadro"
+    elif fotometria is not None and fotometria not in FOTOMETRIAS_SOPORTADAS:
+        fila['motivo'] = f"Interpretación fotométrica no soportada: {fotometria}"
+    elif sintaxis is not None and not _sintaxis_decodificable(str(sintaxis)):
+        fila['motivo'] = f"Sintaxis de transferencia sin decodificador disponible: {sintaxis.name}"
+    else:
+        fila['soportado'] = True
+    return fila
+
+def indexar_cabeceras(elementos, abrir_flujo=None):
+    """
+    Construye el índice de cabeceras de una lista de archivos.
+    Cada elemento es un archivo con atributo name (por ejemplo, un UploadedFile) o un par (nombre, abrir).
+    abrir_flujo(nombre), si se indica, reemplaza a abrir de los pares con un flujo que solo lee lo necesario
+    (por ejemplo, ZipFile.open de un miembro en lugar de cargarlo completo).
+    Devuelve la lista de filas, en el orden de entrada, y el tiempo empleado en segundos.
+    """
+    inicio = time.perf_counter()
+    indice = []
+    for elemento in elementos:
+        if isinstance(elemento, tuple):
+            nombre, abrir = elemento
+            if abrir_flujo is not None:
+                abrir = lambda nombre=nombre: abrir_flujo(nombre)
+            try:
+                with abrir() as fuente:
+                    indice.append(leer_cabecera(nombre, fuente))
+            except OSError as e:
+                fila = dict.fromkeys(COLUMNAS_INDICE)
+                fila.update({'archivo': nombre, 'tipo': tipo_de_archivo(nombre), 'soportado': False,
+                             'motivo': f"No se pudo abrir: {e}"})
+                indice.append(fila)
+        else:
+            indice.append(leer_cabecera(elemento.name, elemento))
+    tiempo = time.perf_counter() - inicio
+    logger.info(f"Índice de {len(indice)} cabeceras construido en {tiempo:.2f} s")
+    return indice, tiempo
+
+def costo_estimado(fila):
+    """
+    Estimación relativa del coste de decodificación de un archivo (píxeles a decodificar).
+    """
+    return (fila['filas'] or 0) * (fila['columnas'] or 0)
+
+def resumir_indice(indice):
+    """
+    Resume la composición del lote: recuentos por tipo, sintaxis, vista y lateralidad,
+    pacientes, estudios y series distintos, y archivos no soportados.
+    """
+    return {
+        'archivos': len(indice),
+        'soportados': sum(1 for fila in indice if fila['soportado']),
+        'no_soportados': [(fila['archivo'], fila['motivo']) for fila in indice if not fila['soportado']],
+        'pacientes': len({fila['paciente'] for fila in indice if fila['paciente']}),
+        'estudios': len({fila['estudio'] for fila in indice if fila['estudio']}),
+        'series': len({fila['serie'] for fila in indice if fila['serie']}),
+        'por_tipo': dict(Counter(fila['tipo'] or 'desconocido' for fila in indice)),
+        'por_sintaxis': dict(Counter(fila['sintaxis'] or 'desconocida' for fila in indice)),
+        'por_vista': dict(Counter(f"{fila['lateralidad'] or '?'} {fila['vista'] or '?'}" for fila in indice
+                                  if fila['tipo'] == 'DICOM')),
+        'megapixeles': sum(costo_estimado(fila) for fila in indice) / 1e6
+    }
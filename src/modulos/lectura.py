@@ -0,0 +1,217 @@
+# src/modulos/lectura.py
+
+import os
+import logging
+from io import BytesIO
+
+import numpy as np
+import pydicom
+from pydicom.encaps import generate_frames
+from PIL import Image
+
+from src.modulos.preprocesamiento import normalizar_dicom
+from src.modulos.metricas import intervalo
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONES_DICOM = ['.dcm', '.dicom']
+EXTENSIONES_IMAGEN = ['.png', '.jpg', '.jpeg']
+
+# Lado de la imagen que recibe el modelo
+LADO_CLASIFICACION = 224
+
+# Sintaxis de transferencia que se pueden decodificar a resolución reducida
+SINTAXIS_JPEG2000 = {
+    '1.2.840.10008.1.2.4.90',   # JPEG 2000 sin pérdida
+    '1.2.840.10008.1.2.4.91',   # JPEG 2000
+    '1.2.840.10008.1.2.4.201',  # HTJ2K sin pérdida
+    '1.2.840.10008.1.2.4.202',  # HTJ2K sin pérdida RPCL
+    '1.2.840.10008.1.2.4.203'   # HTJ2K
+}
+SINTAXIS_JPEG_BASE = {'1.2.840.10008.1.2.4.50'}  # JPEG Baseline 8 bits
+
+# Funciones de decodificación sin dependencias de Streamlit: lanzan excepciones en lugar de mostrar errores,
+# para poder usarse desde hilos de trabajo y desde la línea de comandos.
+
+def tipo_de_archivo(nombre):
+    """
+    Devuelve 'DICOM' o 'PNG_JPG' según la extensión del archivo, o None si no está soportada.
+    """
+    extension = os.path.splitext(nombre)[1].lower()
+    if extension in EXTENSIONES_DICOM:
+        return 'DICOM'
+    elif extension in EXTENSIONES_IMAGEN:
+        return 'PNG_JPG'
+    return None
+
+def decodificar_archivo(nombre, fuente, solo_clasificacion=False, ligero=False):
+    """
+    Decodifica un archivo DICOM, PNG o JPG.
+    Devuelve la imagen para mostrar, la imagen para clasificación y el tipo de archivo.
+    Con solo_clasificacion se decodifica a resolución reducida y la imagen para mostrar es None.
+    Con ligero se decodifica a resolución completa, con la misma imagen para clasificación que el camino normal,
+    pero sin construir la imagen para mostrar (que es None).
+    """
+    tipo_archivo = tipo_de_archivo(nombre)
+    if solo_clasificacion and tipo_archivo == 'DICOM':
+        image_display, image_classification = None, decodificar_dicom_clasificacion(fuente)
+    elif solo_clasificacion and tipo_archivo == 'PNG_JPG':
+        image_display, image_classification = None, decodificar_imagen_clasificacion(fuente)
+    elif ligero and tipo_archivo == 'DICOM':
+        image_display, image_classification = None, decodificar_dicom_ligero(fuente)
+    elif ligero and tipo_archivo == 'PNG_JPG':
+        image_display, image_classification = None, decodificar_imagen_ligero(fuente)
+    elif tipo_archivo == 'DICOM':
+        image_display, image_classification = decodificar_dicom(fuente)
+    elif tipo_archivo == 'PNG_JPG':
+        image_display, image_classification = decodificar_imagen(fuente)
+    else:
+        raise ValueError("Formato de archivo no soportado. Por favor, carga una imagen en formato DICOM, PNG o JPG.")
+    return image_display, image_classification, tipo_archivo
+
+def _rebobinar(fuente):
+    # Los UploadedFile pueden haberse leído antes en el mismo rerun
+    if hasattr(fuente, 'seek'):
+        fuente.seek(0)
+    return fuente
+
+def decodificar_dicom(fuente):
+    """
+    Lee un archivo DICOM y devuelve la imagen para mostrar y para clasificación.
+    """
+    with intervalo('parseo_dicom'):
+        dicom = pydicom.dcmread(_rebobinar(fuente))
+
+    # VOI LUT, MONOCHROME1 y normalización a 8 bits
+    img_normalized_display = normalizar_dicom(dicom)
+
+    # Crear imagen para mostrar sin redimensionar
+    image_display = Image.fromarray(img_normalized_display).convert('L')
+
+    # Imagen para clasificación (redimensionada a 224x224)
+    with intervalo('redimensionado'):
+        image_classification = image_display.resize((224, 224)).convert('RGB')
+
+    return image_display, image_classification
+
+def decodificar_imagen(fuente):
+    """
+    Lee una imagen PNG o JPG y devuelve la imagen para mostrar y para clasificación.
+    """
+    with intervalo('decodificacion_pixeles'):
+        image_display = Image.open(_rebobinar(fuente)).convert('RGB')
+
+    # Imagen para clasificación (redimensionada a 224x224)
+    with intervalo('redimensionado'):
+        image_classification = image_display.resize((224, 224))
+
+    return image_display, image_classification
+
+def decodificar_dicom_ligero(fuente):
+    """
+    Igual que decodificar_dicom, pero devuelve solo la imagen para clasificación. Los bytes codificados y la
+    matriz decodificada se liberan en cuanto se normaliza, y la imagen de 8 bits en cuanto se redimensiona.
+    """
+    with intervalo('parseo_dicom'):
+        dicom = pydicom.dcmread(_rebobinar(fuente))
+    with intervalo('decodificacion_pixeles'):
+        datos = dicom.pixel_array
+    del dicom.PixelData
+
+    imagen = Image.fromarray(normalizar_dicom(dicom, datos)).convert('L')
+    del datos
+    with intervalo('redimensionado'):
+        return imagen.resize((224, 224)).convert('RGB')
+
+def decodificar_imagen_ligero(fuente):
+    """
+    Igual que decodificar_imagen, pero devuelve solo la imagen para clasificación.
+    """
+    with intervalo('decodificacion_pixeles'):
+        with Image.open(_rebobinar(fuente)) as original:
+            imagen = original.convert('RGB')
+    with intervalo('redimensionado'):
+        return imagen.resize((224, 224))
+
+def _factor_reduccion(alto, ancho, lado):
+    # Mayor potencia de 2 que deja el lado menor en al menos dos veces el lado de clasificación,
+    # para que el redimensionado final siga suavizando
+    factor = 1
+    while min(alto, ancho) // (factor * 2) >= 2 * lado:
+        factor *= 2
+    return factor
+
+def _promediar_bloques(datos, factor):
+    """
+    Reduce una matriz 2D promediando bloques de factor x factor, conservando el tipo de dato.
+    """
+    if factor == 1:
+        return datos
+    alto, ancho = datos.shape[0] // factor, datos.shape[1] // factor
+    bloques = datos[:alto * factor, :ancho * factor].reshape(alto, factor, ancho, factor)
+    reducida = bloques.mean(axis=(1, 3))
+    return np.rint(reducida).astype(datos.dtype)
+
+def _decodificar_reducido(dicom, lado):
+    # Decodifica el primer cuadro comprimido con el códec a resolución reducida (JPEG 2000: niveles de
+    # wavelet; JPEG: escalado DCT). Devuelve None si la sintaxis o la imagen no lo permiten.
+    file_meta = getattr(dicom, 'file_meta', None)
+    sintaxis = str(getattr(file_meta, 'TransferSyntaxUID', '') or '')
+    if sintaxis not in SINTAXIS_JPEG2000 | SINTAXIS_JPEG_BASE:
+        return None
+    if dicom.get('SamplesPerPixel', 1) != 1 or dicom.get('PixelRepresentation', 0) != 0:
+        return None
+    if int(dicom.get('NumberOfFrames', 1) or 1) != 1:
+        return None
+
+    cuadro = next(generate_frames(dicom.PixelData, number_of_frames=1))
+    imagen = Image.open(BytesIO(cuadro))
+    factor = _factor_reduccion(int(dicom.Rows), int(dicom.Columns), lado)
+    if sintaxis in SINTAXIS_JPEG2000:
+        imagen.reduce = factor.bit_length() - 1
+    else:
+        imagen.draft(imagen.mode, (int(dicom.Columns) // factor, int(dicom.Rows) // factor))
+    return np.asarray(imagen)
+
+def decodificar_dicom_clasificacion(fuente, lado=LADO_CLASIFICACION):
+    """
+    Lee un archivo DICOM y devuelve solo la imagen para clasificación (lado x lado, RGB).
+    No construye la imagen de 8 bits a resolución completa: los formatos comprimidos compatibles se decodifican
+    directamente a resolución reducida y, en el resto, la matriz decodificada se reduce por bloques antes de
+    aplicar la VOI LUT y la normalización.
+    """
+    with intervalo('parseo_dicom'):
+        dicom = pydicom.dcmread(_rebobinar(fuente))
+
+    datos = None
+    with intervalo('decodificacion_pixeles'):
+        try:
+            datos = _decodificar_reducido(dicom, lado)
+        except Exception as e:
+            logger.debug(f"No se pudo decodificar a resolución reducida, se usa la matriz completa: {e}")
+    reducir = datos is None
+    if reducir:
+        with intervalo('decodificacion_pixeles'):
+            datos = dicom.pixel_array
+    # Los bytes codificados (y la matriz que pydicom guarda en el dataset) ya no hacen falta: al borrar PixelData
+    # la matriz completa se libera en cuanto se reduce, antes de normalizar
+    del dicom.PixelData
+    if reducir and datos.ndim == 2:
+        with intervalo('redimensionado'):
+            datos = _promediar_bloques(datos, _factor_reduccion(datos.shape[0], datos.shape[1], lado))
+
+    image_reduced = Image.fromarray(normalizar_dicom(dicom, datos)).convert('L')
+    with intervalo('redimensionado'):
+        return image_reduced.resize((lado, lado)).convert('RGB')
+
+def decodificar_imagen_clasificacion(fuente, lado=LADO_CLASIFICACION):
+    """
+    Lee una imagen PNG o JPG y devuelve solo la imagen para clasificación.
+    Los JPG se decodifican a resolución reducida (escalado DCT).
+    """
+    with intervalo('decodificacion_pixeles'):
+        imagen = Image.open(_rebobinar(fuente))
+        imagen.draft('RGB', (2 * lado, 2 * lado))
+        imagen = imagen.convert('RGB')
+    with intervalo('redimensionado'):
+        return imagen.resize((lado, lado))
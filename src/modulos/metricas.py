@@ -0,0 +1,292 @@
+# src/modulos/metricas.py
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+from src.modulos.configuracion import METRICAS_ACTIVAS, MAX_MUESTRAS_METRICAS
+
+logger = logging.getLogger(__name__)
+
+# Medición de tiempos por etapa (lectura, parseo DICOM, VOI LUT, normalización, redimensionado, preprocesado,
+# inferencia de cada modelo, reporte PDF, ZIP...) con intervalos anidables:
+#
+#     with intervalo('parseo_dicom'):
+#         dicom = pydicom.dcmread(fuente)
+#
+# Cada intervalo registra su tiempo propio, es decir, sin el de los intervalos anidados dentro de él en el
+# mismo hilo, de modo que la suma de las etapas no cuenta dos veces el mismo trabajo. Las etapas que se
+# ejecutan en varios hilos a la vez suman el tiempo de todos ellos (tiempo de trabajo, no de reloj).
+# Con las métricas desactivadas, intervalo() devuelve un contexto vacío compartido y no mide nada.
+# Las medidas se registran en las del hilo actual (ambito()); los hilos auxiliares de una ejecución
+# las heredan con propagar().
+
+# Etapas conocidas, en el orden en que se muestran; las demás se listan después por orden alfabético
+ETAPAS = [
+    'lectura_archivo',
+    'parseo_dicom',
+    'decodificacion_pixeles',
+    'voi_lut',
+    'normalizacion',
+    'redimensionado',
+    'preprocesado',
+    'inferencia',
+    'reporte_pdf',
+    'conversion_exportacion',
+    'exportacion_zip'
+]
+
+# Cuantiles que se calculan en el resumen y en la exportación a Prometheus
+CUANTILES = (0.5, 0.95, 0.99)
+
+_local = threading.local()
+_NULO = nullcontext()
+
+class Metricas:
+    """
+    Conjunto de medidas por etapa: número de intervalos, tiempo total (s), máximo (s) y las duraciones más
+    recientes para los cuantiles. Cada sesión de la interfaz tiene el suyo, de modo que reiniciar o desactivar
+    las medidas de una ejecución no afecta a las de otras; la línea de comandos usa el del proceso.
+    """
+
+    def __init__(self, activas=METRICAS_ACTIVAS):
+        self.activas = bool(activas)
+        self.inicio = time.time()
+        self._etapas = {}
+        self._candado = threading.Lock()
+
+    def reiniciar(self):
+        with self._candado:
+            self._etapas.clear()
+            self.inicio = time.time()
+
+    def registrar(self, etapa, segundos):
+        if not self.activas:
+            return
+        with self._candado:
+            datos = self._etapas.get(etapa)
+            if datos is None:
+                datos = self._etapas[etapa] = {'n': 0, 'total': 0.0, 'maximo': 0.0, 'muestras': deque(maxlen=MAX_MUESTRAS_METRICAS)}
+            datos['n'] += 1
+            datos['total'] += segundos
+            if segundos > datos['maximo']:
+                datos['maximo'] = segundos
+            datos['muestras'].append(segundos)
+
+    def copia(self):
+        with self._candado:
+            return {etapa: (datos['n'], datos['total'], datos['maximo'], np.array(datos['muestras']))
+                    for etapa, datos in self._etapas.items()}
+
+# Medidas del proceso, que se usan fuera de un ámbito (línea de comandos, hilos sin propagar)
+_proceso = Metricas()
+
+def actuales():
+    """
+    Devuelve las medidas del hilo actual: las del ámbito abierto con ambito() o propagar(), o las del proceso.
+    """
+    return getattr(_local, 'metricas', None) or _proceso
+
+@contextmanager
+def ambito(metricas):
+    """
+    Contexto en el que las medidas del hilo actual se registran en metricas (un objeto Metricas).
+    """
+    anterior = getattr(_local, 'metricas', None)
+    _local.metricas = metricas
+    try:
+        yield metricas
+    finally:
+        _local.metricas = anterior
+
+def propagar(funcion):
+    """
+    Envuelve funcion para que, al ejecutarse en otro hilo, registre sus medidas en las del hilo que la envuelve.
+    """
+    metricas = actuales()
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        with ambito(metricas):
+            return funcion(*args, **kwargs)
+    return envoltura
+
+def activar(activas=True):
+    """
+    Activa o desactiva la medición en las medidas del hilo actual.
+    """
+    actuales().activas = bool(activas)
+
+def activas():
+    return actuales().activas
+
+def reiniciar():
+    """
+    Descarta las medidas acumuladas (al empezar una nueva ejecución).
+    """
+    actuales().reiniciar()
+
+def registrar(etapa, segundos):
+    """
+    Añade una duración medida por otros medios (por ejemplo, en un proceso de trabajo).
+    """
+    actuales().registrar(etapa, segundos)
+
+class _Intervalo:
+    __slots__ = ('etapa', 'metricas', 'inicio', 'anidado')
+
+    def __init__(self, etapa, metricas):
+        self.etapa = etapa
+        self.metricas = metricas
+
+    def __enter__(self):
+        pila = getattr(_local, 'pila', None)
+        if pila is None:
+            pila = _local.pila = []
+        pila.append(self)
+        self.anidado = 0.0
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *excepcion):
+        duracion = time.perf_counter() - self.inicio
+        pila = _local.pila
+        pila.pop()
+        if pila:
+            pila[-1].anidado += duracion
+        self.metricas.registrar(self.etapa, duracion - self.anidado)
+        return False
+
+def intervalo(etapa):
+    """
+    Contexto que mide el tiempo propio de una etapa.
+    """
+    metricas = actuales()
+    if not metricas.activas:
+        return _NULO
+    return _Intervalo(etapa, metricas)
+
+def cronometrado(etapa):
+    """
+    Decorador que mide cada llamada a la función como un intervalo de la etapa indicada.
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            metricas = actuales()
+            if not metricas.activas:
+                return funcion(*args, **kwargs)
+            with _Intervalo(etapa, metricas):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+def _leer_status():
+    # Campos de memoria de /proc/self/status en bytes (solo Linux)
+    campos = {}
+    with open('/proc/self/status', encoding='ascii') as archivo:
+        for linea in archivo:
+            if linea.startswith(('VmRSS:', 'VmHWM:')):
+                clave, valor = linea.split(':', 1)
+                campos[clave] = int(valor.split()[0]) * 1024
+    return campos
+
+def memoria_rss():
+    """
+    Devuelve (rss, pico) del proceso en bytes. En Linux el pico es VmHWM, que reiniciar_pico_rss() puede volver
+    a poner a cero; en otros sistemas es el máximo de toda la vida del proceso (getrusage) y rss es None.
+    Devuelve (None, None) si no se puede medir.
+    """
+    try:
+        campos = _leer_status()
+        return campos.get('VmRSS'), campos.get('VmHWM')
+    except OSError:
+        pass
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss está en KB en Linux y en bytes en macOS
+        return None, pico if os.uname().sysname == 'Darwin' else pico * 1024
+    except (ImportError, OSError, AttributeError):
+        return None, None
+
+def reiniciar_pico_rss():
+    """
+    Reinicia el pico de RSS del proceso al RSS actual (Linux: escribe 5 en /proc/self/clear_refs), para medir
+    el pico de un tramo concreto. Devuelve False si el sistema no lo permite.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='ascii') as archivo:
+            archivo.write('5')
+        return True
+    except OSError:
+        return False
+
+def _orden(etapa):
+    base = etapa.split(':', 1)[0]
+    return (ETAPAS.index(base) if base in ETAPAS else len(ETAPAS), etapa)
+
+def resumen():
+    """
+    Devuelve una lista con las estadísticas de cada etapa: número de intervalos, tiempo total, media,
+    cuantiles (sobre las últimas MAX_MUESTRAS_METRICAS duraciones) y máximo, en ms salvo el total (s).
+    """
+    copia = actuales().copia()
+
+    filas = []
+    for etapa in sorted(copia, key=_orden):
+        n, total, maximo, muestras = copia[etapa]
+        cuantiles = np.quantile(muestras, CUANTILES) * 1000 if len(muestras) else [0.0] * len(CUANTILES)
+        fila = {'etapa': etapa, 'n': n, 'total_s': total, 'media_ms': total / n * 1000 if n else 0.0}
+        fila.update({f"p{int(q * 100)}_ms": float(valor) for q, valor in zip(CUANTILES, cuantiles)})
+        fila['max_ms'] = maximo * 1000
+        filas.append(fila)
+    return filas
+
+def exportar_json(indent=2):
+    """
+    Devuelve las métricas de la ejecución actual como texto JSON.
+    """
+    metricas = actuales()
+    return json.dumps({
+        'inicio': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(metricas.inicio)),
+        'activas': metricas.activas,
+        'etapas': resumen()
+    }, indent=indent, ensure_ascii=False)
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def exportar_prometheus(prefijo='mamoviewer'):
+    """
+    Devuelve las métricas en el formato de texto de Prometheus: un summary de la duración de cada etapa
+    en segundos, con la etiqueta etapa (y modelo en las etapas "inferencia:<modelo>").
+    """
+    nombre = f"{prefijo}_etapa_duracion_segundos"
+    lineas = [
+        f"# HELP {nombre} Tiempo propio de cada etapa del procesamiento.",
+        f"# TYPE {nombre} summary"
+    ]
+    for fila in resumen():
+        etapa, _, modelo = fila['etapa'].partition(':')
+        etiqueta = f'etapa="{_escapar(etapa)}"' + (f',modelo="{_escapar(modelo)}"' if modelo else '')
+        for q in CUANTILES:
+            lineas.append(f'{nombre}{{{etiqueta},quantile="{q}"}} {fila[f"p{int(q * 100)}_ms"] / 1000:.6f}')
+        lineas.append(f"{nombre}_sum{{{etiqueta}}} {fila['total_s']:.6f}")
+        lineas.append(f"{nombre}_count{{{etiqueta}}} {fila['n']}")
+    return "\n".join(lineas) + "\n"
+
+def guardar(ruta):
+    """
+    Guarda las métricas en ruta: formato Prometheus si termina en .prom o .txt, JSON en otro caso.
+    """
+    contenido = exportar_prometheus() if ruta.endswith(('.prom', '.txt')) else exportar_json()
+    with open(ruta, 'w', encoding='utf-8') as archivo:
+        archivo.write(contenido)
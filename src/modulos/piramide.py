@@ -0,0 +1,169 @@
+# src/modulos/piramide.py
+
+import logging
+import math
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from src.modulos.cache_lru import CacheLRU
+from src.modulos.estaticos import directorio_proceso
+from src.modulos.configuracion import TAMANO_TESELA, LADO_VISTA_GENERAL, MAX_BYTES_TESELAS
+
+logger = logging.getLogger(__name__)
+
+# Pirámide multirresolución de teselas para el visor.
+# Las teselas se escriben en la carpeta static/ de la aplicación, que Streamlit sirve en /app/static/
+# cuando server.enableStaticServing está activo, y el navegador solo pide las teselas visibles.
+# La pirámide se construye una sola vez por imagen y no depende de la ventana: cada píxel guarda el índice
+# de la LUT (hasta 16 bits, en los canales rojo y verde de un PNG sin pérdida) y el navegador aplica
+# la LUT del estado actual de los sliders al pintar cada tesela.
+
+# Carpeta de las teselas de este proceso (las de procesos terminados se borran al importar el módulo)
+DIRECTORIO_TESELAS, RUTA_URL_TESELAS = directorio_proceso("teselas")
+
+# Entradas máximas de la LUT que viaja al navegador (índices de 16 bits)
+MAX_ENTRADAS_LUT_NAVEGADOR = 65536
+
+def _borrar_piramide(clave, piramide):
+    piramide['cancelada'].set()
+    shutil.rmtree(piramide['directorio'], ignore_errors=True)
+
+_cache_piramides = CacheLRU(MAX_BYTES_TESELAS, al_expulsar=_borrar_piramide)
+_ejecutor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="teselas")
+
+def _empaquetar(indices):
+    # Índices de 16 bits en los canales rojo (byte alto) y verde (byte bajo) de una imagen RGB
+    empaquetada = np.zeros(indices.shape + (3,), dtype=np.uint8)
+    empaquetada[..., 0] = indices >> 8
+    empaquetada[..., 1] = indices & 0xFF
+    return Image.fromarray(empaquetada, mode='RGB')
+
+def _guardar(indices, ruta):
+    # Escritura atómica: el navegador nunca lee una tesela a medio escribir.
+    # compress_level=1: las teselas se escriben una sola vez pero deben estar listas pronto
+    temporal = f"{ruta}.tmp"
+    _empaquetar(indices).save(temporal, format='PNG', compress_level=1)
+    os.replace(temporal, ruta)
+
+def _reducir(indices, promediar):
+    """
+    Reduce a la mitad una matriz de índices: media de cada bloque de 2x2 si los índices son monótonos
+    respecto a los valores que representan; si no (enteros con signo, VOI LUT arbitraria), un píxel de cada bloque.
+    """
+    if not promediar:
+        return indices[::2, ::2]
+    alto, ancho = indices.shape
+    bordes = np.pad(indices, ((0, alto % 2), (0, ancho % 2)), mode='edge')
+    suma = bordes[0::2, 0::2].astype(np.uint32)
+    suma += bordes[1::2, 0::2]
+    suma += bordes[0::2, 1::2]
+    suma += bordes[1::2, 1::2]
+    suma += 2
+    suma >>= 2
+    return suma.astype(np.uint16)
+
+def niveles_indices(indices, promediar=True, lado_vista=LADO_VISTA_GENERAL):
+    """
+    Niveles de la pirámide de una matriz de índices de hasta 16 bits: cada nivel reduce a la mitad
+    el anterior hasta que el lado mayor no supera lado_vista.
+    """
+    niveles = [indices]
+    while max(niveles[-1].shape) > lado_vista:
+        niveles.append(_reducir(niveles[-1], promediar))
+    return niveles
+
+def _escribir_niveles(piramide, niveles):
+    """
+    Escribe las teselas de los niveles indicados, del más grueso al más fino.
+    """
+    tamano = piramide['tesela']
+    try:
+        for nivel, indices in niveles:
+            directorio_nivel = os.path.join(piramide['directorio'], str(nivel))
+            os.makedirs(directorio_nivel, exist_ok=True)
+            alto, ancho = indices.shape
+            for y in range(math.ceil(alto / tamano)):
+                for x in range(math.ceil(ancho / tamano)):
+                    if piramide['cancelada'].is_set():
+                        return
+                    tesela = indices[y * tamano:(y + 1) * tamano, x * tamano:(x + 1) * tamano]
+                    _guardar(tesela, os.path.join(directorio_nivel, f"{x}_{y}.png"))
+            piramide['niveles'][nivel]['listo'] = True
+    except Exception as e:
+        if not piramide['cancelada'].is_set():
+            logger.error(f"Error al escribir las teselas de {piramide['clave']}: {e}")
+
+def construir_piramide(clave, niveles, tamano_tesela=TAMANO_TESELA):
+    """
+    Construye la pirámide a partir de sus niveles de índices (0 = resolución completa), calculados con
+    niveles_indices(). El último nivel se guarda como una sola imagen de vista general, que se muestra
+    de inmediato; las teselas de los niveles más finos se escriben en segundo plano, del más grueso al más fino.
+    """
+    directorio = os.path.join(DIRECTORIO_TESELAS, clave)
+    os.makedirs(directorio, exist_ok=True)
+
+    alto, ancho = niveles[0].shape
+    vista = niveles[-1]
+    piramide = {
+        'clave': clave,
+        'directorio': directorio,
+        'ancho': ancho,
+        'alto': alto,
+        'tesela': tamano_tesela,
+        'formato': 'png',
+        # Niveles con teselas (0 = resolución completa); la vista general cubre los demás
+        'niveles': [
+            {
+                'ancho': nivel.shape[1],
+                'alto': nivel.shape[0],
+                'columnas': math.ceil(nivel.shape[1] / tamano_tesela),
+                'filas': math.ceil(nivel.shape[0] / tamano_tesela),
+                'listo': False
+            }
+            for nivel in niveles[:-1]
+        ],
+        'vista': {
+            'archivo': "vista.png",
+            'ancho': vista.shape[1],
+            'alto': vista.shape[0]
+        },
+        # Estimación de la ocupación en disco: dos bytes por píxel en todos los niveles
+        'bytes_estimados': sum(2 * nivel.size for nivel in niveles),
+        'cancelada': threading.Event()
+    }
+
+    _guardar(vista, os.path.join(directorio, piramide['vista']['archivo']))
+    if len(niveles) > 1:
+        niveles_finos = [(nivel, niveles[nivel]) for nivel in range(len(niveles) - 2, -1, -1)]
+        _ejecutor.submit(_escribir_niveles, piramide, niveles_finos)
+    return piramide
+
+def obtener_piramide(clave, crear_niveles):
+    """
+    Devuelve la pirámide de la imagen identificada por clave, construyéndola solo la primera vez.
+    crear_niveles() devuelve los niveles de índices y solo se llama si la pirámide no está en la caché.
+    """
+    piramide = _cache_piramides.obtener(clave)
+    if piramide is None:
+        piramide = construir_piramide(clave, crear_niveles())
+        _cache_piramides.guardar(clave, piramide, piramide['bytes_estimados'])
+    return piramide
+
+def descripcion_para_navegador(piramide, url_base):
+    """
+    Devuelve los datos de la pirámide que necesita el JavaScript del visor.
+    """
+    return {
+        'url': f"{url_base.rstrip('/')}/{RUTA_URL_TESELAS}/{piramide['clave']}",
+        'ancho': piramide['ancho'],
+        'alto': piramide['alto'],
+        'tesela': piramide['tesela'],
+        'formato': piramide['formato'],
+        'niveles': [{k: nivel[k] for k in ('ancho', 'alto', 'columnas', 'filas')} for nivel in piramide['niveles']],
+        'vista': piramide['vista']
+    }
@@ -0,0 +1,182 @@
+# src/modulos/preprocesamiento.py
+
+import logging
+import time
+import tracemalloc
+
+import numpy as np
+
+try:
+    from pydicom.pixels import apply_voi_lut
+except ImportError:  # pydicom < 3
+    from pydicom.pixel_data_handlers.util import apply_voi_lut
+
+from src.modulos.metricas import intervalo
+
+logger = logging.getLogger(__name__)
+
+# Motor común de preprocesamiento DICOM: VOI LUT -> inversión MONOCHROME1 -> normalización min/max -> uint8.
+# Para píxeles enteros toda la cadena se evalúa sobre una tabla (LUT) con una entrada por valor almacenado
+# y se aplica a la imagen con una sola indexación, sin temporales float64 del tamaño de la imagen.
+# Los píxeles en coma flotante se procesan en float32 y en el sitio.
+
+# Número máximo de entradas de la LUT; por encima se usa el camino en coma flotante
+MAX_ENTRADAS_LUT = 1 << 20
+
+def dominio_enteros(datos, vmin=None, vmax=None):
+    """
+    Devuelve una vista de los datos enteros que sirve de índice para una LUT y el valor almacenado de cada índice.
+    Para enteros de 8 y 16 bits no se crea ninguna matriz temporal del tamaño de la imagen.
+    """
+    if datos.dtype in (np.uint8, np.uint16):
+        vmax = int(datos.max()) if vmax is None else vmax
+        return datos, np.arange(vmax + 1, dtype=np.int64)
+    if datos.dtype in (np.int8, np.int16):
+        sin_signo = np.uint8 if datos.dtype == np.int8 else np.uint16
+        indices = datos.view(sin_signo)
+        valores = np.arange(np.iinfo(sin_signo).max + 1, dtype=np.int64).astype(sin_signo).view(datos.dtype)
+        return indices, valores.astype(np.int64)
+    # Otros tipos enteros: desplazar al mínimo (requiere una copia)
+    vmin = int(datos.min()) if vmin is None else vmin
+    vmax = int(datos.max()) if vmax is None else vmax
+    return (datos - vmin).astype(np.intp), np.arange(vmin, vmax + 1, dtype=np.int64)
+
+def _extremos_presentes(lut, valores, indices, vmin, vmax):
+    # Mínimo y máximo de la LUT sobre los valores que aparecen en la imagen.
+    # Si la LUT es monótona en [vmin, vmax] bastan los extremos del tramo; si no (VOI LUT arbitraria),
+    # se marcan los valores presentes recorriendo la imagen una vez.
+    en_rango = (valores >= vmin) & (valores <= vmax)
+    tramo = lut[en_rango][np.argsort(valores[en_rango], kind='stable')]
+    diferencias = np.diff(tramo.astype(np.float64))
+    if (diferencias >= 0).all() or (diferencias <= 0).all():
+        return min(tramo[0], tramo[-1]), max(tramo[0], tramo[-1])
+    presentes = np.zeros(len(lut), dtype=bool)
+    presentes[indices] = True
+    return lut[presentes].min(), lut[presentes].max()
+
+def lut_voi(ds, datos, aplicar_voilut=True):
+    """
+    Evalúa la VOI LUT (o la ventana) del dataset una vez por valor almacenado de unos datos enteros.
+    Devuelve (indices, valores, lut, minimo, maximo), donde minimo y maximo son los extremos de la LUT
+    sobre los valores presentes en la imagen, o None si el rango de valores supera MAX_ENTRADAS_LUT.
+    """
+    vmin, vmax = int(datos.min()), int(datos.max())
+    if datos.dtype not in (np.int8, np.int16) and vmax - vmin + 1 > MAX_ENTRADAS_LUT:
+        return None
+    indices, valores = dominio_enteros(datos, vmin, vmax)
+
+    # Misma aritmética que la cadena original, evaluada una vez por valor almacenado
+    with intervalo('voi_lut'):
+        lut = apply_voi_lut(valores, ds) if aplicar_voilut else valores
+    minimo, maximo = _extremos_presentes(lut, valores, indices, vmin, vmax)
+    return indices, valores, lut, minimo, maximo
+
+def _normalizar_lut(ds, datos, aplicar_voilut, invertir):
+    resultado = lut_voi(ds, datos, aplicar_voilut)
+    if resultado is None:
+        return None
+    indices, _, lut, minimo, maximo = resultado
+    if invertir:
+        lut = maximo - lut
+        minimo, maximo = maximo - maximo, maximo - minimo
+    if maximo == minimo:
+        return indices, None
+    return indices, (lut - minimo) / (maximo - minimo)
+
+def _normalizar_flotante(ds, datos, aplicar_voilut, invertir, unitario):
+    with intervalo('voi_lut'):
+        imagen = apply_voi_lut(datos, ds) if aplicar_voilut else datos
+    # Una sola copia en float32; el resto de operaciones son en el sitio
+    imagen = np.array(imagen, dtype=np.float32)
+    minimo, maximo = imagen.min(), imagen.max()
+    if maximo == minimo:
+        return np.zeros(imagen.shape, dtype=np.float32 if unitario else np.uint8)
+    if invertir:
+        np.subtract(maximo, imagen, out=imagen)
+    else:
+        imagen -= minimo
+    imagen /= maximo - minimo
+    if unitario:
+        return imagen
+    imagen *= 255
+    return imagen.astype(np.uint8)
+
+def _normalizar(ds, datos, aplicar_voilut, unitario):
+    if datos is None:
+        with intervalo('decodificacion_pixeles'):
+            datos = ds.pixel_array
+    with intervalo('normalizacion'):
+        return _normalizar_datos(ds, datos, aplicar_voilut, unitario)
+
+def _normalizar_datos(ds, datos, aplicar_voilut, unitario):
+    invertir = ds.get('PhotometricInterpretation', 'UNKNOWN') == 'MONOCHROME1'
+
+    if np.issubdtype(datos.dtype, np.integer):
+        resultado = _normalizar_lut(ds, datos, aplicar_voilut, invertir)
+        if resultado is not None:
+            indices, lut = resultado
+            # Imagen constante: no hay rango que normalizar
+            if lut is None:
+                return np.zeros(datos.shape, dtype=np.float32 if unitario else np.uint8)
+            if unitario:
+                return lut.astype(np.float32)[indices]
+            # Las entradas de valores ausentes pueden salir de [0, 255]; las presentes no cambian al recortar
+            return np.clip(lut * 255, 0, 255).astype(np.uint8)[indices]
+    return _normalizar_flotante(ds, datos, aplicar_voilut, invertir, unitario)
+
+def normalizar_dicom(ds, datos=None, aplicar_voilut=True):
+    """
+    Aplica la VOI LUT (o la ventana) del dataset, invierte MONOCHROME1 y normaliza a 8 bits (0-255).
+    datos reemplaza al pixel_array del dataset si se indica. Las imágenes constantes devuelven ceros.
+    """
+    return _normalizar(ds, datos, aplicar_voilut, unitario=False)
+
+def normalizar_dicom_unitario(ds, datos=None, aplicar_voilut=True):
+    """
+    Igual que normalizar_dicom, pero devuelve valores float32 en [0, 1] (para aplicar transformaciones).
+    """
+    return _normalizar(ds, datos, aplicar_voilut, unitario=True)
+
+def normalizar_dicom_referencia(ds, datos=None):
+    """
+    Cadena de preprocesamiento anterior (float64, varias pasadas), conservada como referencia.
+    """
+    datos = ds.pixel_array if datos is None else datos
+    img_windowed = apply_voi_lut(datos, ds)
+    if ds.get('PhotometricInterpretation', 'UNKNOWN') == 'MONOCHROME1':
+        img_windowed = np.max(img_windowed) - img_windowed
+    img_normalized = (img_windowed - np.min(img_windowed)) / (np.max(img_windowed) - np.min(img_windowed))
+    return (img_normalized * 255).astype(np.uint8)
+
+def _medir(funcion, repeticiones):
+    tiempos = []
+    tracemalloc.start()
+    try:
+        for _ in range(repeticiones):
+            tracemalloc.reset_peak()
+            inicio = time.perf_counter()
+            resultado = funcion()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return resultado, min(tiempos), pico / (1024 * 1024)
+
+def comparar_con_referencia(ds, datos=None, repeticiones=3):
+    """
+    Compara el motor con la cadena anterior sobre un dataset: igualdad de la salida,
+    mejor tiempo de varias repeticiones y pico de memoria asignada (tracemalloc).
+    """
+    # La decodificación de los píxeles no forma parte de la medida
+    datos = ds.pixel_array if datos is None else datos
+    with np.errstate(divide='ignore', invalid='ignore'):
+        referencia, tiempo_referencia, memoria_referencia = _medir(lambda: normalizar_dicom_referencia(ds, datos), repeticiones)
+    salida, tiempo, memoria = _medir(lambda: normalizar_dicom(ds, datos), repeticiones)
+    return {
+        'identica': bool(np.array_equal(salida, referencia)),
+        'diferencia_maxima': int(np.abs(salida.astype(np.int16) - referencia.astype(np.int16)).max()),
+        'tiempo_referencia_ms': tiempo_referencia,
+        'tiempo_ms': tiempo,
+        'memoria_pico_referencia_mb': memoria_referencia,
+        'memoria_pico_mb': memoria
+    }
@@ -1,31 +1,35 @@
 # src/modulos/procesamiento_i.py
 
-import numpy as np
 import streamlit as st
-from PIL import Image
-import os
-from transformers import pipeline
-import torch
 import logging
-import pydicom
+
+from src.modulos.configuracion import MODELO_PRIMARIO, MODELO_SECUNDARIO_MASAS, MODELO_SECUNDARIO_CALCIFICACIONES
+from src.modulos.configuracion import CLASIFICACION_ESPECULATIVA
+from src.modulos.registro_modelos import obtener_modelo
+from src.modulos.lectura import tipo_de_archivo, decodificar_dicom, decodificar_imagen
+from src.modulos.cascada import clasificar_imagen_cascada, estadisticas_latencia, medir_latencia_modos
+from src.modulos.cache_clasificacion import obtener_cache_clasificacion
 
 logger = logging.getLogger(__name__)
 
+# Clave de session_state con las imágenes decodificadas del último archivo analizado en la sesión
+CLAVE_IMAGENES_ANALIZADAS = 'imagenes_analizadas'
+
 def procesamiento_individual(opciones):
     uploaded_image = opciones.get('uploaded_image')
 
     if uploaded_image is not None:
-        # Procesar la imagen
-        image_display, image_classification, tipo_archivo = procesar_archivo(uploaded_image)
+        # Procesar la imagen (una sola vez por archivo en la sesión)
+        image_display, image_classification, tipo_archivo = obtener_imagenes(uploaded_image)
 
         if image_display and image_classification:
             # Mostrar la imagen cargada en su calidad original
-            st.image(image_display, caption='Imagen Cargada', use_column_width=True)
+            st.image(image_display, caption='Imagen Cargada', width="stretch")
 
             # Nombres de los modelos en Hugging Face
-            model_name_primary = "nc7777/clasificador_primario"
-            model_name_secondary_masas = "nc7777/clasificador_masas"
-            model_name_secondary_calcifi = "nc7777/clasificador_calcificaciones"
+            model_name_primary = MODELO_PRIMARIO
+            model_name_secondary_masas = MODELO_SECUNDARIO_MASAS
+            model_name_secondary_calcifi = MODELO_SECUNDARIO_CALCIFICACIONES
 
             # Cargar los modelos desde Hugging Face
             classifier_primary = cargar_modelo(model_name_primary)
@@ -33,59 +37,45 @@ def procesamiento_individual(opciones):
             classifier_secondary_calcifi = cargar_modelo(model_name_secondary_calcifi)
 
             if classifier_primary:
-                # Definir mapeo de etiquetas para el modelo primario
-                prediction_mapping_primary = {
-                    '0': 'calcificaciones',
-                    '1': 'masas',
-                    '2': 'no_encontrado'
+                clasificadores_secundarios = {
+                    'masas': classifier_secondary_masas,
+                    'calcificaciones': classifier_secondary_calcifi
                 }
-
-                # Realizar la inferencia primaria
-                mapped_result_primary = clasificar_imagen(image_classification, classifier_primary, prediction_mapping_primary)
+                # Modo de baja latencia (opción de la barra lateral): los modelos secundarios se ejecutan a la vez
+                # que el primario
+                especulativo = opciones.get('baja_latencia')
+                if especulativo is None:
+                    especulativo = CLASIFICACION_ESPECULATIVA
+
+                # Realizar la inferencia primaria y, según su resultado, la secundaria.
+                # Si la imagen ya se clasificó con la misma revisión de los modelos, se toma de la caché.
+                mapped_result_primary, mapped_result_secondary = clasificar_imagen_cascada(
+                    image_classification,
+                    classifier_primary,
+                    clasificadores_secundarios,
+                    especulativo=especulativo,
+                    cache=obtener_cache_clasificacion() if opciones.get('usar_cache', True) else None
+                )
 
                 # Mostrar los resultados de la clasificación primaria
                 mostrar_resultados(mapped_result_primary, "Clasificación Primaria")
 
-                # Variables para los resultados secundarios
-                mapped_result_secondary_masas = None
-                mapped_result_secondary_calcifi = None
-
-                # Lógica para clasificación secundaria según la clasificación primaria
+                # Mostrar los resultados secundarios según la clasificación primaria
                 if mapped_result_primary:
                     if mapped_result_primary['label'] == 'masas':
                         if classifier_secondary_masas:
-                            # Definir mapeo de etiquetas para el modelo secundario de masas
-                            prediction_mapping_secondary_masas = {
-                                '0': 'benigno',
-                                '1': 'maligno',
-                                '2': 'sospechoso'
-                            }
-
-                            # Realizar la inferencia secundaria para masas
-                            mapped_result_secondary_masas = clasificar_imagen(image_classification, classifier_secondary_masas, prediction_mapping_secondary_masas)
-
-                            # Mostrar los resultados de la clasificación secundaria para masas
-                            mostrar_resultados(mapped_result_secondary_masas, "Clasificación Secundaria para Masas")
+                            mostrar_resultados(mapped_result_secondary, "Clasificación Secundaria para Masas")
                         else:
                             st.error("No se pudo cargar el modelo secundario para la clasificación de masas.")
 
                     elif mapped_result_primary['label'] == 'calcificaciones':
                         if classifier_secondary_calcifi:
-                            # Definir mapeo de etiquetas para el modelo secundario de calcificaciones
-                            prediction_mapping_secondary_calcifi = {
-                                '0': 'benigno',
-                                '1': 'maligno',
-                                '2': 'sospechoso'
-                            }
-
-                            # Realizar la inferencia secundaria para calcificaciones
-                            mapped_result_secondary_calcifi = clasificar_imagen(image_classification, classifier_secondary_calcifi, prediction_mapping_secondary_calcifi)
-
-                            # Mostrar los resultados de la clasificación secundaria para calcificaciones
-                            mostrar_resultados(mapped_result_secondary_calcifi, "Clasificación Secundaria para Calcificaciones")
+                            mostrar_resultados(mapped_result_secondary, "Clasificación Secundaria para Calcificaciones")
                         else:
                             st.error("No se pudo cargar el modelo secundario para la clasificación de calcificaciones.")
 
+                mostrar_latencias(image_classification, classifier_primary, clasificadores_secundarios)
+
             else:
                 st.error("No se pudo cargar el modelo primario para la clasificación.")
         else:
@@ -98,39 +88,44 @@ def procesamiento_individual(opciones):
 def cargar_modelo(model_name):
     """
     Carga un modelo de clasificación de imágenes desde Hugging Face.
+    El modelo se reutiliza entre reruns y sesiones a través del registro de modelos.
     """
     try:
-        # Determinar dispositivo
-        if torch.cuda.is_available():
-            device = 0  # GPU CUDA
-        elif torch.backends.mps.is_available():
-            device = "mps"  # GPU Apple MPS
-        else:
-            device = -1  # CPU
-
-        # Cargar el pipeline de clasificación de imágenes
-        classifier = pipeline("image-classification", model=model_name, device=device)
-        return classifier
+        # Obtener el pipeline del registro compartido (se carga una sola vez por proceso)
+        return obtener_modelo(model_name)
     except Exception as e:
         st.error(f"Ocurrió un error al cargar el modelo {model_name}: {e}")
         return None
 
+def obtener_imagenes(imagen_file):
+    """
+    Devuelve el resultado de procesar_archivo() para el archivo, decodificándolo solo la primera vez en la sesión:
+    el análisis se vuelve a mostrar en cada rerun del visor.
+    """
+    clave = getattr(imagen_file, 'file_id', None)
+    guardadas = st.session_state.get(CLAVE_IMAGENES_ANALIZADAS)
+    if clave is not None and guardadas is not None and guardadas[0] == clave:
+        return guardadas[1]
+    resultado = procesar_archivo(imagen_file)
+    if clave is not None and resultado[0] is not None:
+        st.session_state[CLAVE_IMAGENES_ANALIZADAS] = (clave, resultado)
+    return resultado
+
 def procesar_archivo(imagen_file):
     """
     Procesa un archivo de imagen en formato DICOM, PNG o JPG.
     Devuelve la imagen para mostrar y la imagen procesada para clasificación.
     """
     try:
-        # Obtener el nombre del archivo y su extensión
-        filename = imagen_file.name
-        extension = os.path.splitext(filename)[1].lower()
+        # Determinar el tipo de archivo según su extensión
+        tipo_archivo = tipo_de_archivo(imagen_file.name)
 
-        if extension in ['.dcm', '.dicom']:
+        if tipo_archivo == 'DICOM':
             # Procesar archivo DICOM
             image_display, image_classification = leer_dicom(imagen_file)
             return image_display, image_classification, 'DICOM'
 
-        elif extension in ['.png', '.jpg', '.jpeg']:
+        elif tipo_archivo == 'PNG_JPG':
             # Procesar archivo PNG o JPG
             image_display, image_classification = leer_imagen(imagen_file)
             return image_display, image_classification, 'PNG_JPG'
@@ -149,33 +144,7 @@ def leer_dicom(dicom_file):
     Lee un archivo DICOM y devuelve la imagen para mostrar y para clasificación.
     """
     try:
-        # Leer el archivo DICOM desde el objeto UploadedFile
-        dicom = pydicom.dcmread(dicom_file)
-        original_image = dicom.pixel_array
-
-        # Aplicar VOI LUT si está disponible
-        if hasattr(pydicom.pixel_data_handlers, 'apply_voi_lut'):
-            img_windowed = pydicom.pixel_data_handlers.apply_voi_lut(original_image, dicom)
-        else:
-            img_windowed = original_image
-
-        # Manejar Photometric Interpretation
-        photometric_interpretation = dicom.get('PhotometricInterpretation', 'UNKNOWN')
-        if photometric_interpretation == 'MONOCHROME1':
-            img_windowed = np.max(img_windowed) - img_windowed
-
-        # Normalizar la imagen para mostrar
-        img_normalized_display = (img_windowed - np.min(img_windowed)) / (np.max(img_windowed) - np.min(img_windowed))
-        img_normalized_display = (img_normalized_display * 255).astype(np.uint8)
-
-        # Crear imagen para mostrar sin redimensionar
-        image_display = Image.fromarray(img_normalized_display).convert('L')
-
-        # Imagen para clasificación (redimensionada a 224x224)
-        image_classification = image_display.resize((224, 224)).convert('RGB')
-
-        return image_display, image_classification
-
+        return decodificar_dicom(dicom_file)
     except Exception as e:
         logger.error(f"Error al procesar el archivo DICOM: {e}")
         st.error(f"Error al procesar el archivo DICOM: {e}")
@@ -186,36 +155,28 @@ def leer_imagen(imagen_file):
     Lee una imagen PNG o JPG y devuelve la imagen para mostrar y para clasificación.
     """
     try:
-        # Leer la imagen usando PIL
-        image_display = Image.open(imagen_file).convert('RGB')
-
-        # Imagen para clasificación (redimensionada a 224x224)
-        image_classification = image_display.resize((224, 224))
-
-        return image_display, image_classification
+        return decodificar_imagen(imagen_file)
     except Exception as e:
         logger.error(f"Error al procesar la imagen: {e}")
         st.error(f"Error al procesar la imagen: {e}")
         return None, None
 
-def clasificar_imagen(image, classifier, prediction_mapping):
+def mostrar_latencias(image_classification, classifier_primary, clasificadores_secundarios):
     """
-    Realiza la inferencia sobre una imagen y mapea las etiquetas predichas.
+    Muestra p50/p95 de la latencia de clasificación de cada modo (y de las respuestas servidas por la caché)
+    y permite medir ambos modos sobre la imagen actual.
     """
-    try:
-        resultado = classifier(image)
-        if len(resultado) == 0:
-            st.error("No se obtuvieron resultados de la clasificación.")
-            return None
-        top_result = resultado[0]
-        mapped_result = {
-            'label': prediction_mapping.get(top_result['label'], top_result['label']),
-            'score': top_result['score']
-        }
-        return mapped_result
-    except Exception as e:
-        st.error(f"Ocurrió un error durante la clasificación: {e}")
-        return None
+    with st.expander("Latencia de clasificación"):
+        for modo, estadisticas in estadisticas_latencia().items():
+            if estadisticas['n']:
+                st.write(f"**{modo.capitalize()}**: p50 {estadisticas['p50_ms']:.0f} ms · "
+                         f"p95 {estadisticas['p95_ms']:.0f} ms ({estadisticas['n']} clasificaciones)")
+        if st.button("Comparar modos con esta imagen", key="comparar_latencia"):
+            with st.spinner("Midiendo la latencia de ambos modos..."):
+                medidas = medir_latencia_modos(image_classification, classifier_primary, clasificadores_secundarios)
+            for modo, estadisticas in medidas.items():
+                st.write(f"{modo.capitalize()} (sin caché): p50 {estadisticas['p50_ms']:.0f} ms · "
+                         f"p95 {estadisticas['p95_ms']:.0f} ms")
 
 def mostrar_resultados(mapped_result, titulo):
     """
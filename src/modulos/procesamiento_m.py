@@ -1,43 +1,206 @@
 # src/modulos/procesamiento_m.py
 
 import streamlit as st
-from PIL import Image
-import os
+import hashlib
 import logging
-import pydicom
-import numpy as np
-
-from transformers import pipeline
-import torch
-from fpdf import FPDF  # Importar fpdf para generar el PDF
-from io import BytesIO
+import time
+from datetime import datetime
+
+from src.modulos.configuracion import MODELO_PRIMARIO, MODELO_SECUNDARIO_MASAS, MODELO_SECUNDARIO_CALCIFICACIONES
+from src.modulos.configuracion import TAMANO_LOTE, NUM_TRABAJADORES_DECODIFICACION, PROFUNDIDAD_COLA, MODO_LIGERO_MASIVO
+from src.modulos.configuracion import DECODIFICACION_REDUCIDA_MASIVA
+from src.modulos.configuracion import INTERVALO_SONDEO_TRABAJOS
+from src.modulos.registro_modelos import obtener_modelo
+from src.modulos.cascada import clasificar_cascada, enrutar_por_nombre
+from src.modulos.cascada import determinar_ground_truth, determinar_ground_truth_secondary
+from src.modulos.lectura import decodificar_archivo
+from src.modulos.canalizacion import ejecutar_canalizacion, ElementoDescartado
+from src.modulos.cache_clasificacion import obtener_cache_clasificacion, huella_modelos
+from src.modulos.indice_cabeceras import indexar_cabeceras, resumir_indice
+from src.modulos import metricas
+from src.modulos.reportes import generar_reportes
+from src.modulos.triaje import TriajeIncremental, determinar_prioridad
+from src.modulos.trabajos import obtener_gestor_trabajos, copiar_archivos, huella_archivos
+from src.modulos.trabajos import EN_COLA, COMPLETADO, CANCELADO
+from src.modulos.puntos_control import PuntoControl, obtener_almacen_puntos_control
 
 logger = logging.getLogger(__name__)
 
+# Clave de session_state con el identificador del trabajo de clasificación masiva que sigue la sesión
+CLAVE_TRABAJO_MASIVO = 'trabajo_masivo'
+
+# Clave de session_state con la huella de los archivos subidos, por file_id y opciones
+CLAVE_HUELLA_ENTRADA = 'huella_entrada_masiva'
+
+# Clave de session_state con los identificadores de los trabajos que envió la sesión o a los que se conectó
+# con su propia entrada; son los únicos que la sesión puede ver y cancelar
+CLAVE_TRABAJOS_SESION = 'trabajos_sesion'
+
 def procesamiento_masivo(opciones):
+    """
+    Envía la clasificación masiva de las imágenes cargadas como trabajo en segundo plano y muestra su progreso
+    o sus resultados. Un rerun, o una segunda pestaña con los mismos archivos y opciones, se vuelve a conectar
+    al trabajo existente en lugar de empezar de nuevo.
+    """
     uploaded_images = opciones.get('uploaded_images')
+    gestor = obtener_gestor_trabajos()
 
     if uploaded_images:
         st.write(f"**Cantidad de imágenes cargadas**: {len(uploaded_images)}")
 
-        # Nombres de los modelos en Hugging Face
-        model_name_primary = "nc7777/clasificador_primario"
-        model_name_secondary_masas = "nc7777/clasificador_masas"
-        model_name_secondary_calcifi = "nc7777/clasificador_calcificaciones"
+        evaluar_con_nombres = opciones.get('evaluar_con_nombres', True)
+        modo_ligero = opciones.get('modo_ligero', MODO_LIGERO_MASIVO)
+        decodificacion_reducida = opciones.get('decodificacion_reducida', DECODIFICACION_REDUCIDA_MASIVA)
+        # Solo las opciones que cambian los resultados distinguen un trabajo de otro
+        clave = huella_entrada_sesion(uploaded_images, evaluar_con_nombres, decodificacion_reducida)
+        trabajo = gestor.buscar(clave)
+
+        def enviar_trabajo(reutilizar=True):
+            # Llamar a la función de procesamiento masivo en segundo plano
+            # El trabajo registra sus tiempos por etapa en las medidas de la sesión que lo envía
+            return gestor.enviar(
+                metricas.propagar(procesar_imagenes_masivas),
+                copiar_archivos(uploaded_images),
+                MODELO_PRIMARIO,
+                MODELO_SECUNDARIO_MASAS,
+                MODELO_SECUNDARIO_CALCIFICACIONES,
+                tamano_lote=opciones.get('tamano_lote', TAMANO_LOTE),
+                evaluar_con_nombres=evaluar_con_nombres,
+                num_trabajadores=opciones.get('num_trabajadores', NUM_TRABAJADORES_DECODIFICACION),
+                profundidad_cola=opciones.get('profundidad_cola', PROFUNDIDAD_COLA),
+                usar_cache=opciones.get('usar_cache', True),
+                modo_ligero=modo_ligero,
+                decodificacion_reducida=decodificacion_reducida,
+                huella_entrada=clave,
+                descripcion=f"{len(uploaded_images)} imágenes ({uploaded_images[0].name}"
+                            f"{', ...' if len(uploaded_images) > 1 else ''})",
+                clave=clave,
+                reutilizar=reutilizar
+            )
+
+        if trabajo is None:
+            if st.button("Clasificar imágenes", type="primary", key="enviar_trabajo_masivo"):
+                trabajo = enviar_trabajo()
+        elif trabajo.estado == COMPLETADO:
+            # Un trabajo completado se reutiliza por defecto; volver a clasificar crea uno nuevo con la misma entrada
+            if st.button("Volver a clasificar", key="repetir_trabajo_masivo"):
+                trabajo = enviar_trabajo(reutilizar=False)
+        if trabajo is not None:
+            st.session_state[CLAVE_TRABAJO_MASIVO] = trabajo.id
+            st.session_state.setdefault(CLAVE_TRABAJOS_SESION, set()).add(trabajo.id)
+
+    id_trabajo = st.session_state.get(CLAVE_TRABAJO_MASIVO)
+    trabajo = gestor.obtener(id_trabajo) if id_trabajo else None
+    if trabajo is None:
+        if not uploaded_images:
+            st.info("Por favor, carga una o más imágenes DICOM, PNG o JPG para realizar la clasificación.")
+        return
+
+    mostrar_trabajo_masivo(trabajo)
+
+def trabajos_sesion(gestor):
+    """
+    Devuelve los trabajos de la sesión (CLAVE_TRABAJOS_SESION) que el gestor conserva, del más reciente al más antiguo.
+    Los trabajos de otras sesiones no se muestran: sus descripciones y resultados incluyen nombres de archivo.
+    """
+    propios = st.session_state.get(CLAVE_TRABAJOS_SESION, set())
+    return [trabajo for trabajo in gestor.listar() if trabajo.id in propios]
+
+def huella_entrada_sesion(archivos, *opciones):
+    """
+    Huella de los archivos subidos y las opciones (huella_archivos), guardada en la sesión por los file_id
+    de los archivos para no volver a leer todo su contenido en cada rerun.
+    """
+    ids = tuple(getattr(archivo, 'file_id', None) for archivo in archivos)
+    if None in ids:
+        return huella_archivos(archivos, *opciones)
+    clave_sesion = (ids, opciones)
+    guardada = st.session_state.get(CLAVE_HUELLA_ENTRADA)
+    if guardada is None or guardada[0] != clave_sesion:
+        guardada = (clave_sesion, huella_archivos(archivos, *opciones))
+        st.session_state[CLAVE_HUELLA_ENTRADA] = guardada
+    return guardada[1]
+
+def mostrar_trabajo_masivo(trabajo):
+    """
+    Muestra el progreso de un trabajo de clasificación masiva mientras se ejecuta y sus resultados al terminar.
+    """
+    if not trabajo.terminado:
+        mostrar_progreso_trabajo(trabajo.id)
+        return
+
+    st.caption(f"Trabajo {trabajo.id}: {trabajo.descripcion}")
+    if trabajo.estado == COMPLETADO:
+        mostrar_resultados_masivos(trabajo.resultado)
+    elif trabajo.estado == CANCELADO:
+        st.warning("La clasificación se canceló antes de terminar.")
+    else:
+        st.error(f"Ocurrió un error durante la clasificación: {trabajo.error}")
+
+@st.fragment(run_every=INTERVALO_SONDEO_TRABAJOS)
+def mostrar_progreso_trabajo(id_trabajo):
+    """
+    Consulta periódicamente el estado del trabajo sin volver a ejecutar el resto de la página;
+    cuando termina, vuelve a ejecutar la página completa para mostrar los resultados.
+    """
+    gestor = obtener_gestor_trabajos()
+    trabajo = gestor.obtener(id_trabajo)
+    if trabajo is None or trabajo.terminado:
+        st.rerun()
+
+    estado = trabajo.instantanea()
+    st.caption(f"Trabajo {estado['id']}: {estado['descripcion']}")
+    if estado['estado'] == EN_COLA:
+        st.info(f"En cola, con {gestor.posicion_en_cola(trabajo)} trabajo(s) por delante.")
+    elif estado['total']:
+        st.progress(estado['completados'] / estado['total'])
+        st.text(f"Clasificando las imágenes con IA... ({estado['completados']} de {estado['total']})")
+    else:
+        st.text(estado['datos'].get('fase', "Preparando la clasificación..."))
+
+    if 'triaje' in estado['datos']:
+        mostrar_triaje(estado['datos']['triaje'])
 
-        # Llamar a la función de procesamiento masivo
-        procesar_imagenes_masivas(uploaded_images, model_name_primary, model_name_secondary_masas, model_name_secondary_calcifi)
+    if estado['cancelacion_solicitada']:
+        st.caption("Cancelando...")
     else:
-        st.info("Por favor, carga una o más imágenes DICOM, PNG o JPG para realizar la clasificación.")
+        st.button("Cancelar", key=f"cancelar_{id_trabajo}", on_click=gestor.cancelar, args=(id_trabajo,))
 
-def procesar_imagenes_masivas(uploaded_images, model_name_primary, model_name_secondary_masas, model_name_secondary_calcifi):
+def procesar_imagenes_masivas(trabajo, archivos, model_name_primary, model_name_secondary_masas, model_name_secondary_calcifi,
+                              tamano_lote=TAMANO_LOTE, evaluar_con_nombres=True,
+                              num_trabajadores=NUM_TRABAJADORES_DECODIFICACION, profundidad_cola=PROFUNDIDAD_COLA,
+                              usar_cache=True, modo_ligero=MODO_LIGERO_MASIVO,
+                              decodificacion_reducida=DECODIFICACION_REDUCIDA_MASIVA, huella_entrada=None):
     """
-    Procesa múltiples imágenes para clasificación masiva.
-    Clasifica cada imagen en la clasificación primaria y secundaria,
-    luego ordena y muestra los nombres de las imágenes según la categoría.
-    Además, compara las predicciones del modelo primario con las etiquetas verdaderas
-    basadas en el prefijo del nombre del archivo y calcula estadísticas de precisión.
+    Procesa múltiples imágenes para clasificación masiva dentro de un trabajo en segundo plano (sin Streamlit).
+    Las imágenes se decodifican en num_trabajadores hilos que alimentan una cola de profundidad_cola imágenes,
+    y se clasifican por lotes de tamano_lote en la clasificación primaria y secundaria,
+    luego ordena las imágenes según la categoría.
+    Si evaluar_con_nombres es True, compara las predicciones del modelo primario con las etiquetas verdaderas
+    basadas en el prefijo del nombre del archivo, calcula estadísticas de precisión y solo envía al modelo
+    secundario las imágenes con predicción primaria correcta. Si es False, la clasificación secundaria
+    se enruta únicamente por la predicción primaria.
+    Si usar_cache es True, las imágenes ya clasificadas con la misma revisión de los modelos se toman de la caché.
+    Con modo_ligero no se construye la imagen para mostrar de cada archivo y los buffers decodificados se liberan
+    en el propio hilo de decodificación en cuanto está lista la imagen para clasificación, que es la misma que
+    en el camino normal. Con decodificacion_reducida cada archivo se decodifica directamente a la resolución de
+    clasificación (más rápido, pero la entrada del modelo difiere ligeramente de la del camino completo).
+    Tras cada lote se publican en el trabajo el progreso y una instantánea del triaje (contadores, hallazgos
+    destacados y tiempo hasta el primer hallazgo). Devuelve el diccionario de resultados que muestra
+    mostrar_resultados_masivos, o None si el trabajo se canceló.
+    Con huella_entrada (huella de los archivos y las opciones) los resultados por imagen se guardan en un punto
+    de control; una nueva ejecución con la misma entrada y los mismos modelos retoma la anterior y solo
+    clasifica las imágenes que faltan, con las mismas estadísticas y reportes que una ejecución sin interrupciones.
     """
+    inicio_ejecucion = time.time()
+
+    # Las métricas por etapa del panel lateral corresponden a la última ejecución de la sesión
+    metricas.reiniciar()
+
+    # Pre-paso sobre las cabeceras: composición del lote y archivos no soportados, sin decodificar píxeles
+    trabajo.actualizar(fase="Leyendo las cabeceras...")
+    indice, tiempo_indice = indexar_cabeceras(archivos)
+
     resultados = []
     correct_primary = 0
     incorrect_primary = 0
@@ -47,178 +210,266 @@ def procesar_imagenes_masivas(uploaded_images, model_name_primary, model_name_se
     incorrect_secondary_calcificaciones = 0
 
     # Cargar los modelos una vez para optimizar el rendimiento
-    classifier_primary = cargar_modelo(model_name_primary)
-    classifier_secondary_masas = cargar_modelo(model_name_secondary_masas)
-    classifier_secondary_calcifi = cargar_modelo(model_name_secondary_calcifi)
+    trabajo.actualizar(fase="Cargando los modelos...")
+    avisos = []
+    classifier_primary = cargar_modelo(model_name_primary, avisos)
+    classifier_secondary_masas = cargar_modelo(model_name_secondary_masas, avisos)
+    classifier_secondary_calcifi = cargar_modelo(model_name_secondary_calcifi, avisos)
 
     if not classifier_primary:
-        st.error("No se pudo cargar el modelo primario. Asegúrate de que la ruta sea correcta.")
-        return
+        raise RuntimeError(f"No se pudo cargar el modelo primario. Asegúrate de que la ruta sea correcta. ({avisos[0]})")
 
-    # Definir los mapeos de predicción
-    prediction_mapping_primary = {
-        '0': 'calcificaciones',
-        '1': 'masas',
-        '2': 'no_encontrado'
+    clasificadores_secundarios = {
+        'masas': classifier_secondary_masas,
+        'calcificaciones': classifier_secondary_calcifi
     }
 
-    prediction_mapping_secondary_masas = {
-        '0': 'benigno',
-        '1': 'maligno',
-        '2': 'sospechoso'
-    }
-
-    prediction_mapping_secondary_calcifi = {
-        '0': 'benigno',
-        '1': 'maligno',
-        '2': 'sospechoso'
-    }
-
-    # Inicializar la barra de progreso
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    status_text.text("Clasificando las imágenes con IA...")
-
-    # Crear una fila de columnas para centrar el GIF
-    col1, col2, col3 = st.columns([1, 1, 1])
-    with col2:
-        gif_placeholder = st.empty()  # Crear un espacio reservado para el GIF
-        gif_url = "https://media.giphy.com/media/fksTuJKgDCrdnkG497/giphy.gif"  # URL del GIF
-        gif_placeholder.image(gif_url, width=300)  # Mostrar el GIF con ancho de 300px (ajustable)
-
-    total_images = len(uploaded_images)
-
-    # Procesar cada imagen
-    for idx, uploaded_image in enumerate(uploaded_images):
-        # Procesar la imagen
-        image_display, image_classification, tipo_archivo = procesar_archivo(uploaded_image)
-
-        if image_classification:
-            # Realizar la clasificación primaria
-            mapped_result_primary = clasificar_imagen(image_classification, classifier_primary, prediction_mapping_primary)
-            if not mapped_result_primary:
-                # Agregar el resultado con clasificación primaria fallida
-                resultados.append({
-                    'nombre_archivo': uploaded_image.name,
-                    'categoria_primaria': 'error',
-                    'categoria_secundaria': None,
-                    'primary_correct': False
-                })
-                incorrect_primary += 1
-                continue  # Salta a la siguiente imagen si falla la clasificación primaria
-
-            etiqueta_primaria = mapped_result_primary['label']
+    # Caché persistente de clasificaciones (None si está desactivada)
+    cache = obtener_cache_clasificacion() if usar_cache else None
+
+    # Contadores y hallazgos destacados, que la interfaz consulta a medida que terminan los lotes
+    triaje = TriajeIncremental(len(archivos))
+    filas = [None] * len(archivos)
+    errores_decodificacion = {}
+
+    # Retomar los resultados guardados de una ejecución anterior con la misma entrada y los mismos modelos
+    punto_control = None
+    almacen = obtener_almacen_puntos_control() if huella_entrada else None
+    if almacen is not None:
+        huella = hashlib.sha256(f"{huella_entrada}|{huella_modelos(classifier_primary, clasificadores_secundarios)}".encode()).hexdigest()
+        punto_control = PuntoControl(almacen, huella, len(archivos))
+        guardados, transcurrido = punto_control.cargar()
+        if guardados:
+            logger.info(f"Se retoma la ejecución {huella[:12]}: {len(guardados)} de {len(archivos)} imágenes ya clasificadas")
+            # Los tiempos se miden desde el inicio de la ejecución original, sin contar las interrupciones
+            triaje.inicio -= transcurrido
+            for idx, (fila, error, tiempo) in sorted(guardados.items(), key=lambda guardado: (guardado[1][2], guardado[0])):
+                filas[idx] = fila
+                if error:
+                    errores_decodificacion[idx] = error
+                triaje.agregar([fila], tiempo=tiempo)
+    reanudadas = triaje.procesados
+    pendientes = [idx for idx, fila in enumerate(filas) if fila is None]
+    trabajo.actualizar(reanudadas, len(archivos), triaje=triaje.instantanea())
+
+    def registrar(indices, tiempo, errores=None):
+        # Cada resultado se acompaña del instante en que se obtuvo, para rehacer el triaje al retomar
+        if punto_control is not None:
+            punto_control.registrar([(idx, filas[idx], (errores or {}).get(idx), tiempo) for idx in indices], tiempo)
+
+    def decodificar(elemento):
+        # Se ejecuta en los hilos de decodificación: solo se conserva la imagen para clasificación.
+        # Los archivos marcados como no soportados en el índice no se llegan a decodificar.
+        archivo, fila = elemento
+        if not fila['soportado']:
+            raise ElementoDescartado(fila['motivo'])
+        return decodificar_archivo(archivo.name, archivo, solo_clasificacion=decodificacion_reducida, ligero=modo_ligero)[1]
+
+    def inferir(posiciones, imagenes):
+        # Clasificación primaria y secundaria por lotes
+        indices = [pendientes[posicion] for posicion in posiciones]
+        resultados_lote = clasificar_cascada(
+            imagenes,
+            classifier_primary,
+            clasificadores_secundarios,
+            tamano_lote=tamano_lote,
+            enrutar=enrutar_por_nombre([archivos[idx].name for idx in indices]) if evaluar_con_nombres else None,
+            cache=cache
+        )
+        for idx, (mapped_result_primary, mapped_result_secondary) in zip(indices, resultados_lote):
+            filas[idx] = crear_fila_resultado(archivos[idx].name, mapped_result_primary, mapped_result_secondary)
+        tiempo = triaje.transcurrido()
+        triaje.agregar([filas[idx] for idx in indices], tiempo=tiempo)
+        registrar(indices, tiempo)
+        return resultados_lote
+
+    def al_fallar(posicion, mensaje):
+        idx = pendientes[posicion]
+        filas[idx] = crear_fila_resultado(archivos[idx].name, None, None)
+        tiempo = triaje.transcurrido()
+        triaje.agregar([filas[idx]], tiempo=tiempo)
+        registrar([idx], tiempo, {idx: mensaje})
+
+    def actualizar_progreso(completados, total):
+        trabajo.actualizar(reanudadas + completados, len(archivos), triaje=triaje.instantanea())
+
+    # Decodificar en paralelo mientras se infiere sobre los lotes ya decodificados
+    try:
+        _, errores_pendientes, estadisticas_canalizacion = ejecutar_canalizacion(
+            [(archivos[idx], indice[idx]) for idx in pendientes],
+            decodificar,
+            inferir,
+            num_trabajadores=num_trabajadores,
+            profundidad_cola=profundidad_cola,
+            tamano_lote=tamano_lote,
+            al_procesar_lote=actualizar_progreso,
+            al_fallar=al_fallar,
+            medir_memoria=True,
+            cancelar=trabajo.evento_cancelacion
+        )
+    finally:
+        # Lo ya clasificado se conserva aunque el trabajo se cancele o falle
+        if punto_control is not None:
+            punto_control.volcar(triaje.transcurrido())
+    if trabajo.cancelado:
+        return None
+    errores_decodificacion.update((pendientes[posicion], mensaje) for posicion, mensaje in errores_pendientes.items())
+    trabajo.actualizar(triaje=triaje.instantanea(), fase="Generando los reportes...")
+
+    for idx, archivo in enumerate(archivos):
+        if idx in errores_decodificacion:
+            avisos.append(f"No se pudo procesar el archivo {archivo.name}: {errores_decodificacion[idx]}")
+
+        # La fila ya se creó al terminar su lote (o al fallar su decodificación)
+        fila = filas[idx] or crear_fila_resultado(archivo.name, None, None)
+        resultados.append(fila)
+        if fila['categoria_primaria'] == 'error':
+            # Error en el procesamiento o en la clasificación primaria
+            incorrect_primary += 1
+            continue
 
-            # Determinar la etiqueta verdadera basada en el prefijo del nombre del archivo
-            ground_truth_primary = determinar_ground_truth(uploaded_image.name)
+        etiqueta_primaria = fila['categoria_primaria']
+        etiqueta_secundaria = fila['categoria_secundaria']
 
+        if evaluar_con_nombres:
             # Comparar la predicción con la etiqueta verdadera
-            if etiqueta_primaria == ground_truth_primary:
-                primary_correct = True
+            primary_correct = etiqueta_primaria == determinar_ground_truth(archivo.name)
+            fila['primary_correct'] = primary_correct
+            if primary_correct:
                 correct_primary += 1
             else:
-                primary_correct = False
                 incorrect_primary += 1
 
-            # Inicializar la clasificación secundaria
-            etiqueta_secundaria = None
-
-            # Determinar la etiqueta verdadera secundaria
-            ground_truth_secondary = determinar_ground_truth_secondary(uploaded_image.name, etiqueta_primaria)
-
-            # Realizar la clasificación secundaria según la clasificación primaria
-            if primary_correct and etiqueta_primaria == 'masas' and classifier_secondary_masas and ground_truth_secondary:
-                mapped_result_secondary = clasificar_imagen(image_classification, classifier_secondary_masas, prediction_mapping_secondary_masas)
-                if mapped_result_secondary:
-                    etiqueta_secundaria = mapped_result_secondary['label']
-                    if etiqueta_secundaria == ground_truth_secondary:
-                        correct_secondary_masas += 1
-                    else:
-                        incorrect_secondary_masas += 1
-            elif primary_correct and etiqueta_primaria == 'calcificaciones' and classifier_secondary_calcifi and ground_truth_secondary:
-                mapped_result_secondary_calcifi = clasificar_imagen(image_classification, classifier_secondary_calcifi, prediction_mapping_secondary_calcifi)
-                if mapped_result_secondary_calcifi:
-                    etiqueta_secundaria = mapped_result_secondary_calcifi['label']
-                    if etiqueta_secundaria == ground_truth_secondary:
-                        correct_secondary_calcificaciones += 1
-                    else:
-                        incorrect_secondary_calcificaciones += 1
-
-            # Agregar el resultado al listado
-            resultados.append({
-                'nombre_archivo': uploaded_image.name,
-                'categoria_primaria': etiqueta_primaria,
-                'categoria_secundaria': etiqueta_secundaria,
-                'primary_correct': primary_correct
-            })
-        else:
-            # Agregar el resultado con error en el procesamiento
-            resultados.append({
-                'nombre_archivo': uploaded_image.name,
-                'categoria_primaria': 'error',
-                'categoria_secundaria': None,
-                'primary_correct': False
-            })
-            incorrect_primary += 1
+            # Comparar la predicción secundaria con la etiqueta verdadera secundaria
+            if etiqueta_secundaria:
+                ground_truth_secondary = determinar_ground_truth_secondary(archivo.name, etiqueta_primaria)
+                acierto = etiqueta_secundaria == ground_truth_secondary
+                if etiqueta_primaria == 'masas':
+                    correct_secondary_masas += acierto
+                    incorrect_secondary_masas += not acierto
+                elif etiqueta_primaria == 'calcificaciones':
+                    correct_secondary_calcificaciones += acierto
+                    incorrect_secondary_calcificaciones += not acierto
+
+    # Ordenar las imágenes según la prioridad
+    resultados_ordenados = sorted(resultados, key=determinar_prioridad)
+
+    # Las estadísticas ya se acumularon durante el triaje
+    resumen_triaje = triaje.resumen()
+    masas = resumen_triaje['masas']
+    calcificaciones = resumen_triaje['calcificaciones']
+    malignas = resumen_triaje['malignas']
+    sospechosas = resumen_triaje['sospechosas']
+    benignas = resumen_triaje['benignas']
+
+    porcentaje_mas_cal = masas + calcificaciones
+    porcentaje_maligno = (malignas / porcentaje_mas_cal) * 100 if porcentaje_mas_cal > 0 else 0
+    porcentaje_sospechoso = (sospechosas / porcentaje_mas_cal) * 100 if porcentaje_mas_cal > 0 else 0
+    porcentaje_benigno = (benignas / porcentaje_mas_cal) * 100 if porcentaje_mas_cal > 0 else 0
+
+    # Generar el reporte PDF (sin la Evaluación de los Modelos Secundarios) y los resultados en CSV y Parquet
+    reportes = generar_reportes(
+        resultados_ordenados,
+        masas=masas,
+        calcificaciones=calcificaciones,
+        no_encontrados=resumen_triaje['no_encontrados'],
+        malignas=malignas,
+        sospechosas=sospechosas,
+        benignas=benignas,
+        porcentaje_maligno=porcentaje_maligno,
+        porcentaje_sospechoso=porcentaje_sospechoso,
+        porcentaje_benigno=porcentaje_benigno,
+        total=len(resultados_ordenados),
+        # Fecha del inicio de la ejecución original: retomarla genera el mismo reporte
+        fecha=datetime.fromtimestamp(punto_control.creada if punto_control is not None else inicio_ejecucion)
+    ) if resultados_ordenados else {}
+
+    # La ejecución terminó: su punto de control ya no hace falta
+    if punto_control is not None:
+        punto_control.descartar()
+
+    return {
+        'indice': indice,
+        'tiempo_indice': tiempo_indice,
+        'avisos': avisos,
+        'estadisticas_canalizacion': estadisticas_canalizacion,
+        'reanudadas': reanudadas,
+        'triaje': triaje.instantanea(),
+        'resultados_ordenados': resultados_ordenados,
+        'porcentaje_maligno': porcentaje_maligno,
+        'porcentaje_sospechoso': porcentaje_sospechoso,
+        'porcentaje_benigno': porcentaje_benigno,
+        'evaluar_con_nombres': evaluar_con_nombres,
+        'evaluacion': {
+            'correct_primary': correct_primary,
+            'incorrect_primary': incorrect_primary,
+            'correct_secondary_masas': correct_secondary_masas,
+            'incorrect_secondary_masas': incorrect_secondary_masas,
+            'correct_secondary_calcificaciones': correct_secondary_calcificaciones,
+            'incorrect_secondary_calcificaciones': incorrect_secondary_calcificaciones
+        },
+        'reportes': reportes
+    }
 
-        # Actualizar la barra de progreso
-        progress = (idx + 1) / total_images
-        progress_bar.progress(progress)
+def mostrar_resultados_masivos(resultado):
+    """
+    Muestra los resultados de un trabajo de clasificación masiva completado: composición del lote, errores,
+    triaje final, rendimiento, resumen por categoría, evaluación de los modelos y descargas.
+    """
+    mostrar_indice_cabeceras(resultado['indice'], resultado['tiempo_indice'])
+    for aviso in resultado['avisos']:
+        st.error(aviso)
 
-    # Actualizar el estado al finalizar
-    status_text.text("Clasificación completada.")
+    st.text("Clasificación completada.")
+    if resultado['reanudadas']:
+        st.info(f"Se retomó una ejecución interrumpida: {resultado['reanudadas']} imágenes se recuperaron del punto de control.")
+    mostrar_triaje(resultado['triaje'])
 
-    # Eliminar el GIF una vez completada la clasificación
-    gif_placeholder.empty()
+    resumen_triaje = resultado['triaje']['resumen']
+    mostrar_rendimiento_canalizacion(resultado['estadisticas_canalizacion'], resumen_triaje)
 
-    if resultados:
-        # Definir el orden de prioridad para las categorías secundarias
-        prioridad = {
-            'maligno': 1,
-            'sospechoso': 2,
-            'benigno': 3,
-            'no_encontrado': 4,
-            'error': 5
-        }
+    resultados_ordenados = resultado['resultados_ordenados']
+    if not resultados_ordenados:
+        st.write("No se obtuvieron resultados de clasificación para las imágenes cargadas.")
+        return
 
-        # Función para determinar la prioridad de una imagen
-        def determinar_prioridad(resultado):
-            categoria = resultado['categoria_secundaria'] if resultado['categoria_secundaria'] else resultado['categoria_primaria']
-            if categoria in prioridad:
-                return prioridad[categoria]
-            else:
-                # Si no hay clasificación secundaria, asignar la prioridad más baja
-                return prioridad['no_encontrado']
-
-        # Ordenar las imágenes según la prioridad
-        resultados_ordenados = sorted(resultados, key=determinar_prioridad)
-
-        # Calcular estadísticas
-        total = len(resultados_ordenados)
-        masas = len([res for res in resultados_ordenados if res['categoria_primaria'] == 'masas'])
-        calcificaciones = len([res for res in resultados_ordenados if res['categoria_primaria'] == 'calcificaciones'])
-        no_encontrados = len([res for res in resultados_ordenados if res['categoria_primaria'] == 'no_encontrado'])
-        errores = len([res for res in resultados_ordenados if res['categoria_primaria'] == 'error'])
-
-        malignas = len([res for res in resultados_ordenados if res['categoria_secundaria'] == 'maligno'])
-        sospechosas = len([res for res in resultados_ordenados if res['categoria_secundaria'] == 'sospechoso'])
-        benignas = len([res for res in resultados_ordenados if res['categoria_secundaria'] == 'benigno'])
-
-        porcentaje_mas_cal = masas + calcificaciones
-        porcentaje_maligno = (malignas / porcentaje_mas_cal) * 100 if porcentaje_mas_cal > 0 else 0
-        porcentaje_sospechoso = (sospechosas / porcentaje_mas_cal) * 100 if porcentaje_mas_cal > 0 else 0
-        porcentaje_benigno = (benignas / porcentaje_mas_cal) * 100 if porcentaje_mas_cal > 0 else 0
-
-        # Mostrar el resumen de resultados
-        st.markdown("---")  # Separador
-        st.write(f"**Total de imágenes procesadas:** {total}")
-        st.write(f"**Masas:** {masas}")
-        st.write(f"**Calcificaciones:** {calcificaciones}")
-        st.write(f"**No Encontradas:** {no_encontrados}")
-        st.write(f"**Errores en el procesamiento:** {errores}")
-        st.write(f"**Malignas:** {malignas} ({porcentaje_maligno:.2f}%)")
-        st.write(f"**Sospechosas:** {sospechosas} ({porcentaje_sospechoso:.2f}%)")
-        st.write(f"**Benignas:** {benignas} ({porcentaje_benigno:.2f}%)")
+    # Calcular estadísticas
+    total = len(resultados_ordenados)
+    masas = resumen_triaje['masas']
+    calcificaciones = resumen_triaje['calcificaciones']
+    no_encontrados = resumen_triaje['no_encontrados']
+    errores = resumen_triaje['errores']
+
+    malignas = resumen_triaje['malignas']
+    sospechosas = resumen_triaje['sospechosas']
+    benignas = resumen_triaje['benignas']
+
+    porcentaje_maligno = resultado['porcentaje_maligno']
+    porcentaje_sospechoso = resultado['porcentaje_sospechoso']
+    porcentaje_benigno = resultado['porcentaje_benigno']
+
+    # Mostrar el resumen de resultados
+    st.markdown("---")  # Separador
+    st.write(f"**Total de imágenes procesadas:** {total}")
+    st.write(f"**Masas:** {masas}")
+    st.write(f"**Calcificaciones:** {calcificaciones}")
+    st.write(f"**No Encontradas:** {no_encontrados}")
+    st.write(f"**Errores en el procesamiento:** {errores}")
+    st.write(f"**Malignas:** {malignas} ({porcentaje_maligno:.2f}%)")
+    st.write(f"**Sospechosas:** {sospechosas} ({porcentaje_sospechoso:.2f}%)")
+    st.write(f"**Benignas:** {benignas} ({porcentaje_benigno:.2f}%)")
+    if resumen_triaje['tiempo_primer_hallazgo_s'] is not None:
+        st.write(f"**Tiempo hasta el primer hallazgo:** {resumen_triaje['tiempo_primer_hallazgo_s']:.2f} s")
+
+    # Las evaluaciones solo tienen sentido con etiquetas verdaderas en los nombres de archivo
+    if resultado['evaluar_con_nombres']:
+        evaluacion = resultado['evaluacion']
+        correct_primary = evaluacion['correct_primary']
+        incorrect_primary = evaluacion['incorrect_primary']
+        correct_secondary_masas = evaluacion['correct_secondary_masas']
+        incorrect_secondary_masas = evaluacion['incorrect_secondary_masas']
+        correct_secondary_calcificaciones = evaluacion['correct_secondary_calcificaciones']
+        incorrect_secondary_calcificaciones = evaluacion['incorrect_secondary_calcificaciones']
 
         # Mostrar precisión del modelo primario
         st.markdown("---")
@@ -257,268 +508,139 @@ def procesar_imagenes_masivas(uploaded_images, model_name_primary, model_name_se
         else:
             st.write("**Calcificaciones - No se realizaron predicciones secundarias.**")
 
-        # Generar el reporte PDF sin la Evaluación de los Modelos Secundarios
-        pdf_buffer = generar_reporte_pdf(
-            resultados_ordenados,
-            masas,
-            calcificaciones,
-            no_encontrados,
-            malignas,
-            sospechosas,
-            benignas,
-            porcentaje_maligno,
-            porcentaje_sospechoso,
-            porcentaje_benigno,
-            total
-        )
+    mostrar_descargas_reportes(resultado['reportes'])
 
-        # Descargar el PDF
-        st.download_button(
-            label="Descargar Reporte PDF",
-            data=pdf_buffer,
-            file_name="reporte_clasificacion_masiva.pdf",
-            mime="application/pdf"
-        )
-    else:
-        st.write("No se obtuvieron resultados de clasificación para las imágenes cargadas.")
-
-def generar_reporte_pdf(resultados_ordenados, masas, calcificaciones, no_encontrados, malignas, sospechosas, benignas,
-                        porcentaje_maligno, porcentaje_sospechoso, porcentaje_benigno, total):
+def crear_fila_resultado(nombre_archivo, mapped_result_primary, mapped_result_secondary):
     """
-    Genera un reporte PDF con los resultados de la clasificación masiva.
+    Crea la fila de resultados de una imagen a partir de su clasificación primaria y secundaria;
+    sin clasificación primaria la fila queda con la categoría 'error'.
     """
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-
-    # Título
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(0, 10, "Reporte de Clasificación Masiva", ln=True, align='C')
-    pdf.ln(10)
-
-    # Tabla de resultados
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(60, 10, "Nombre de Imagen", 1, 0, 'C')
-    pdf.cell(60, 10, "Categoría Primaria", 1, 0, 'C')
-    pdf.cell(60, 10, "Categoría Secundaria", 1, 1, 'C')
-
-    pdf.set_font("Arial", '', 12)
-    for res in resultados_ordenados:
-        pdf.cell(60, 10, res['nombre_archivo'], 1, 0, 'C')
-        pdf.cell(60, 10, res['categoria_primaria'].capitalize(), 1, 0, 'C')
-        sec_label = res['categoria_secundaria'].capitalize() if res['categoria_secundaria'] else 'No aplicable'
-        pdf.cell(60, 10, sec_label, 1, 1, 'C')
-
-    pdf.ln(10)
-
-    # Resumen
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(0, 10, "Resumen", ln=True)
-    pdf.set_font("Arial", '', 12)
-
-    pdf.cell(0, 10, f"Total de imágenes procesadas: {total}", ln=True)
-    pdf.cell(0, 10, f"Masas: {masas}", ln=True)
-    pdf.cell(0, 10, f"Calcificaciones: {calcificaciones}", ln=True)
-    pdf.cell(0, 10, f"No Encontradas: {no_encontrados}", ln=True)
-    pdf.cell(0, 10, f"Malignas: {malignas} ({porcentaje_maligno:.2f}%)", ln=True)
-    pdf.cell(0, 10, f"Sospechosas: {sospechosas} ({porcentaje_sospechoso:.2f}%)", ln=True)
-    pdf.cell(0, 10, f"Benignas: {benignas} ({porcentaje_benigno:.2f}%)", ln=True)
-
-    pdf.ln(10)
-
-    # Conclusiones
-    pdf.add_page()
-    pdf.set_font("Arial", 'B', 14)
-    pdf.cell(0, 10, "Conclusiones", ln=True)
-    pdf.set_font("Arial", '', 12)
-
-    recomendaciones = ""
-
-    if porcentaje_maligno > 30:
-        recomendaciones += (
-            "Se han identificado una alta proporción de hallazgos malignos en las imágenes analizadas. "
-            "Es imperativo que estos pacientes sean derivados para una evaluación médica inmediata y se considere "
-            "la realización de biopsias para confirmar el diagnóstico y determinar el tratamiento adecuado.\n\n"
-        )
-    elif porcentaje_maligno > 0:
-        recomendaciones += (
-            "Se han identificado hallazgos malignos que requieren atención médica especializada. "
-            "Se recomienda realizar evaluaciones adicionales y considerar tratamientos oportunos según el caso.\n\n"
-        )
-
-    if masas > 0 or calcificaciones > 0:
-        recomendaciones += (
-            "Los hallazgos identificados (masas y calcificaciones) deben ser evaluados por un especialista para determinar "
-            "la necesidad de intervenciones adicionales. El seguimiento regular es esencial para monitorear cualquier cambio "
-            "en los hallazgos observados.\n\n"
-        )
-
-    if not recomendaciones:
-        recomendaciones = (
-            "No se identificaron hallazgos significativos en las imágenes analizadas. Se recomienda continuar con "
-            "controles regulares según las indicaciones médicas para mantener una vigilancia adecuada de la salud mamaria."
-        )
-
-    pdf.multi_cell(0, 10, recomendaciones)
-
-    # Nota sobre la precisión del modelo
-    pdf.ln(5)
-    pdf.set_font("Arial", 'I', 12)
-    pdf.multi_cell(0, 10,
-                   "Nota: Este modelo tiene una precisión del 70% aproximadamente. Aunque es una herramienta útil para la clasificación inicial, puede cometer errores. Se recomienda que los resultados sean revisados y confirmados por un profesional de la salud.")
-
-    # Guardar el PDF en un buffer
-    pdf_content = pdf.output(dest='S').encode('latin1')
-    return pdf_content
-
-# Funciones auxiliares implementadas en este archivo
+    if not mapped_result_primary:
+        return {
+            'nombre_archivo': nombre_archivo,
+            'categoria_primaria': 'error',
+            'score_primario': None,
+            'categoria_secundaria': None,
+            'score_secundario': None,
+            'primary_correct': False
+        }
+    return {
+        'nombre_archivo': nombre_archivo,
+        'categoria_primaria': mapped_result_primary['label'],
+        'score_primario': float(mapped_result_primary['score']),
+        'categoria_secundaria': mapped_result_secondary['label'] if mapped_result_secondary else None,
+        'score_secundario': float(mapped_result_secondary['score']) if mapped_result_secondary else None,
+        'primary_correct': False
+    }
 
-def cargar_modelo(model_name):
+def mostrar_triaje(triaje):
     """
-    Carga un modelo de clasificación de imágenes desde Hugging Face.
+    Muestra los contadores de una instantánea del triaje y los hallazgos destacados,
+    con los malignos y sospechosos de mayor score primero.
     """
-    try:
-        # Determinar dispositivo
-        if torch.cuda.is_available():
-            device = 0  # GPU CUDA
-        elif torch.backends.mps.is_available():
-            device = "mps"  # GPU Apple MPS
-        else:
-            device = -1  # CPU
-
-        # Cargar el pipeline de clasificación de imágenes
-        classifier = pipeline("image-classification", model=model_name, device=device)
-        return classifier
-    except Exception as e:
-        st.error(f"Ocurrió un error al cargar el modelo {model_name}: {e}")
-        return None
-
-def procesar_archivo(imagen_file):
+    resumen = triaje['resumen']
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Procesadas", f"{resumen['procesados']} / {resumen['total']}")
+    col2.metric("Malignas", resumen['malignas'])
+    col3.metric("Sospechosas", resumen['sospechosas'])
+    col4.metric("Benignas", resumen['benignas'])
+    col5.metric("Errores", resumen['errores'])
+
+    if resumen['tiempo_primer_hallazgo_s'] is None:
+        st.caption("No hay hallazgos malignos ni sospechosos.")
+        return
+    st.caption(f"Primer hallazgo a los {resumen['tiempo_primer_hallazgo_s']:.2f} s "
+               f"({triaje['primer_hallazgo']['nombre_archivo']})")
+    st.dataframe(
+        [
+            {
+                'Archivo': fila['nombre_archivo'],
+                'Hallazgo': fila['categoria_primaria'],
+                'Categoría': fila['categoria_secundaria'],
+                'Score': fila['score_secundario']
+            }
+            for fila in triaje['destacados']
+        ],
+        width="stretch"
+    )
+
+def mostrar_descargas_reportes(reportes):
     """
-    Procesa un archivo de imagen en formato DICOM, PNG o JPG.
-    Devuelve la imagen para mostrar y la imagen procesada para clasificación.
+    Muestra los botones de descarga del PDF, el CSV y el Parquet con el tiempo de generación de cada uno.
     """
-    try:
-        # Obtener el nombre del archivo y su extensión
-        filename = imagen_file.name
-        extension = os.path.splitext(filename)[1].lower()
-
-        if extension in ['.dcm', '.dicom']:
-            # Procesar archivo DICOM
-            image_display, image_classification = leer_dicom(imagen_file)
-            return image_display, image_classification, 'DICOM'
-
-        elif extension in ['.png', '.jpg', '.jpeg']:
-            # Procesar archivo PNG o JPG
-            image_display, image_classification = leer_imagen(imagen_file)
-            return image_display, image_classification, 'PNG_JPG'
-
-        else:
-            st.error("Formato de archivo no soportado. Por favor, carga una imagen en formato DICOM, PNG o JPG.")
-            return None, None, None
-
-    except Exception as e:
-        logger.error(f"Error al procesar el archivo: {e}")
-        st.error(f"Error al procesar el archivo: {e}")
-        return None, None, None
-
-def leer_dicom(dicom_file):
+    descargas = [
+        ('pdf', "Descargar Reporte PDF", "reporte_clasificacion_masiva.pdf", "application/pdf"),
+        ('csv', "Descargar Resultados CSV", "resultados_clasificacion_masiva.csv", "text/csv"),
+        ('parquet', "Descargar Resultados Parquet", "resultados_clasificacion_masiva.parquet", "application/vnd.apache.parquet")
+    ]
+    columnas = st.columns(len(descargas))
+    for columna, (formato, etiqueta, nombre, mime) in zip(columnas, descargas):
+        if formato not in reportes:
+            columna.caption("Parquet no disponible (requiere pyarrow).")
+            continue
+        contenido, segundos = reportes[formato]
+        columna.download_button(label=etiqueta, data=contenido, file_name=nombre, mime=mime)
+        columna.caption(f"{len(contenido) / 1024:.0f} KB generados en {segundos:.2f} s")
+
+def mostrar_indice_cabeceras(indice, tiempo_indice):
     """
-    Lee un archivo DICOM y devuelve la imagen para mostrar y para clasificación.
+    Muestra la composición del lote a partir del índice de cabeceras y avisa de los archivos no soportados.
     """
-    try:
-        # Leer el archivo DICOM desde el objeto UploadedFile
-        dicom = pydicom.dcmread(dicom_file)
-        original_image = dicom.pixel_array
-
-        # Aplicar VOI LUT si está disponible
-        if hasattr(pydicom.pixel_data_handlers, 'apply_voi_lut'):
-            img_windowed = pydicom.pixel_data_handlers.apply_voi_lut(original_image, dicom)
-        else:
-            img_windowed = original_image
-
-        # Manejar Photometric Interpretation
-        photometric_interpretation = dicom.get('PhotometricInterpretation', 'UNKNOWN')
-        if photometric_interpretation == 'MONOCHROME1':
-            img_windowed = np.max(img_windowed) - img_windowed
-
-        # Normalizar la imagen para mostrar
-        img_normalized_display = (img_windowed - np.min(img_windowed)) / (np.max(img_windowed) - np.min(img_windowed))
-        img_normalized_display = (img_normalized_display * 255).astype(np.uint8)
-
-        # Crear imagen para mostrar sin redimensionar
-        image_display = Image.fromarray(img_normalized_display).convert('L')
-
-        # Imagen para clasificación (redimensionada a 224x224)
-        image_classification = image_display.resize((224, 224)).convert('RGB')
-
-        return image_display, image_classification
-
-    except Exception as e:
-        logger.error(f"Error al procesar el archivo DICOM: {e}")
-        st.error(f"Error al procesar el archivo DICOM: {e}")
-        return None, None
+    resumen = resumir_indice(indice)
+    with st.expander("Composición del lote"):
+        st.caption(f"{resumen['archivos']} cabeceras leídas en {tiempo_indice:.2f} s")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Pacientes", resumen['pacientes'])
+        col2.metric("Estudios", resumen['estudios'])
+        col3.metric("Series", resumen['series'])
+        col4.metric("Megapíxeles", f"{resumen['megapixeles']:.0f}")
+        st.write(f"**Por tipo:** {resumen['por_tipo']}")
+        st.write(f"**Por sintaxis de transferencia:** {resumen['por_sintaxis']}")
+        if resumen['por_vista']:
+            st.write(f"**Por lateralidad y vista:** {resumen['por_vista']}")
+        st.dataframe(indice, width="stretch")
+
+    if resumen['no_soportados']:
+        st.warning(
+            f"{len(resumen['no_soportados'])} archivo(s) no soportado(s) no se decodificarán: " +
+            "; ".join(f"{nombre} ({motivo})" for nombre, motivo in resumen['no_soportados'][:10]) +
+            (" ..." if len(resumen['no_soportados']) > 10 else "")
+        )
 
-def leer_imagen(imagen_file):
+def mostrar_rendimiento_canalizacion(estadisticas, resumen_triaje=None):
     """
-    Lee una imagen PNG o JPG y devuelve la imagen para mostrar y para clasificación.
+    Muestra el rendimiento de las etapas de decodificación e inferencia y, si se indica el resumen del triaje,
+    los tiempos hasta el primer resultado y el primer hallazgo.
     """
-    try:
-        # Leer la imagen usando PIL
-        image_display = Image.open(imagen_file).convert('RGB')
-
-        # Imagen para clasificación (redimensionada a 224x224)
-        image_classification = image_display.resize((224, 224))
+    with st.expander("Rendimiento de la canalización"):
+        st.write(f"**Imágenes:** {estadisticas['imagenes']} en {estadisticas['tiempo_total']:.2f} s "
+                 f"({estadisticas['global_img_s']:.2f} img/s)")
+        if resumen_triaje and resumen_triaje['tiempo_primer_resultado_s'] is not None:
+            primer_hallazgo = resumen_triaje['tiempo_primer_hallazgo_s']
+            st.write(f"**Primer resultado:** {resumen_triaje['tiempo_primer_resultado_s']:.2f} s; "
+                     f"**primer hallazgo:** " + (f"{primer_hallazgo:.2f} s" if primer_hallazgo is not None else "ninguno"))
+        st.write(f"**Decodificación:** {estadisticas['decodificacion_img_s']:.2f} img/s por hilo "
+                 f"con {estadisticas['trabajadores']} hilos (cola de {estadisticas['profundidad_cola']})")
+        st.write(f"**Inferencia:** {estadisticas['inferencia_img_s']:.2f} img/s, "
+                 f"{estadisticas['tiempo_espera_inferencia']:.2f} s esperando imágenes decodificadas")
+        if estadisticas['pico_rss_mb'] is not None:
+            st.write(f"**Pico de memoria (RSS):** {estadisticas['pico_rss_mb']:.0f} MB")
+            if len(estadisticas['pico_rss_mb_lotes']) > 1:
+                st.caption("Pico de RSS por lote (MB)")
+                st.line_chart(estadisticas['pico_rss_mb_lotes'])
 
-        return image_display, image_classification
-    except Exception as e:
-        logger.error(f"Error al procesar la imagen: {e}")
-        st.error(f"Error al procesar la imagen: {e}")
-        return None, None
+# Funciones auxiliares implementadas en este archivo
 
-def clasificar_imagen(image, classifier, prediction_mapping):
+def cargar_modelo(model_name, avisos):
     """
-    Realiza la inferencia sobre una imagen y mapea las etiquetas predichas.
+    Carga un modelo de clasificación de imágenes desde Hugging Face.
+    El modelo se reutiliza entre reruns y sesiones a través del registro de modelos.
+    Se ejecuta dentro del trabajo, sin Streamlit: los errores se añaden a avisos para mostrarlos al terminar.
     """
     try:
-        resultado = classifier(image)
-        if len(resultado) == 0:
-            return None
-        top_result = resultado[0]
-        pred_label_normalized = top_result['label'].lower()
-        mapped_label = prediction_mapping.get(pred_label_normalized, pred_label_normalized)
-        return {
-            'label': mapped_label,
-            'score': top_result['score']
-        }
+        # Obtener el pipeline del registro compartido (se carga una sola vez por proceso)
+        return obtener_modelo(model_name)
     except Exception as e:
-        logger.error(f"Error durante la clasificación: {e}")
+        logger.error(f"Ocurrió un error al cargar el modelo {model_name}: {e}")
+        avisos.append(f"Ocurrió un error al cargar el modelo {model_name}: {e}")
         return None
-
-def determinar_ground_truth(nombre_archivo):
-    """
-    Determina la etiqueta verdadera primaria basada en el prefijo del nombre del archivo.
-    """
-    nombre_archivo = nombre_archivo.lower()
-    if nombre_archivo.startswith('mass_'):
-        return 'masas'
-    elif nombre_archivo.startswith('calc_'):
-        return 'calcificaciones'
-    elif nombre_archivo.startswith('no_'):
-        return 'no_encontrado'
-    else:
-        return 'no_encontrado'
-
-def determinar_ground_truth_secondary(nombre_archivo, categoria_primaria):
-    """
-    Determina la etiqueta verdadera secundaria basada en el nombre del archivo y la categoría primaria.
-    """
-    nombre_archivo = nombre_archivo.lower()
-    partes = nombre_archivo.split('_')
-
-    if categoria_primaria == 'masas' and len(partes) >= 2:
-        return partes[1]
-    elif categoria_primaria == 'calcificaciones' and len(partes) >= 2:
-        return partes[1]
-    else:
-        return None  # No aplica o no está definido
@@ -0,0 +1,186 @@
+# src/modulos/puntos_control.py
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from src.modulos.configuracion import RUTA_PUNTOS_CONTROL, INTERVALO_PUNTOS_CONTROL, DIAS_PUNTOS_CONTROL
+
+logger = logging.getLogger(__name__)
+
+# Puntos de control de la clasificación masiva: los resultados por imagen de una ejecución se guardan en SQLite
+# cada INTERVALO_PUNTOS_CONTROL segundos, con la huella de la ejecución (archivos de entrada, opciones y modelos)
+# como clave. Si el proceso muere o el trabajo se cancela, una nueva ejecución con la misma huella recupera
+# los resultados guardados y solo clasifica las imágenes que faltan. Al terminar, el punto de control se descarta.
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS ejecuciones (
+    huella TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    transcurrido REAL NOT NULL,
+    creada REAL NOT NULL,
+    actualizada REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS resultados (
+    huella TEXT NOT NULL,
+    indice INTEGER NOT NULL,
+    nombre_archivo TEXT NOT NULL,
+    categoria_primaria TEXT NOT NULL,
+    score_primario REAL,
+    categoria_secundaria TEXT,
+    score_secundario REAL,
+    error TEXT,
+    tiempo REAL NOT NULL,
+    PRIMARY KEY (huella, indice)
+);
+"""
+
+_CAMPOS = ('nombre_archivo', 'categoria_primaria', 'score_primario', 'categoria_secundaria', 'score_secundario')
+
+class AlmacenPuntosControl:
+    """
+    Base de datos SQLite con los puntos de control de todas las ejecuciones del proceso.
+    """
+
+    def __init__(self, ruta, dias=DIAS_PUNTOS_CONTROL):
+        self.ruta = ruta
+        self._candado = threading.Lock()
+
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.executescript(_ESQUEMA)
+        self._purgar(time.time() - dias * 86400)
+        self._conexion.commit()
+
+    def _purgar(self, limite):
+        # Ejecuciones abandonadas: nadie volvió a enviarlas en DIAS_PUNTOS_CONTROL días
+        antiguas = [fila[0] for fila in self._conexion.execute(
+            "SELECT huella FROM ejecuciones WHERE actualizada < ?", (limite,))]
+        for huella in antiguas:
+            self._descartar(huella)
+        if antiguas:
+            logger.info(f"Descartados {len(antiguas)} puntos de control antiguos")
+
+    def cargar(self, huella):
+        """
+        Devuelve ({indice: (fila, error, tiempo)}, transcurrido, creada) con los resultados guardados de la
+        ejecución, donde transcurrido es el tiempo de ejecución acumulado (s) y creada el instante (time.time())
+        en que empezó la ejecución original; ({}, 0.0, None) si no hay punto de control.
+        """
+        with self._candado:
+            ejecucion = self._conexion.execute(
+                "SELECT transcurrido, creada FROM ejecuciones WHERE huella = ?", (huella,)).fetchone()
+            if ejecucion is None:
+                return {}, 0.0, None
+            filas = self._conexion.execute(
+                f"SELECT indice, {', '.join(_CAMPOS)}, error, tiempo FROM resultados WHERE huella = ?", (huella,)
+            ).fetchall()
+        guardados = {}
+        for indice, *valores, error, tiempo in filas:
+            fila = dict(zip(_CAMPOS, valores))
+            fila['primary_correct'] = False
+            guardados[indice] = (fila, error, tiempo)
+        return guardados, ejecucion[0], ejecucion[1]
+
+    def guardar(self, huella, total, entradas, transcurrido, creada=None):
+        """
+        Añade a la ejecución una lista de (indice, fila, error, tiempo) y actualiza su tiempo acumulado.
+        creada es el inicio de la ejecución (por defecto, ahora); solo se guarda la primera vez.
+        """
+        ahora = time.time()
+        with self._candado:
+            self._conexion.execute(
+                "INSERT INTO ejecuciones (huella, total, transcurrido, creada, actualizada) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (huella) DO UPDATE SET transcurrido = excluded.transcurrido, actualizada = excluded.actualizada",
+                (huella, total, transcurrido, ahora if creada is None else creada, ahora)
+            )
+            self._conexion.executemany(
+                f"INSERT OR REPLACE INTO resultados (huella, indice, {', '.join(_CAMPOS)}, error, tiempo) "
+                f"VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(huella, indice, *(fila[campo] for campo in _CAMPOS), error, tiempo)
+                 for indice, fila, error, tiempo in entradas]
+            )
+            self._conexion.commit()
+
+    def _descartar(self, huella):
+        self._conexion.execute("DELETE FROM resultados WHERE huella = ?", (huella,))
+        self._conexion.execute("DELETE FROM ejecuciones WHERE huella = ?", (huella,))
+
+    def descartar(self, huella):
+        with self._candado:
+            self._descartar(huella)
+            self._conexion.commit()
+
+class PuntoControl:
+    """
+    Punto de control de una ejecución: acumula los resultados por imagen y los guarda en el almacén
+    como mucho cada intervalo segundos (y siempre al llamar a volcar()). creada es el inicio de la ejecución
+    original: el momento en que se creó o, tras cargar(), el guardado en el almacén.
+    """
+
+    def __init__(self, almacen, huella, total, intervalo=INTERVALO_PUNTOS_CONTROL):
+        self.almacen = almacen
+        self.huella = huella
+        self.total = total
+        self.intervalo = intervalo
+        self.creada = time.time()
+        self._pendientes = []
+        self._ultimo_volcado = time.perf_counter()
+
+    def cargar(self):
+        """
+        Devuelve ({indice: (fila, error, tiempo)}, transcurrido) con los resultados guardados de la ejecución.
+        """
+        guardados, transcurrido, creada = self.almacen.cargar(self.huella)
+        if creada is not None:
+            self.creada = creada
+        return guardados, transcurrido
+
+    def registrar(self, entradas, transcurrido):
+        """
+        Añade una lista de (indice, fila, error, tiempo) y la guarda si pasó el intervalo desde el último volcado.
+        """
+        self._pendientes.extend(entradas)
+        if time.perf_counter() - self._ultimo_volcado >= self.intervalo:
+            self.volcar(transcurrido)
+
+    def volcar(self, transcurrido):
+        if not self._pendientes:
+            return
+        try:
+            self.almacen.guardar(self.huella, self.total, self._pendientes, transcurrido, self.creada)
+            logger.info(f"Punto de control {self.huella[:12]}: {len(self._pendientes)} resultados guardados")
+        except sqlite3.Error as e:
+            # Un fallo del punto de control no debe interrumpir la clasificación
+            logger.error(f"No se pudo guardar el punto de control: {e}")
+            return
+        self._pendientes.clear()
+        self._ultimo_volcado = time.perf_counter()
+
+    def descartar(self):
+        self._pendientes.clear()
+        self.almacen.descartar(self.huella)
+
+_almacenes = {}
+_candado_almacenes = threading.Lock()
+
+def obtener_almacen_puntos_control(ruta=None):
+    """
+    Devuelve el almacén de puntos de control compartido por el proceso, o None si están desactivados.
+    """
+    ruta = ruta or RUTA_PUNTOS_CONTROL
+    if not ruta:
+        return None
+    with _candado_almacenes:
+        if ruta not in _almacenes:
+            try:
+                _almacenes[ruta] = AlmacenPuntosControl(ruta)
+            except Exception as e:
+                logger.error(f"No se pudo abrir el almacén de puntos de control en {ruta}: {e}")
+                return None
+        return _almacenes[ruta]
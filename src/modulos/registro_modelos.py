@@ -0,0 +1,150 @@
+# src/modulos/registro_modelos.py
+
+import gc
+import logging
+import os
+import threading
+import time
+
+import torch
+
+from src.modulos.configuracion import DISPOSITIVO, REVISION_MODELOS
+from src.modulos.backends import backend_modelo, crear_clasificador
+
+logger = logging.getLogger(__name__)
+
+# Registro compartido por todo el proceso: clave (modelo, revisión, dispositivo, backend) -> entrada
+_modelos = {}
+# Protege el diccionario de modelos y el diccionario de candados de carga
+_candado_registro = threading.Lock()
+# Un candado por clave para que dos sesiones no carguen el mismo modelo a la vez
+_candados_carga = {}
+
+def determinar_dispositivo():
+    """
+    Determina el dispositivo de inferencia disponible.
+    """
+    if DISPOSITIVO:
+        return DISPOSITIVO
+    if torch.cuda.is_available():
+        return 0  # GPU CUDA
+    elif torch.backends.mps.is_available():
+        return "mps"  # GPU Apple MPS
+    return -1  # CPU
+
+def _clave(model_name, revision, device, backend):
+    if revision is None:
+        revision = REVISION_MODELOS
+    if device is None:
+        device = determinar_dispositivo()
+    if backend is None:
+        backend = backend_modelo(model_name)
+    return (model_name, revision, str(device), backend), revision, device, backend
+
+def _bytes_modelo(classifier):
+    """
+    Calcula la memoria ocupada por los parámetros y buffers del modelo (el archivo en el backend ONNX).
+    """
+    ruta_onnx = getattr(classifier, 'ruta_onnx', None)
+    if ruta_onnx is not None:
+        return os.path.getsize(ruta_onnx)
+    modelo = getattr(classifier, 'model', None)
+    if modelo is None or not hasattr(modelo, 'parameters'):
+        return 0
+    total = sum(p.numel() * p.element_size() for p in modelo.parameters())
+    total += sum(b.numel() * b.element_size() for b in modelo.buffers())
+    # Las capas cuantizadas dinámicamente guardan los pesos empaquetados fuera de parameters()
+    for modulo in modelo.modules():
+        if hasattr(modulo, '_packed_params') and callable(getattr(modulo, 'weight', None)):
+            peso = modulo.weight()
+            total += peso.numel() * peso.element_size()
+    return total
+
+def obtener_modelo(model_name, revision=None, device=None, backend=None):
+    """
+    Devuelve el pipeline de clasificación del modelo, cargándolo solo la primera vez en el proceso.
+    backend es 'pytorch', 'pytorch_int8' u 'onnx'; por defecto, el configurado para el modelo.
+    """
+    clave, revision, device, backend = _clave(model_name, revision, device, backend)
+
+    with _candado_registro:
+        entrada = _modelos.get(clave)
+        if entrada is not None:
+            entrada['usos'] += 1
+            return entrada['clasificador']
+        candado_carga = _candados_carga.setdefault(clave, threading.Lock())
+
+    with candado_carga:
+        # Otra sesión pudo terminar la carga mientras esperábamos el candado
+        with _candado_registro:
+            entrada = _modelos.get(clave)
+            if entrada is not None:
+                entrada['usos'] += 1
+                return entrada['clasificador']
+
+        inicio = time.perf_counter()
+        classifier = crear_clasificador(model_name, revision, device, backend)
+        tiempo_carga = time.perf_counter() - inicio
+        logger.info(f"Modelo {model_name} ({backend}) cargado en {tiempo_carga:.2f} s")
+
+        with _candado_registro:
+            _modelos[clave] = {
+                'clasificador': classifier,
+                'tiempo_carga': tiempo_carga,
+                'bytes': _bytes_modelo(classifier),
+                'cargado_en': time.time(),
+                'usos': 1
+            }
+        return classifier
+
+def liberar_modelo(model_name, revision=None, device=None, backend=None):
+    """
+    Elimina un modelo del registro. Devuelve True si estaba cargado.
+    """
+    clave, _, _, _ = _clave(model_name, revision, device, backend)
+    with _candado_registro:
+        entrada = _modelos.pop(clave, None)
+    if entrada is None:
+        return False
+    del entrada
+    _liberar_memoria()
+    return True
+
+def liberar_todos():
+    """
+    Elimina todos los modelos del registro.
+    """
+    with _candado_registro:
+        _modelos.clear()
+    _liberar_memoria()
+
+def recargar_modelo(model_name, revision=None, device=None, backend=None):
+    """
+    Descarta la instancia actual del modelo y la vuelve a cargar.
+    """
+    liberar_modelo(model_name, revision, device, backend)
+    return obtener_modelo(model_name, revision, device, backend)
+
+def estadisticas_modelos():
+    """
+    Devuelve el tiempo de carga, la memoria y el número de usos de cada modelo cargado.
+    """
+    with _candado_registro:
+        return [
+            {
+                'modelo': clave[0],
+                'revision': clave[1] or 'main',
+                'dispositivo': clave[2],
+                'backend': clave[3],
+                'tiempo_carga': entrada['tiempo_carga'],
+                'memoria_mb': entrada['bytes'] / (1024 * 1024),
+                'usos': entrada['usos'],
+                'cargado_en': entrada['cargado_en']
+            }
+            for clave, entrada in _modelos.items()
+        ]
+
+def _liberar_memoria():
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
@@ -0,0 +1,355 @@
+# src/modulos/reportes.py
+
+import csv
+import io
+import logging
+import time
+import unicodedata
+from datetime import datetime
+from itertools import islice
+
+from fpdf import FPDF
+
+from src.modulos.configuracion import MAX_FILAS_REPORTE_PDF
+from src.modulos.metricas import cronometrado
+
+logger = logging.getLogger(__name__)
+
+# Reportes de la clasificación masiva: PDF con el resumen primero y una tabla compacta a dos columnas,
+# y los resultados por imagen en CSV y Parquet.
+# Las tablas se construyen por bloques de FILAS_POR_BLOQUE filas: los resultados pueden ser un generador y
+# solo se formatea un bloque a la vez. fpdf mantiene el documento completo en memoria hasta el final, así que
+# la tabla del PDF se limita a MAX_FILAS_REPORTE_PDF filas y la memoria del PDF no crece con el lote; el CSV y el
+# Parquet sí contienen todas las filas. El PDF usa las fuentes base de fpdf (latin-1), así que todo el texto
+# pasa por texto_pdf antes de escribirse.
+
+FILAS_POR_BLOQUE = 1000
+
+# Columnas de los resultados por imagen y su tipo en Parquet
+CAMPOS_RESULTADOS = {
+    'nombre_archivo': 'string',
+    'categoria_primaria': 'string',
+    'score_primario': 'float64',
+    'categoria_secundaria': 'string',
+    'score_secundario': 'float64',
+    'primary_correct': 'bool'
+}
+
+# Geometría de la tabla del PDF (mm): dos grupos de columnas por página
+ALTO_FILA = 4.5
+COLUMNAS_TABLA = [('Imagen', 47), ('Primaria', 23), ('Secundaria', 23)]
+SEPARACION_GRUPOS = 4
+
+def bloques(filas, tamano=FILAS_POR_BLOQUE):
+    """
+    Divide un iterable en listas de como mucho tamano elementos.
+    """
+    iterador = iter(filas)
+    while True:
+        bloque = list(islice(iterador, tamano))
+        if not bloque:
+            return
+        yield bloque
+
+def texto_pdf(texto):
+    """
+    Devuelve el texto representable en latin-1: los caracteres que no lo son se sustituyen por su letra base
+    (ő -> o) o, si no tienen, por '?'.
+    """
+    texto = str(texto)
+    try:
+        texto.encode('latin-1')
+        return texto
+    except UnicodeEncodeError:
+        pass
+    return ''.join(
+        caracter if ord(caracter) < 256
+        else unicodedata.normalize('NFKD', caracter).encode('latin-1', 'ignore').decode('latin-1')[:1] or '?'
+        for caracter in texto
+    )
+
+def _categoria(valor, por_defecto='No aplicable'):
+    return valor.capitalize() if valor else por_defecto
+
+class _ReportePDF(FPDF):
+    """
+    FPDF con pie de página numerado y fecha de creación fija (fecha), para que el mismo reporte
+    generado de nuevo, por ejemplo al retomar una ejecución, dé el mismo archivo.
+    """
+
+    def __init__(self, fecha, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fecha = fecha
+
+    def _putinfo(self):
+        # fpdf 1.7 escribe /CreationDate con datetime.now() al final del diccionario de información
+        # (método interno de fpdf 1.7.2, versión fijada en requirements.txt)
+        super()._putinfo()
+        if isinstance(getattr(self, 'buffer', None), str) and '/CreationDate ' in self.buffer:
+            self.buffer = self.buffer[:self.buffer.rindex('/CreationDate ')]
+            self._out('/CreationDate ' + self._textstring(f"D:{self.fecha:%Y%m%d%H%M%S}"))
+
+    def footer(self):
+        self.set_y(-10)
+        self.set_font("Arial", 'I', 7)
+        self.cell(0, 5, f"Página {self.page_no()}", 0, 0, 'C')
+
+def _recortar(pdf, texto, ancho):
+    # Recorta el texto con "..." para que quepa en la celda (con 1 mm de margen a cada lado).
+    # Una sola pasada por los anchos de carácter de la fuente actual, en lugar de un get_string_width por intento
+    texto = texto_pdf(texto)
+    anchos = pdf.current_font['cw']
+    escala = pdf.font_size / 1000
+    disponible = (ancho - 2) / escala
+    if sum(anchos.get(caracter, 0) for caracter in texto) <= disponible:
+        return texto
+    disponible -= 3 * anchos['.']
+    acumulado = 0
+    for posicion, caracter in enumerate(texto):
+        acumulado += anchos.get(caracter, 0)
+        if acumulado > disponible:
+            return texto[:posicion] + '...'
+    return texto
+
+def _encabezado_tabla(pdf, x_grupos, y):
+    pdf.set_font("Arial", 'B', 7)
+    pdf.set_fill_color(220, 220, 220)
+    for x in x_grupos:
+        pdf.set_xy(x, y)
+        for titulo, ancho in COLUMNAS_TABLA:
+            pdf.cell(ancho, ALTO_FILA, titulo, 1, 0, 'C', 1)
+    pdf.set_font("Arial", '', 7)
+
+def _tabla_resultados(pdf, resultados, max_filas=None):
+    """
+    Escribe la tabla de resultados en páginas nuevas, a dos grupos de columnas (primero se llena el izquierdo).
+    Con max_filas solo se consumen y escriben las primeras max_filas filas.
+    """
+    ancho_grupo = sum(ancho for _, ancho in COLUMNAS_TABLA)
+    x_grupos = [pdf.l_margin, pdf.l_margin + ancho_grupo + SEPARACION_GRUPOS]
+    y_inicio = pdf.t_margin
+    filas_por_grupo = int((pdf.h - pdf.t_margin - 15) // ALTO_FILA) - 1
+    filas_por_pagina = filas_por_grupo * len(x_grupos)
+
+    # Saltos de página manuales: la posición de cada fila se calcula
+    pdf.set_auto_page_break(False)
+    posicion = 0
+    for bloque in bloques(islice(resultados, max_filas)):
+        for res in bloque:
+            en_pagina = posicion % filas_por_pagina
+            if en_pagina == 0:
+                pdf.add_page()
+                _encabezado_tabla(pdf, x_grupos, y_inicio)
+            grupo, fila = divmod(en_pagina, filas_por_grupo)
+            pdf.set_xy(x_grupos[grupo], y_inicio + (fila + 1) * ALTO_FILA)
+            pdf.cell(COLUMNAS_TABLA[0][1], ALTO_FILA, _recortar(pdf, res['nombre_archivo'], COLUMNAS_TABLA[0][1]), 1, 0, 'L')
+            pdf.cell(COLUMNAS_TABLA[1][1], ALTO_FILA, texto_pdf(_categoria(res['categoria_primaria'], '')), 1, 0, 'C')
+            pdf.cell(COLUMNAS_TABLA[2][1], ALTO_FILA, texto_pdf(_categoria(res['categoria_secundaria'])), 1, 0, 'C')
+            posicion += 1
+    pdf.set_auto_page_break(True, margin=15)
+    return posicion
+
+def _conclusiones(porcentaje_maligno, masas, calcificaciones):
+    recomendaciones = ""
+
+    if porcentaje_maligno > 30:
+        recomendaciones += (
+            "Se han identificado una alta proporción de hallazgos malignos en las imágenes analizadas. "
+            "Es imperativo que estos pacientes sean derivados para una evaluación médica inmediata y se considere "
+            "la realización de biopsias para confirmar el diagnóstico y determinar el tratamiento adecuado.\n\n"
+        )
+    elif porcentaje_maligno > 0:
+        recomendaciones += (
+            "Se han identificado hallazgos malignos que requieren atención médica especializada. "
+            "Se recomienda realizar evaluaciones adicionales y considerar tratamientos oportunos según el caso.\n\n"
+        )
+
+    if masas > 0 or calcificaciones > 0:
+        recomendaciones += (
+            "Los hallazgos identificados (masas y calcificaciones) deben ser evaluados por un especialista para determinar "
+            "la necesidad de intervenciones adicionales. El seguimiento regular es esencial para monitorear cualquier cambio "
+            "en los hallazgos observados.\n\n"
+        )
+
+    if not recomendaciones:
+        recomendaciones = (
+            "No se identificaron hallazgos significativos en las imágenes analizadas. Se recomienda continuar con "
+            "controles regulares según las indicaciones médicas para mantener una vigilancia adecuada de la salud mamaria."
+        )
+    return recomendaciones.rstrip()
+
+@cronometrado('reporte_pdf')
+def generar_reporte_pdf(resultados_ordenados, masas, calcificaciones, no_encontrados, malignas, sospechosas, benignas,
+                        porcentaje_maligno, porcentaje_sospechoso, porcentaje_benigno, total, fecha=None,
+                        max_filas=MAX_FILAS_REPORTE_PDF):
+    """
+    Genera un reporte PDF con los resultados de la clasificación masiva y devuelve sus bytes.
+    La primera página contiene el resumen, las conclusiones y la nota sobre la precisión; después sigue la
+    tabla de resultados por imagen en el orden recibido. resultados_ordenados puede ser cualquier iterable.
+    fecha (datetime) es la fecha de la ejecución que figura en el reporte; por defecto, la actual.
+    La tabla incluye como mucho max_filas imágenes (None, todas); si el lote es mayor se indica en la primera página.
+    """
+    fecha = datetime.now() if fecha is None else fecha
+    pdf = _ReportePDF(fecha)
+    pdf.set_margins(10, 12, 10)
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+
+    # Título
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(0, 10, "Reporte de Clasificación Masiva", ln=True, align='C')
+    pdf.set_font("Arial", '', 9)
+    pdf.cell(0, 5, f"Generado el {fecha:%d/%m/%Y %H:%M}", ln=True, align='C')
+    pdf.ln(6)
+
+    # Resumen en una tabla de dos columnas
+    pdf.set_font("Arial", 'B', 13)
+    pdf.cell(0, 8, "Resumen", ln=True)
+    pdf.set_font("Arial", '', 10)
+    filas_resumen = [
+        ("Total de imágenes procesadas", f"{total}"),
+        ("Masas", f"{masas}"),
+        ("Calcificaciones", f"{calcificaciones}"),
+        ("No Encontradas", f"{no_encontrados}"),
+        ("Malignas", f"{malignas} ({porcentaje_maligno:.2f}%)"),
+        ("Sospechosas", f"{sospechosas} ({porcentaje_sospechoso:.2f}%)"),
+        ("Benignas", f"{benignas} ({porcentaje_benigno:.2f}%)")
+    ]
+    for etiqueta, valor in filas_resumen:
+        pdf.cell(70, 7, etiqueta, 1, 0, 'L')
+        pdf.cell(40, 7, valor, 1, 1, 'R')
+    pdf.ln(6)
+
+    # Conclusiones
+    pdf.set_font("Arial", 'B', 13)
+    pdf.cell(0, 8, "Conclusiones", ln=True)
+    pdf.set_font("Arial", '', 10)
+    pdf.multi_cell(0, 6, _conclusiones(porcentaje_maligno, masas, calcificaciones))
+
+    # Nota sobre la precisión del modelo
+    pdf.ln(4)
+    pdf.set_font("Arial", 'I', 10)
+    pdf.multi_cell(0, 6,
+                   "Nota: Este modelo tiene una precisión del 70% aproximadamente. Aunque es una herramienta útil para la clasificación inicial, puede cometer errores. Se recomienda que los resultados sean revisados y confirmados por un profesional de la salud.")
+
+    # Aviso si la tabla no incluye todas las imágenes
+    if max_filas is not None and total > max_filas:
+        pdf.ln(2)
+        pdf.multi_cell(0, 6,
+                       f"La tabla siguiente incluye las primeras {max_filas} de las {total} imágenes, por orden de prioridad. "
+                       "El listado completo está en los reportes CSV y Parquet.")
+
+    # Tabla de resultados por imagen
+    _tabla_resultados(pdf, resultados_ordenados, max_filas)
+
+    return pdf.output(dest='S').encode('latin1')
+
+def escribir_csv(resultados, destino, campos=CAMPOS_RESULTADOS):
+    """
+    Escribe los resultados por imagen en CSV (UTF-8) en un archivo de texto abierto, bloque a bloque.
+    Devuelve el número de filas.
+    """
+    escritor = csv.DictWriter(destino, fieldnames=list(campos), extrasaction='ignore')
+    escritor.writeheader()
+    filas = 0
+    for bloque in bloques(resultados):
+        escritor.writerows(bloque)
+        filas += len(bloque)
+    return filas
+
+def generar_csv(resultados, campos=CAMPOS_RESULTADOS):
+    """
+    Devuelve los resultados por imagen en CSV como bytes UTF-8 (con BOM, para que Excel detecte la codificación).
+    """
+    buffer = io.StringIO()
+    escribir_csv(resultados, buffer, campos)
+    return buffer.getvalue().encode('utf-8-sig')
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError("La exportación a Parquet requiere el paquete pyarrow (pip install pyarrow).") from e
+    return pyarrow
+
+def parquet_disponible():
+    try:
+        _pyarrow()
+        return True
+    except ImportError:
+        return False
+
+class EscritorParquet:
+    """
+    Escribe filas (diccionarios) en un archivo Parquet, un grupo de filas por cada FILAS_POR_BLOQUE filas,
+    de modo que la memoria no crece con el número de resultados. campos asocia cada columna a su tipo de Arrow.
+    """
+
+    def __init__(self, destino, campos=CAMPOS_RESULTADOS, filas_por_grupo=FILAS_POR_BLOQUE):
+        pa = _pyarrow()
+        self._pa = pa
+        self.campos = dict(campos)
+        self.esquema = pa.schema([(campo, pa.type_for_alias(tipo)) for campo, tipo in self.campos.items()])
+        self.escritor = pa.parquet.ParquetWriter(destino, self.esquema, compression='zstd')
+        self.filas_por_grupo = filas_por_grupo
+        self.pendientes = []
+        self.filas = 0
+
+    def escribir(self, fila):
+        self.pendientes.append(fila)
+        if len(self.pendientes) >= self.filas_por_grupo:
+            self._volcar()
+
+    def escribir_varias(self, filas):
+        for fila in filas:
+            self.escribir(fila)
+
+    def _volcar(self):
+        if not self.pendientes:
+            return
+        columnas = {campo: [fila.get(campo) for fila in self.pendientes] for campo in self.campos}
+        self.escritor.write_table(self._pa.Table.from_pydict(columnas, schema=self.esquema))
+        self.filas += len(self.pendientes)
+        self.pendientes = []
+
+    def cerrar(self):
+        self._volcar()
+        self.escritor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        self.cerrar()
+        return False
+
+def generar_parquet(resultados, campos=CAMPOS_RESULTADOS):
+    """
+    Devuelve los resultados por imagen en formato Parquet (bytes). Requiere pyarrow.
+    """
+    buffer = io.BytesIO()
+    with EscritorParquet(buffer, campos) as escritor:
+        escritor.escribir_varias(resultados)
+    return buffer.getvalue()
+
+def generar_reportes(resultados, formatos=('pdf', 'csv', 'parquet'), **resumen):
+    """
+    Genera los reportes indicados a partir de los mismos resultados (una lista, que se recorre una vez por
+    formato) y devuelve {formato: (bytes, segundos)}. resumen son los argumentos de generar_reporte_pdf
+    distintos de los resultados. Si pyarrow no está instalado se omite el Parquet.
+    """
+    generadores = {
+        'pdf': lambda: generar_reporte_pdf(resultados, **resumen),
+        'csv': lambda: generar_csv(resultados),
+        'parquet': lambda: generar_parquet(resultados)
+    }
+    reportes = {}
+    for formato in formatos:
+        if formato == 'parquet' and not parquet_disponible():
+            logger.warning("pyarrow no está instalado: se omite el reporte Parquet")
+            continue
+        inicio = time.perf_counter()
+        contenido = generadores[formato]()
+        reportes[formato] = (contenido, time.perf_counter() - inicio)
+    return reportes
@@ -0,0 +1,257 @@
+# src/modulos/trabajos.py
+
+import hashlib
+import io
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from src.modulos.configuracion import NUM_TRABAJOS_SIMULTANEOS, MAX_TRABAJOS_TERMINADOS
+
+logger = logging.getLogger(__name__)
+
+# Ejecución de trabajos largos (clasificación masiva) fuera del hilo del script de Streamlit. Un rerun o una
+# segunda pestaña no interrumpen el trabajo: la interfaz solo guarda su identificador y consulta su estado.
+# La función de un trabajo recibe el propio Trabajo como primer argumento para publicar su progreso
+# con actualizar() y consultar si se pidió su cancelación; no debe llamar a Streamlit.
+
+EN_COLA = 'en_cola'
+EN_CURSO = 'en_curso'
+COMPLETADO = 'completado'
+CANCELADO = 'cancelado'
+ERROR = 'error'
+
+ESTADOS_TERMINADOS = (COMPLETADO, CANCELADO, ERROR)
+
+class Trabajo:
+    """
+    Un trabajo enviado al gestor: estado, progreso, datos parciales publicados por la función y resultado.
+    """
+
+    def __init__(self, funcion, args, kwargs, descripcion="", clave=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.descripcion = descripcion
+        self.clave = clave
+        self.estado = EN_COLA
+        self.completados = 0
+        self.total = 0
+        self.datos = {}
+        self.resultado = None
+        self.error = None
+        self.creado = time.time()
+        self.inicio = None
+        self.fin = None
+        self.evento_cancelacion = threading.Event()
+        self._funcion = funcion
+        self._args = args
+        self._kwargs = kwargs
+        self._candado = threading.Lock()
+
+    def actualizar(self, completados=None, total=None, **datos):
+        """
+        Publica el progreso del trabajo y, opcionalmente, datos parciales (instantáneas que la interfaz lee).
+        """
+        with self._candado:
+            if completados is not None:
+                self.completados = completados
+            if total is not None:
+                self.total = total
+            self.datos.update(datos)
+
+    def cancelar(self):
+        """
+        Pide la cancelación del trabajo; la función decide cuándo detenerse consultando cancelado.
+        """
+        if self.estado not in ESTADOS_TERMINADOS:
+            logger.info(f"Cancelación solicitada para el trabajo {self.id}")
+            self.evento_cancelacion.set()
+
+    @property
+    def cancelado(self):
+        return self.evento_cancelacion.is_set()
+
+    @property
+    def terminado(self):
+        return self.estado in ESTADOS_TERMINADOS
+
+    def instantanea(self):
+        """
+        Copia coherente del estado del trabajo para mostrarla.
+        """
+        with self._candado:
+            fin = self.fin or time.time()
+            return {
+                'id': self.id,
+                'descripcion': self.descripcion,
+                'estado': self.estado,
+                'completados': self.completados,
+                'total': self.total,
+                'datos': dict(self.datos),
+                'error': self.error,
+                'creado': self.creado,
+                'duracion_s': fin - self.inicio if self.inicio else 0.0,
+                'cancelacion_solicitada': self.cancelado
+            }
+
+    def _ejecutar(self):
+        with self._candado:
+            self.estado = EN_CURSO
+            self.inicio = time.time()
+        try:
+            resultado = self._funcion(self, *self._args, **self._kwargs)
+        except Exception as e:
+            logger.error(f"Error en el trabajo {self.id} ({self.descripcion}): {e}", exc_info=True)
+            self._terminar(ERROR, error=str(e))
+            return
+        self._terminar(CANCELADO if self.cancelado else COMPLETADO, resultado)
+
+    def _terminar(self, estado, resultado=None, error=None):
+        with self._candado:
+            self.estado = estado
+            self.resultado = resultado
+            self.error = error
+            self.fin = time.time()
+            # Liberar las entradas (por ejemplo, los archivos subidos) en cuanto el trabajo termina
+            self._funcion = self._args = self._kwargs = None
+        logger.info(f"Trabajo {self.id} terminado: {estado}")
+
+class GestorTrabajos:
+    """
+    Cola de trabajos del proceso con num_ejecutores hilos que los ejecutan por orden de llegada.
+    Conserva los max_terminados trabajos terminados más recientes con sus resultados.
+    """
+
+    def __init__(self, num_ejecutores=NUM_TRABAJOS_SIMULTANEOS, max_terminados=MAX_TRABAJOS_TERMINADOS):
+        self.max_terminados = max_terminados
+        self._cola = queue.Queue()
+        self._trabajos = OrderedDict()
+        self._candado = threading.Lock()
+        self._hilos = [
+            threading.Thread(target=self._ejecutor, name=f"trabajos-{n}", daemon=True)
+            for n in range(max(1, num_ejecutores))
+        ]
+        for hilo in self._hilos:
+            hilo.start()
+
+    def enviar(self, funcion, *args, descripcion="", clave=None, reutilizar=True, **kwargs):
+        """
+        Encola funcion(trabajo, *args, **kwargs) y devuelve el Trabajo. Si ya hay un trabajo con la misma clave
+        en cola, en curso o completado, se devuelve ese en lugar de crear otro, salvo que reutilizar sea False
+        (volver a ejecutar un trabajo completado).
+        """
+        with self._candado:
+            if clave is not None and reutilizar:
+                existente = self._buscar(clave)
+                if existente is not None:
+                    return existente
+            trabajo = Trabajo(funcion, args, kwargs, descripcion, clave)
+            self._trabajos[trabajo.id] = trabajo
+            self._purgar()
+        self._cola.put(trabajo)
+        logger.info(f"Trabajo {trabajo.id} encolado: {descripcion}")
+        return trabajo
+
+    def _buscar(self, clave):
+        for trabajo in reversed(self._trabajos.values()):
+            if trabajo.clave == clave and trabajo.estado in (EN_COLA, EN_CURSO, COMPLETADO):
+                return trabajo
+        return None
+
+    def buscar(self, clave):
+        """
+        Devuelve el trabajo más reciente con la clave indicada que no se canceló ni falló, o None.
+        """
+        with self._candado:
+            return self._buscar(clave)
+
+    def obtener(self, id_trabajo):
+        with self._candado:
+            return self._trabajos.get(id_trabajo)
+
+    def listar(self):
+        """
+        Devuelve los trabajos conocidos, del más reciente al más antiguo.
+        """
+        with self._candado:
+            return list(reversed(self._trabajos.values()))
+
+    def posicion_en_cola(self, trabajo):
+        """
+        Número de trabajos en cola por delante del indicado (0 si ya está en curso o terminado).
+        """
+        if trabajo.estado != EN_COLA:
+            return 0
+        with self._candado:
+            anteriores = []
+            for otro in self._trabajos.values():
+                if otro is trabajo:
+                    break
+                anteriores.append(otro)
+        return sum(otro.estado == EN_COLA and not otro.cancelado for otro in anteriores)
+
+    def cancelar(self, id_trabajo):
+        trabajo = self.obtener(id_trabajo)
+        if trabajo is not None:
+            trabajo.cancelar()
+        return trabajo
+
+    def _purgar(self):
+        terminados = [id_trabajo for id_trabajo, trabajo in self._trabajos.items() if trabajo.terminado]
+        for id_trabajo in terminados[:max(0, len(terminados) - self.max_terminados)]:
+            del self._trabajos[id_trabajo]
+
+    def _ejecutor(self):
+        while True:
+            trabajo = self._cola.get()
+            if trabajo.cancelado:
+                trabajo._terminar(CANCELADO)
+            else:
+                trabajo._ejecutar()
+            with self._candado:
+                self._purgar()
+
+class ArchivoTrabajo(io.BytesIO):
+    """
+    Copia en memoria de un archivo subido, con su nombre, que pertenece al trabajo.
+    """
+
+    def __init__(self, name, contenido):
+        super().__init__(contenido)
+        self.name = name
+
+def copiar_archivos(archivos):
+    """
+    Copia los archivos subidos para un trabajo: Streamlit reutiliza los UploadedFile (y su posición de lectura)
+    en los reruns de la sesión, mientras que el trabajo los lee desde sus propios hilos.
+    getvalue() devuelve los bytes ya cargados, por lo que la copia no duplica el contenido.
+    """
+    return [ArchivoTrabajo(archivo.name, archivo.getvalue()) for archivo in archivos]
+
+def huella_archivos(archivos, *opciones):
+    """
+    Huella de una entrada (nombres y contenido de los archivos, en orden) y de las opciones indicadas,
+    que identifica un trabajo con independencia de la sesión que lo envió.
+    """
+    huella = hashlib.blake2b(digest_size=16)
+    for archivo in archivos:
+        contenido = archivo.getvalue()
+        huella.update(archivo.name.encode('utf-8') + b'\0' + len(contenido).to_bytes(8, 'little'))
+        huella.update(contenido)
+    huella.update(repr(opciones).encode('utf-8'))
+    return huella.hexdigest()
+
+_gestor = None
+_candado_gestor = threading.Lock()
+
+def obtener_gestor_trabajos():
+    """
+    Devuelve el gestor de trabajos compartido por todas las sesiones del proceso.
+    """
+    global _gestor
+    with _candado_gestor:
+        if _gestor is None:
+            _gestor = GestorTrabajos()
+        return _gestor
@@ -0,0 +1,135 @@
+# src/modulos/triaje.py
+
+import heapq
+import logging
+import time
+from collections import Counter
+
+from src.modulos.configuracion import MAX_HALLAZGOS_DESTACADOS
+
+logger = logging.getLogger(__name__)
+
+# Triaje incremental de la clasificación masiva: a medida que termina cada lote se actualizan los contadores
+# y un montículo con los hallazgos más prioritarios (malignos antes que sospechosos y, dentro de cada
+# categoría, mayor score primero), de modo que la interfaz puede mostrarlos sin esperar al final.
+
+# Orden de prioridad de las categorías (menor = más urgente)
+PRIORIDAD = {
+    'maligno': 1,
+    'sospechoso': 2,
+    'benigno': 3,
+    'no_encontrado': 4,
+    'error': 5
+}
+
+# Categorías que se consideran hallazgos y se destacan durante la ejecución
+CATEGORIAS_HALLAZGO = ('maligno', 'sospechoso')
+
+def categoria_resultado(resultado):
+    """
+    Categoría que decide la prioridad de un resultado: la secundaria si existe y, si no, la primaria.
+    """
+    return resultado['categoria_secundaria'] if resultado['categoria_secundaria'] else resultado['categoria_primaria']
+
+def determinar_prioridad(resultado):
+    """
+    Prioridad de un resultado según PRIORIDAD; las categorías sin prioridad propia (masas o calcificaciones sin
+    clasificación secundaria) cuentan como no encontradas.
+    """
+    return PRIORIDAD.get(categoria_resultado(resultado), PRIORIDAD['no_encontrado'])
+
+def _score(resultado):
+    score = resultado.get('score_secundario') if resultado['categoria_secundaria'] else resultado.get('score_primario')
+    return score if score is not None else 0.0
+
+class TriajeIncremental:
+    """
+    Acumula los resultados de una ejecución lote a lote: contadores por categoría, los max_destacados hallazgos
+    más prioritarios y los tiempos hasta el primer resultado y el primer hallazgo, medidos desde inicio
+    (time.perf_counter()). campo_nombre es la clave del nombre de archivo en los resultados.
+    """
+
+    def __init__(self, total, max_destacados=MAX_HALLAZGOS_DESTACADOS, inicio=None, campo_nombre='nombre_archivo'):
+        self.total = total
+        self.campo_nombre = campo_nombre
+        self.max_destacados = max_destacados
+        self.inicio = time.perf_counter() if inicio is None else inicio
+        self.procesados = 0
+        self.primarias = Counter()
+        self.secundarias = Counter()
+        self.tiempo_primer_resultado = None
+        self.tiempo_primer_hallazgo = None
+        self.primer_hallazgo = None
+        # Montículo de mínimos con la clave invertida: la cima es el peor de los destacados
+        self._destacados = []
+        self._orden = 0
+
+    def transcurrido(self):
+        return time.perf_counter() - self.inicio
+
+    def agregar(self, resultados, tiempo=None):
+        """
+        Añade los resultados de un lote (diccionarios con el nombre de archivo, categoria_primaria,
+        categoria_secundaria y sus scores). tiempo es el instante (s desde inicio) en que se obtuvieron;
+        por defecto, el actual. Devuelve True si alguno de ellos es un hallazgo.
+        """
+        ahora = self.transcurrido() if tiempo is None else tiempo
+        hay_hallazgo = False
+        for resultado in resultados:
+            self.procesados += 1
+            self.primarias[resultado['categoria_primaria']] += 1
+            if resultado['categoria_secundaria']:
+                self.secundarias[resultado['categoria_secundaria']] += 1
+            if self.tiempo_primer_resultado is None:
+                self.tiempo_primer_resultado = ahora
+
+            if categoria_resultado(resultado) not in CATEGORIAS_HALLAZGO:
+                continue
+            hay_hallazgo = True
+            if self.tiempo_primer_hallazgo is None:
+                self.tiempo_primer_hallazgo = ahora
+                self.primer_hallazgo = resultado
+                logger.info(f"Primer hallazgo ({categoria_resultado(resultado)}) tras {ahora:.2f} s: {resultado[self.campo_nombre]}")
+            if self.max_destacados <= 0:
+                continue
+            # A igual prioridad y score, se conserva el que llegó antes
+            entrada = (-determinar_prioridad(resultado), _score(resultado), -self._orden, resultado)
+            self._orden += 1
+            if len(self._destacados) < self.max_destacados:
+                heapq.heappush(self._destacados, entrada)
+            elif entrada[:3] > self._destacados[0][:3]:
+                heapq.heapreplace(self._destacados, entrada)
+        return hay_hallazgo
+
+    def destacados(self):
+        """
+        Devuelve los hallazgos destacados, del más al menos prioritario.
+        """
+        return [entrada[3] for entrada in sorted(self._destacados, reverse=True)]
+
+    def instantanea(self):
+        """
+        Copia del estado actual (resumen, destacados y primer hallazgo) que puede leerse desde otro hilo.
+        """
+        return {
+            'resumen': self.resumen(),
+            'destacados': self.destacados(),
+            'primer_hallazgo': self.primer_hallazgo
+        }
+
+    def resumen(self):
+        transcurrido = self.transcurrido()
+        return {
+            'procesados': self.procesados,
+            'total': self.total,
+            'masas': self.primarias['masas'],
+            'calcificaciones': self.primarias['calcificaciones'],
+            'no_encontrados': self.primarias['no_encontrado'],
+            'errores': self.primarias['error'],
+            'malignas': self.secundarias['maligno'],
+            'sospechosas': self.secundarias['sospechoso'],
+            'benignas': self.secundarias['benigno'],
+            'transcurrido_s': transcurrido,
+            'tiempo_primer_resultado_s': self.tiempo_primer_resultado,
+            'tiempo_primer_hallazgo_s': self.tiempo_primer_hallazgo
+        }
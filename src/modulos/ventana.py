@@ -0,0 +1,211 @@
+# src/modulos/ventana.py
+
+import logging
+import time
+
+import numpy as np
+
+try:
+    from pydicom.pixels import apply_voi_lut
+except ImportError:  # pydicom < 3
+    from pydicom.pixel_data_handlers.util import apply_voi_lut
+
+from src.modulos.preprocesamiento import lut_voi, normalizar_dicom_referencia
+
+logger = logging.getLogger(__name__)
+
+# Motor de ventana/nivel (window/level) sobre la profundidad de bits original.
+# Para cada estado de los sliders se construye una tabla (LUT) con una entrada por valor almacenado posible
+# y se aplica en una sola pasada de indexación vectorizada sobre el pixel_array original.
+# La ventana por defecto reproduce bit a bit la normalización de 8 bits de normalizar_dicom (y del visor
+# original): mismos valores de entrada, mismos extremos y misma aritmética con truncado a uint8.
+
+# Ancho mínimo de una ventana ajustada con los sliders, en unidades de los valores de entrada
+ANCHO_MINIMO = 1.0
+
+# Estados de los sliders (brillo, contraste) que verificar_ventana() comprueba además del de por defecto
+ESTADOS_VERIFICACION = ((20, 30), (-50, -40), (100, -100), (-100, 100), (0, 75))
+
+def _primer_valor(valor):
+    # WindowCenter/WindowWidth pueden ser multivalor
+    if valor is None:
+        return None
+    try:
+        return float(valor[0])
+    except TypeError:
+        return float(valor)
+
+def _recta_ventana(valores, ds):
+    # Recta de la ventana lineal de la cabecera con la misma aritmética que apply_windowing de pydicom,
+    # pero sin recortar a [y_min, y_max]. None si no hay ventana lineal aplicable.
+    centro = _primer_valor(ds.get('WindowCenter'))
+    ancho = _primer_valor(ds.get('WindowWidth'))
+    funcion = str(ds.get('VOILUTFunction', 'LINEAR') or 'LINEAR').upper()
+    if (centro is None or ancho is None or funcion not in ('LINEAR', 'LINEAR_EXACT')
+            or 'VOILUTSequence' in ds or 'ModalityLUTSequence' in ds):
+        return None
+    bits = int(ds.BitsStored)
+    if ds.get('PixelRepresentation', 0) == 0:
+        y_min, y_max = 0, 2 ** bits - 1
+    else:
+        y_min, y_max = -(2 ** (bits - 1)), 2 ** (bits - 1) - 1
+    pendiente = ds.get('RescaleSlope')
+    intercepto = ds.get('RescaleIntercept')
+    if pendiente is not None and intercepto is not None:
+        y_min = y_min * float(pendiente) + float(intercepto)
+        y_max = y_max * float(pendiente) + float(intercepto)
+    if funcion == 'LINEAR':
+        centro -= 0.5
+        ancho -= 1
+    if ancho <= 0:
+        return None
+    return ((valores.astype(np.float64) - centro) / ancho + 0.5) * (y_max - y_min) + y_min, y_min, y_max
+
+def _valores_base(valores, ds, lut):
+    """
+    Valores de entrada de la ventana para los valores almacenados: la salida de apply_voi_lut (lut) y, si la
+    cabecera trae una ventana lineal, su recta sin recortar, de modo que el contraste pueda ensanchar la
+    ventana más allá de la de la cabecera. La recta solo se usa si al recortarla se obtiene exactamente lut.
+    """
+    recta = _recta_ventana(valores, ds)
+    if recta is not None:
+        recta, y_min, y_max = recta
+        if np.array_equal(np.clip(recta, y_min, y_max), lut):
+            return recta
+    return lut
+
+def preparar_ventana(ds, datos=None):
+    """
+    Prepara el estado del motor de ventana para un dataset DICOM monocromo de un solo cuadro.
+    Devuelve None si la imagen no es compatible (por ejemplo, color, multicuadro o un rango de valores
+    demasiado grande para una LUT).
+    """
+    if ds.get('PhotometricInterpretation', 'MONOCHROME2') not in ('MONOCHROME1', 'MONOCHROME2'):
+        return None
+    datos = ds.pixel_array if datos is None else datos
+    if datos.ndim != 2 or not np.issubdtype(datos.dtype, np.integer):
+        return None
+
+    resultado = lut_voi(ds, datos)
+    if resultado is None:
+        return None
+    indices, valores, lut, minimo, maximo = resultado
+
+    # Ventana por defecto: los extremos de la VOI LUT sobre los valores presentes, como la normalización min/max
+    inferior, superior = float(minimo), float(maximo)
+    return {
+        'indices': indices,
+        'base': _valores_base(valores, ds, lut),
+        'invertir': ds.get('PhotometricInterpretation') == 'MONOCHROME1',
+        'inferior': inferior,
+        'superior': superior,
+        'centro': (inferior + superior) / 2,
+        'ancho': superior - inferior
+    }
+
+def parametros_ventana(estado, brillo, contraste, centro=None, ancho=None):
+    """
+    Calcula los extremos (inferior, superior) de la ventana para los sliders de brillo y contraste (-100 a 100).
+    El brillo desplaza el centro hasta medio ancho de ventana; el contraste estrecha o ensancha
+    la ventana hasta 4 veces. centro y ancho reemplazan la ventana por defecto si se indican.
+    Sin ajustes se devuelven exactamente los extremos de la ventana por defecto.
+    """
+    if not brillo and not contraste and centro is None and ancho is None:
+        return estado['inferior'], estado['superior']
+    centro = estado['centro'] if centro is None else centro
+    ancho = estado['ancho'] if ancho is None else ancho
+    centro_ajustado = centro - (brillo / 100) * ancho / 2
+    ancho_ajustado = max(ancho * 2 ** (-contraste / 50), ANCHO_MINIMO)
+    return centro_ajustado - ancho_ajustado / 2, centro_ajustado + ancho_ajustado / 2
+
+def ventana_lineal(valores, inferior, superior, invertir=False):
+    """
+    Ventana lineal con salida de 8 bits: lleva [inferior, superior] a [0, 255] (a [255, 0] si se invierte)
+    con la misma aritmética que la normalización min/max de normalizar_dicom, truncando a uint8.
+    Una ventana vacía (imagen constante) da ceros, como la normalización.
+    """
+    if superior <= inferior:
+        return np.zeros(np.shape(valores), dtype=np.uint8)
+    y = (superior - valores) if invertir else (valores - inferior)
+    y = y / (superior - inferior)
+    return np.clip(y * 255, 0, 255).astype(np.uint8)
+
+def construir_lut(estado, inferior, superior):
+    """
+    Construye la LUT de 8 bits para una ventana: una entrada por valor almacenado posible.
+    """
+    return ventana_lineal(estado['base'], inferior, superior, estado['invertir'])
+
+def aplicar_ventana(estado, brillo=0, contraste=0, centro=None, ancho=None):
+    """
+    Aplica la ventana correspondiente al estado de los sliders.
+    Devuelve la imagen de 8 bits (numpy) y el tiempo empleado en milisegundos.
+    """
+    inicio = time.perf_counter()
+    inferior, superior = parametros_ventana(estado, brillo, contraste, centro, ancho)
+    lut = construir_lut(estado, inferior, superior)
+    salida = lut[estado['indices']]
+    tiempo_ms = (time.perf_counter() - inicio) * 1000
+    logger.debug(f"Ventana [{inferior:.1f}, {superior:.1f}] aplicada en {tiempo_ms:.1f} ms")
+    return salida, tiempo_ms
+
+def indices_navegador(estado, max_entradas=65536):
+    """
+    Índices de la imagen para la pirámide del navegador, de hasta 16 bits. Si el dominio de la LUT tiene más
+    de max_entradas valores, los índices se cuantizan y se devuelven también las entradas de la LUT que
+    representa cada índice cuantizado (None si no hace falta cuantizar).
+    """
+    indices = estado['indices']
+    entradas = len(estado['base'])
+    if entradas <= max_entradas:
+        if indices.dtype not in (np.uint8, np.uint16):
+            indices = indices.astype(np.uint16)
+        return indices, None
+    cuantizados = (indices.astype(np.int64) * (max_entradas - 1) // (entradas - 1)).astype(np.uint16)
+    return cuantizados, muestras_lut(estado, max_entradas)
+
+def muestras_lut(estado, max_entradas=65536):
+    """
+    Entradas de la LUT que representan los índices cuantizados por indices_navegador(), o None.
+    """
+    entradas = len(estado['base'])
+    if entradas <= max_entradas:
+        return None
+    return np.arange(max_entradas, dtype=np.int64) * (entradas - 1) // (max_entradas - 1)
+
+def indices_monotonos(estado):
+    """
+    Indica si los valores de la LUT crecen (o decrecen) con el índice, de modo que promediar índices
+    vecinos equivale a promediar sus valores.
+    """
+    diferencias = np.diff(estado['base'])
+    return bool((diferencias >= 0).all() or (diferencias <= 0).all())
+
+def ventana_referencia(ds, inferior, superior, datos=None):
+    """
+    Evaluación directa de una ventana sobre la imagen completa, píxel a píxel y sin LUT ni dominio de
+    índices: VOI LUT de pydicom sobre el pixel_array, valores de entrada y ventana lineal en float64.
+    """
+    datos = ds.pixel_array if datos is None else datos
+    base = _valores_base(datos, ds, apply_voi_lut(datos, ds))
+    return ventana_lineal(base, inferior, superior, ds.get('PhotometricInterpretation') == 'MONOCHROME1')
+
+def _diferencia(salida, referencia):
+    return int(np.abs(salida.astype(np.int16) - referencia.astype(np.int16)).max())
+
+def verificar_ventana(estado, ds, estados=ESTADOS_VERIFICACION, tolerancia=0):
+    """
+    Compara la ventana por defecto (sin ajuste de brillo ni contraste) con normalizar_dicom_referencia, la
+    cadena de normalización de 8 bits del visor original, y cada estado (brillo, contraste) de estados con
+    ventana_referencia(). Devuelve (diferencia máxima, si no supera la tolerancia).
+    """
+    salida, _ = aplicar_ventana(estado)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        diferencia = _diferencia(salida, normalizar_dicom_referencia(ds))
+    for brillo, contraste in estados:
+        salida, _ = aplicar_ventana(estado, brillo, contraste)
+        inferior, superior = parametros_ventana(estado, brillo, contraste)
+        diferencia = max(diferencia, _diferencia(salida, ventana_referencia(ds, inferior, superior)))
+    if diferencia > tolerancia:
+        logger.warning(f"El motor de ventana difiere en {diferencia} niveles de la referencia")
+    return diferencia, diferencia <= tolerancia
@@ -6,14 +6,36 @@ import pydicom
 import numpy as np
 from io import BytesIO
 import logging
-from pydicom.pixels import apply_voi_lut
 import base64
 import json
+import hashlib
+import time
+import copy
+from pydicom.uid import ExplicitVRLittleEndian
 
 from src.modulos.procesamiento_i import procesamiento_individual  # Importar la función de procesamiento individual
+from src.modulos.cache_lru import CacheLRU
+from src.modulos.ventana import ANCHO_MINIMO, preparar_ventana, parametros_ventana, construir_lut, muestras_lut, indices_navegador, indices_monotonos
+from src.modulos.preprocesamiento import normalizar_dicom
+from src.modulos.piramide import obtener_piramide, descripcion_para_navegador, niveles_indices, MAX_ENTRADAS_LUT_NAVEGADOR
+from src.modulos.codificacion import codificar_vista_previa, codificar_png
+from src.modulos.configuracion import MAX_BYTES_CACHE_VISOR, MAX_BYTES_CACHE_DESCARGAS, LADO_VISTA_GENERAL, FORMATO_VISTA_PREVIA, CALIDAD_VISTA_PREVIA
 
 logger = logging.getLogger(__name__)
 
+# Imágenes DICOM ya decodificadas y normalizadas, por hash del contenido del archivo.
+# Se comparte entre reruns para que mover un slider no vuelva a decodificar el archivo.
+_cache_decodificadas = CacheLRU(MAX_BYTES_CACHE_VISOR)
+
+# Archivos de descarga ya generados (DICOM y PNG modificados), por archivo, estado del ajuste y formato
+_cache_descargas = CacheLRU(MAX_BYTES_CACHE_DESCARGAS)
+
+# Duración de la última exportación PNG a resolución completa de cada archivo (por hash), en milisegundos
+_tiempos_exportacion_png = {}
+
+# Clave de session_state con el hash del archivo cuyo análisis se muestra
+CLAVE_IMAGEN_ANALIZADA = 'imagen_analizada'
+
 def visualizar_dicom(opciones):
     st.write("---")
     st.header("Visor Avanzado de Imágenes DICOM")
@@ -46,9 +68,12 @@ def visualizar_dicom(opciones):
         mostrar_visor(selected_file, opciones)
 
 def mostrar_visor(selected_file, opciones):
-    imagen, ds, pixel_spacing = procesar_imagen_dicom(selected_file)
+    decodificada = obtener_imagen_dicom(selected_file)
+
+    if decodificada is not None:
+        ds = decodificada['ds']
+        ventana = decodificada['ventana']
 
-    if imagen is not None:
         # Control de brillo y contraste
         col1, col2 = st.columns([1, 1])
         with col1:
@@ -56,267 +81,767 @@ def mostrar_visor(selected_file, opciones):
         with col2:
             contraste = st.slider("Contraste", -100, 100, 0, key=f"contraste_{selected_file.name}")
 
-        # Aplicar ajustes de brillo y contraste
-        imagen_editada = ajustar_brillo_contraste(imagen, brillo, contraste)
-
-        # Convertir la imagen a base64 para incrustarla en HTML
-        buffered = BytesIO()
-        imagen_editada.save(buffered, format="PNG")
-        img_base64 = base64.b64encode(buffered.getvalue()).decode()
-
-        # HTML y JavaScript para hacer la imagen draggable, zoom y rotación
-        draggable_image_html = f"""
-        <html>
-        <head>
-        <style>
-            #container {{
-                width: 100%;
-                height:800px; /* Altura ajustada */
-                position: relative;
-                overflow: hidden;
-                border: 1px solid #ddd;
-                background-color: #000; /* Fondo negro para mejor visualización */
-                display: flex;
-                align-items: center;
-                justify-content: center;
+        centro = ancho = None
+        inicio = time.perf_counter()
+        if ventana is not None:
+            # Ventana/nivel sobre la profundidad de bits original: una LUT por estado de los sliders
+            centro_defecto = float(round(ventana['centro'], 1))
+            ancho_defecto = float(round(max(ventana['ancho'], ANCHO_MINIMO), 1))
+            with st.expander("Ventana (centro / ancho)"):
+                col1, col2 = st.columns([1, 1])
+                with col1:
+                    centro = st.number_input("Centro de ventana", value=centro_defecto,
+                                             key=f"centro_{selected_file.name}")
+                with col2:
+                    ancho = st.number_input("Ancho de ventana", min_value=ANCHO_MINIMO, value=ancho_defecto,
+                                            key=f"ancho_{selected_file.name}")
+            # Los valores mostrados están redondeados: si no se cambian, se usa la ventana por defecto exacta
+            centro = None if centro == centro_defecto else centro
+            ancho = None if ancho == ancho_defecto else ancho
+            inferior, superior = parametros_ventana(ventana, brillo, contraste, centro, ancho)
+            lut = construir_lut(ventana, inferior, superior)
+            muestras = muestras_lut(ventana, MAX_ENTRADAS_LUT_NAVEGADOR)
+            lut_navegador = lut if muestras is None else lut[muestras]
+
+            def imagen_ajustada():
+                return Image.fromarray(lut[ventana['indices']])
+        else:
+            # Imágenes no compatibles con el motor de ventana: la LUT aproxima el ajuste sobre 8 bits
+            lut_navegador = lut_brillo_contraste(decodificada['imagen'].histogram(), brillo, contraste)
+
+            def imagen_ajustada():
+                return ajustar_brillo_contraste(decodificada['imagen'], brillo, contraste)
+        tiempo_ajuste = (time.perf_counter() - inicio) * 1000
+
+        formato_vista = opciones.get('formato_vista_previa', FORMATO_VISTA_PREVIA)
+        calidad_vista = opciones.get('calidad_vista_previa', CALIDAD_VISTA_PREVIA)
+
+        # Pirámide de teselas servida como archivos estáticos: se construye una vez por archivo y el navegador
+        # solo descarga las teselas visibles y les aplica la LUT; mover un slider solo envía una nueva LUT.
+        # Si el servidor no sirve archivos estáticos, se incrusta una vista previa reducida en base64.
+        clave_estado = f"{decodificada['clave']}:{brillo}:{contraste}:{centro}:{ancho}"
+        inicio = time.perf_counter()
+        if st.get_option("server.enableStaticServing"):
+            piramide = obtener_piramide(decodificada['clave'][:32], lambda: niveles_para_piramide(decodificada))
+            url_base = "/" + (st.get_option("server.baseUrlPath") or "").strip("/")
+            visor_html = html_visor_teselas(descripcion_para_navegador(piramide, url_base),
+                                            base64.b64encode(lut_navegador.tobytes()).decode(), selected_file.name)
+            resumen_vista = "Pirámide de teselas"
+        else:
+            datos_vista, mime_vista, _ = codificar_vista_previa(imagen_ajustada(), LADO_VISTA_GENERAL, formato_vista, calidad_vista)
+            visor_html = html_visor_imagen(base64.b64encode(datos_vista).decode(), mime_vista, selected_file.name)
+            resumen_vista = f"Vista previa {formato_vista} (calidad {calidad_vista})"
+        tiempo_vista = (time.perf_counter() - inicio) * 1000
+
+        # Tiempos de ajuste, de la vista previa y de la última exportación PNG a resolución completa
+        resumen_tiempos = (f"Ajuste de brillo y contraste: {tiempo_ajuste:.1f} ms · "
+                           f"{resumen_vista}: {tiempo_vista:.1f} ms")
+        tiempo_png = _tiempos_exportacion_png.get(decodificada['clave'])
+        if tiempo_png is not None:
+            resumen_tiempos += f" · Última exportación PNG completa: {tiempo_png:.1f} ms"
+        st.caption(resumen_tiempos)
+
+        # Mostrar la imagen con funcionalidad de arrastre, zoom y rotación
+        st.components.v1.html(visor_html, height=800)  # Ajustar la altura a 800
+
+        # Descargar DICOM modificado y PNG de alta resolución, y botón "Analizar mamografía"
+        st.subheader("Descargar Imagen Modificada")
+
+        # Los archivos de descarga (y la imagen ajustada a resolución completa) se generan solo al pulsar
+        # cada botón y se guardan en caché por archivo y estado del ajuste, de modo que pulsar de nuevo no vuelve a codificar
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            def exportar_dicom(dataset=ds, clave=f"{clave_estado}:dicom"):
+                return obtener_descarga(clave, lambda: generar_dicom_modificado(dataset, imagen_ajustada()))
+
+            st.download_button(
+                label="Descargar DICOM Modificado",
+                data=exportar_dicom,
+                file_name=f"modificado_{selected_file.name}",
+                mime="application/dicom",
+                key="download_dicom"
+            )
+
+        with col2:
+            # El PNG sin pérdida a resolución completa solo se codifica cuando se pulsa el botón
+            def exportar_png(clave=f"{clave_estado}:png", clave_archivo=decodificada['clave']):
+                def generar():
+                    datos, tiempo_png = codificar_png(imagen_ajustada())
+                    _tiempos_exportacion_png[clave_archivo] = tiempo_png
+                    return datos
+                return obtener_descarga(clave, generar)
+
+            st.download_button(
+                label="Descargar PNG de Alta Resolución",
+                data=exportar_png,
+                file_name=f"modificado_{selected_file.name}.png",
+                mime="image/png",
+                key="download_png"
+            )
+
+        with col3:
+            # El archivo analizado se recuerda en la sesión: los reruns (mover un slider, cambiar de modo en la barra
+            # lateral o comparar latencias) siguen mostrando el análisis
+            st.button("Analizar mamografía", key=f"analizar_{selected_file.name}",
+                      on_click=marcar_analizada, args=(decodificada['clave'],))
+
+        if st.session_state.get(CLAVE_IMAGEN_ANALIZADA) == decodificada['clave']:
+            # Preparar las opciones para el procesamiento individual
+            opciones_procesamiento = {
+                'uploaded_image': selected_file,
+                'baja_latencia': opciones.get('baja_latencia'),
+                'usar_cache': opciones.get('usar_cache', True)
+            }
+            procesamiento_individual(opciones_procesamiento)
+
+    else:
+        st.error(f"No se pudo procesar la imagen {selected_file.name}")
+
+def marcar_analizada(clave):
+    st.session_state[CLAVE_IMAGEN_ANALIZADA] = clave
+
+def html_visor_imagen(img_base64, mime, nombre):
+    """
+    Visor con una sola imagen incrustada en base64 (sin pirámide de teselas).
+    """
+    # HTML y JavaScript para hacer la imagen draggable, zoom y rotación
+    return f"""
+    <html>
+    <head>
+    <style>
+        #container {{
+            width: 100%;
+            height:800px; /* Altura ajustada */
+            position: relative;
+            overflow: hidden;
+            border: 1px solid #ddd;
+            background-color: #000; /* Fondo negro para mejor visualización */
+            display: flex;
+            align-items: center;
+            justify-content: center;
+        }}
+        #draggable {{
+            position: absolute;
+            cursor: grab;
+            user-select: none;
+            transition: transform 0.1s ease;
+            max-width: none;
+            max-height: none;
+            z-index: 100;
+        }}
+        #controls {{
+            position: absolute;
+            top: 10px;
+            left: 10px;
+            z-index: 1000;
+        }}
+        #controls button {{
+            background-color: #00BFFF;
+            color: white;
+            border: none;
+            padding: 5px 10px;
+            margin-right: 5px;
+            margin-bottom: 5px;
+            border-radius: 3px;
+            cursor: pointer;
+            font-size: 16px;
+        }}
+        #canvas {{
+            position: absolute;
+            top: 0;
+            left: 0;
+            z-index: 200;
+        }}
+    </style>
+    </head>
+    <body>
+        <div id="container">
+            <div id="controls">
+                <button onclick="zoomIn()">+</button>
+                <button onclick="zoomOut()">-</button>
+                <button onclick="rotateLeft()">⟲</button>
+                <button onclick="rotateRight()">⟳</button>
+            </div>
+            <img id="draggable" src="data:{mime};base64,{img_base64}" draggable="false" />
+        </div>
+        <script>
+            const img = document.getElementById("draggable");
+            const container = document.getElementById("container");
+            let isDragging = false;
+            let startX, startY;
+            let translateX = 0, translateY = 0;
+            let scale = 1;
+            let rotation = 0;
+            const imageKey = {json.dumps(nombre)};  // Clave única para cada imagen
+
+            // Cargar transformaciones desde localStorage
+            function loadTransformations() {{
+                const savedTransformations = localStorage.getItem('transformations_' + imageKey);
+                if (savedTransformations) {{
+                    const {{ translateX: tx, translateY: ty, scale: s, rotation: r }} = JSON.parse(savedTransformations);
+                    translateX = tx;
+                    translateY = ty;
+                    scale = s;
+                    rotation = r;
+                }} else {{
+                    // No hay transformaciones guardadas, calcular escala inicial
+                    calculateInitialScale();
+                }}
+            }}
+
+            // Guardar transformaciones en localStorage
+            function saveTransformations() {{
+                const transformations = {{
+                    translateX,
+                    translateY,
+                    scale,
+                    rotation
+                }};
+                localStorage.setItem('transformations_' + imageKey, JSON.stringify(transformations));
             }}
-            #draggable {{
-                position: absolute;
-                cursor: grab;
-                user-select: none;
-                transition: transform 0.1s ease;
-                max-width: none;
-                max-height: none;
-                z-index: 100;
+
+            // Función para calcular la escala y posición inicial
+            function calculateInitialScale() {{
+                const containerWidth = container.clientWidth;
+                const containerHeight = container.clientHeight;
+                const imgNaturalWidth = img.naturalWidth;
+                const imgNaturalHeight = img.naturalHeight;
+
+                const scaleWidth = containerWidth / imgNaturalWidth;
+                const scaleHeight = containerHeight / imgNaturalHeight;
+                let initialScale = Math.min(scaleWidth, scaleHeight);
+
+                // Multiplicar la escala inicial por un factor para agrandar la imagen
+                initialScale *= 1.2; // Puedes ajustar este valor (1.2) para agrandar más o menos la imagen
+
+                scale = initialScale;
+
+                // Centrar la imagen
+                translateX = (containerWidth - imgNaturalWidth * scale) / 2;
+                translateY = (containerHeight - imgNaturalHeight * scale) / 2;
+
+                rotation = 0;
             }}
-            #controls {{
-                position: absolute;
-                top: 10px;
-                left: 10px;
-                z-index: 1000;
+
+            // Llamar a loadTransformations al cargar la imagen
+            img.onload = () => {{
+                loadTransformations();
+                updateTransform();
+            }};
+
+            img.addEventListener("mousedown", (e) => {{
+                isDragging = true;
+                startX = e.clientX - translateX;
+                startY = e.clientY - translateY;
+                img.style.cursor = "grabbing";
+            }});
+
+            img.addEventListener("mousemove", (e) => {{
+                if (isDragging) {{
+                    translateX = e.clientX - startX;
+                    translateY = e.clientY - startY;
+                    updateTransform();
+                }}
+            }});
+
+            img.addEventListener("mouseup", (e) => {{
+                if (isDragging) {{
+                    isDragging = false;
+                    img.style.cursor = "grab";
+                }}
+            }});
+
+            // Asegurar que los eventos funcionen también si el ratón sale de la imagen
+            document.addEventListener("mouseup", (e) => {{
+                if (isDragging) {{
+                    isDragging = false;
+                    img.style.cursor = "grab";
+                }}
+            }});
+
+            // Prevenir el comportamiento por defecto de arrastre de la imagen
+            img.addEventListener("dragstart", (e) => {{
+                e.preventDefault();
+            }});
+
+            function zoomIn() {{
+                scale += 0.1;
+                updateTransform();
             }}
-            #controls button {{
-                background-color: #00BFFF;
-                color: white;
-                border: none;
-                padding: 5px 10px;
-                margin-right: 5px;
-                margin-bottom: 5px;
-                border-radius: 3px;
-                cursor: pointer;
-                font-size: 16px;
+
+            function zoomOut() {{
+                scale = Math.max(0.1, scale - 0.1);
+                updateTransform();
             }}
-            #canvas {{
-                position: absolute;
-                top: 0;
-                left: 0;
-                z-index: 200;
+
+            function rotateLeft() {{
+                rotation -= 15;
+                updateTransform();
             }}
-        </style>
-        </head>
-        <body>
-            <div id="container">
-                <div id="controls">
-                    <button onclick="zoomIn()">+</button>
-                    <button onclick="zoomOut()">-</button>
-                    <button onclick="rotateLeft()">⟲</button>
-                    <button onclick="rotateRight()">⟳</button>
-                </div>
-                <img id="draggable" src="data:image/png;base64,{img_base64}" draggable="false" />
+
+            function rotateRight() {{
+                rotation += 15;
+                updateTransform();
+            }}
+
+            function updateTransform() {{
+                img.style.transform = `translate(${{translateX}}px, ${{translateY}}px) scale(${{scale}}) rotate(${{rotation}}deg)`;
+                // Guardar las transformaciones
+                saveTransformations();
+            }}
+        </script>
+    </body>
+    </html>
+    """
+
+def html_visor_teselas(piramide, lut_base64, nombre):
+    """
+    Visor sobre una pirámide de teselas: la vista general se muestra siempre debajo y, según el zoom,
+    se piden solo las teselas visibles del nivel adecuado. Las teselas guardan índices de 16 bits
+    (canales rojo y verde) y se pintan en un canvas a través de la LUT del estado actual (lut_base64).
+    """
+    vista_url = f"{piramide['url']}/{piramide['vista']['archivo']}"
+    return f"""
+    <html>
+    <head>
+    <style>
+        #container {{
+            width: 100%;
+            height:800px; /* Altura ajustada */
+            position: relative;
+            overflow: hidden;
+            border: 1px solid #ddd;
+            background-color: #000; /* Fondo negro para mejor visualización */
+        }}
+        #lienzo {{
+            position: absolute;
+            top: 0;
+            left: 0;
+            overflow: hidden;
+            cursor: grab;
+            user-select: none;
+            transform-origin: 0 0;
+            transition: transform 0.1s ease;
+            z-index: 100;
+        }}
+        #lienzo canvas {{
+            position: absolute;
+            max-width: none;
+            max-height: none;
+            pointer-events: none;
+        }}
+        #vista {{
+            top: 0;
+            left: 0;
+        }}
+        #controls {{
+            position: absolute;
+            top: 10px;
+            left: 10px;
+            z-index: 1000;
+        }}
+        #controls button {{
+            background-color: #00BFFF;
+            color: white;
+            border: none;
+            padding: 5px 10px;
+            margin-right: 5px;
+            margin-bottom: 5px;
+            border-radius: 3px;
+            cursor: pointer;
+            font-size: 16px;
+        }}
+    </style>
+    </head>
+    <body>
+        <div id="container">
+            <div id="controls">
+                <button onclick="zoomIn()">+</button>
+                <button onclick="zoomOut()">-</button>
+                <button onclick="rotateLeft()">⟲</button>
+                <button onclick="rotateRight()">⟳</button>
             </div>
-            <script>
-                const img = document.getElementById("draggable");
-                const container = document.getElementById("container");
-                let isDragging = false;
-                let startX, startY;
-                let translateX = 0, translateY = 0;
-                let scale = 1;
-                let rotation = 0;
-                const imageKey = {json.dumps(selected_file.name)};  // Clave única para cada imagen
-
-                // Cargar transformaciones desde localStorage
-                function loadTransformations() {{
-                    const savedTransformations = localStorage.getItem('transformations_' + imageKey);
-                    if (savedTransformations) {{
-                        const {{ translateX: tx, translateY: ty, scale: s, rotation: r }} = JSON.parse(savedTransformations);
-                        translateX = tx;
-                        translateY = ty;
-                        scale = s;
-                        rotation = r;
-                    }} else {{
-                        // No hay transformaciones guardadas, calcular escala inicial
-                        calculateInitialScale();
-                    }}
+            <div id="lienzo">
+                <canvas id="vista"></canvas>
+            </div>
+        </div>
+        <script>
+            const piramide = {json.dumps(piramide)};
+            const lienzo = document.getElementById("lienzo");
+            const vista = document.getElementById("vista");
+            const container = document.getElementById("container");
+            const ANCHO = piramide.ancho, ALTO = piramide.alto, TESELA = piramide.tesela;
+            let isDragging = false;
+            let startX, startY;
+            let translateX = 0, translateY = 0;
+            let scale = 1;
+            let rotation = 0;
+            const imageKey = {json.dumps(nombre)};  // Clave única para cada imagen
+            const teselas = new Map();  // "nivel/x/y" -> elemento canvas
+            const lut = Uint8Array.from(atob({json.dumps(lut_base64)}), c => c.charCodeAt(0));
+            let temporizadorTeselas = null;
+
+            // Pinta en un canvas la imagen de índices cargada, aplicando la LUT a cada píxel
+            function pintar(canvas, imagen) {{
+                canvas.width = imagen.naturalWidth;
+                canvas.height = imagen.naturalHeight;
+                const ctx = canvas.getContext("2d");
+                ctx.drawImage(imagen, 0, 0);
+                const datos = ctx.getImageData(0, 0, canvas.width, canvas.height);
+                const p = datos.data;
+                for (let i = 0; i < p.length; i += 4) {{
+                    const v = lut[Math.min((p[i] << 8) | p[i + 1], lut.length - 1)];
+                    p[i] = v;
+                    p[i + 1] = v;
+                    p[i + 2] = v;
                 }}
+                ctx.putImageData(datos, 0, 0);
+            }}
 
-                // Guardar transformaciones en localStorage
-                function saveTransformations() {{
-                    const transformations = {{
-                        translateX,
-                        translateY,
-                        scale,
-                        rotation
-                    }};
-                    localStorage.setItem('transformations_' + imageKey, JSON.stringify(transformations));
+            const imagenVista = new Image();
+            imagenVista.onload = () => pintar(vista, imagenVista);
+            imagenVista.src = {json.dumps(vista_url)};
+
+            // El lienzo tiene el tamaño de la imagen a resolución completa; la vista general se estira encima
+            lienzo.style.width = ANCHO + "px";
+            lienzo.style.height = ALTO + "px";
+            vista.style.width = ANCHO + "px";
+            vista.style.height = ALTO + "px";
+
+            // Cargar transformaciones desde localStorage
+            function loadTransformations() {{
+                const savedTransformations = localStorage.getItem('teselas_' + imageKey);
+                if (savedTransformations) {{
+                    const {{ translateX: tx, translateY: ty, scale: s, rotation: r }} = JSON.parse(savedTransformations);
+                    translateX = tx;
+                    translateY = ty;
+                    scale = s;
+                    rotation = r;
+                }} else {{
+                    // No hay transformaciones guardadas, calcular escala inicial
+                    calculateInitialScale();
                 }}
+            }}
+
+            // Guardar transformaciones en localStorage
+            function saveTransformations() {{
+                const transformations = {{
+                    translateX,
+                    translateY,
+                    scale,
+                    rotation
+                }};
+                localStorage.setItem('teselas_' + imageKey, JSON.stringify(transformations));
+            }}
 
-                // Función para calcular la escala y posición inicial
-                function calculateInitialScale() {{
-                    const containerWidth = container.clientWidth;
-                    const containerHeight = container.clientHeight;
-                    const imgNaturalWidth = img.naturalWidth;
-                    const imgNaturalHeight = img.naturalHeight;
+            // Función para calcular la escala y posición inicial
+            function calculateInitialScale() {{
+                const containerWidth = container.clientWidth;
+                const containerHeight = container.clientHeight;
 
-                    const scaleWidth = containerWidth / imgNaturalWidth;
-                    const scaleHeight = containerHeight / imgNaturalHeight;
-                    let initialScale = Math.min(scaleWidth, scaleHeight);
+                scale = Math.min(containerWidth / ANCHO, containerHeight / ALTO) * 1.2;
 
-                    // Multiplicar la escala inicial por un factor para agrandar la imagen
-                    initialScale *= 1.2; // Puedes ajustar este valor (1.2) para agrandar más o menos la imagen
+                // Centrar la imagen
+                translateX = (containerWidth - ANCHO * scale) / 2;
+                translateY = (containerHeight - ALTO * scale) / 2;
 
-                    scale = initialScale;
+                rotation = 0;
+            }}
 
-                    // Centrar la imagen
-                    translateX = (containerWidth - imgNaturalWidth * scale) / 2;
-                    translateY = (containerHeight - imgNaturalHeight * scale) / 2;
+            // Transformación del lienzo: desplazamiento, escala y rotación alrededor del centro de la imagen
+            function matriz() {{
+                return new DOMMatrix()
+                    .translate(translateX, translateY)
+                    .scale(scale)
+                    .translate(ANCHO / 2, ALTO / 2)
+                    .rotate(rotation)
+                    .translate(-ANCHO / 2, -ALTO / 2);
+            }}
 
-                    rotation = 0;
-                }}
+            // Nivel de la pirámide cuya resolución se ajusta mejor a la escala actual
+            function nivelActual() {{
+                return Math.max(0, Math.floor(Math.log2(1 / scale)));
+            }}
 
-                // Llamar a loadTransformations al cargar la imagen
-                img.onload = () => {{
-                    loadTransformations();
-                    updateTransform();
+            function crearTesela(nivel, x, y, clave) {{
+                const datos = piramide.niveles[nivel];
+                const factor = Math.pow(2, nivel);
+                const url = `${{piramide.url}}/${{nivel}}/${{x}}_${{y}}.${{piramide.formato}}`;
+                const tesela = document.createElement("canvas");
+                const imagen = new Image();
+                tesela.style.left = (x * TESELA * factor) + "px";
+                tesela.style.top = (y * TESELA * factor) + "px";
+                tesela.style.width = (Math.min(TESELA, datos.ancho - x * TESELA) * factor) + "px";
+                tesela.style.height = (Math.min(TESELA, datos.alto - y * TESELA) * factor) + "px";
+                // Los niveles finos se escriben en segundo plano: reintentar mientras la tesela no exista
+                let intentos = 0;
+                imagen.onerror = () => {{
+                    if (intentos < 20 && teselas.get(clave) === tesela) {{
+                        intentos += 1;
+                        setTimeout(() => {{ imagen.src = url + "?r=" + intentos; }}, 500);
+                    }}
                 }};
-
-                img.addEventListener("mousedown", (e) => {{
-                    isDragging = true;
-                    startX = e.clientX - translateX;
-                    startY = e.clientY - translateY;
-                    img.style.cursor = "grabbing";
-                }});
-
-                img.addEventListener("mousemove", (e) => {{
-                    if (isDragging) {{
-                        translateX = e.clientX - startX;
-                        translateY = e.clientY - startY;
-                        updateTransform();
+                imagen.onload = () => {{
+                    if (teselas.get(clave) === tesela) {{
+                        pintar(tesela, imagen);
                     }}
-                }});
+                }};
+                imagen.src = url;
+                lienzo.appendChild(tesela);
+                teselas.set(clave, tesela);
+            }}
 
-                img.addEventListener("mouseup", (e) => {{
-                    if (isDragging) {{
-                        isDragging = false;
-                        img.style.cursor = "grab";
+            // Pedir las teselas visibles del nivel actual y retirar las demás
+            function actualizarTeselas() {{
+                const visibles = new Set();
+                const nivel = nivelActual();
+                if (nivel < piramide.niveles.length) {{
+                    const datos = piramide.niveles[nivel];
+                    const lado = TESELA * Math.pow(2, nivel);
+                    const inversa = matriz().inverse();
+                    const w = container.clientWidth, h = container.clientHeight;
+                    const esquinas = [[0, 0], [w, 0], [0, h], [w, h]].map(([px, py]) => inversa.transformPoint(new DOMPoint(px, py)));
+                    const xs = esquinas.map(p => p.x), ys = esquinas.map(p => p.y);
+                    const x0 = Math.max(0, Math.floor(Math.min(...xs) / lado));
+                    const x1 = Math.min(datos.columnas - 1, Math.floor(Math.max(...xs) / lado));
+                    const y0 = Math.max(0, Math.floor(Math.min(...ys) / lado));
+                    const y1 = Math.min(datos.filas - 1, Math.floor(Math.max(...ys) / lado));
+                    for (let y = y0; y <= y1; y++) {{
+                        for (let x = x0; x <= x1; x++) {{
+                            const clave = `${{nivel}}/${{x}}/${{y}}`;
+                            visibles.add(clave);
+                            if (!teselas.has(clave)) {{
+                                crearTesela(nivel, x, y, clave);
+                            }}
+                        }}
                     }}
-                }});
-
-                // Asegurar que los eventos funcionen también si el ratón sale de la imagen
-                document.addEventListener("mouseup", (e) => {{
-                    if (isDragging) {{
-                        isDragging = false;
-                        img.style.cursor = "grab";
+                }}
+                for (const [clave, tesela] of teselas) {{
+                    if (!visibles.has(clave)) {{
+                        tesela.remove();
+                        teselas.delete(clave);
                     }}
-                }});
+                }}
+            }}
 
-                // Prevenir el comportamiento por defecto de arrastre de la imagen
-                img.addEventListener("dragstart", (e) => {{
-                    e.preventDefault();
-                }});
+            function programarTeselas() {{
+                clearTimeout(temporizadorTeselas);
+                temporizadorTeselas = setTimeout(actualizarTeselas, 100);
+            }}
 
-                function zoomIn() {{
-                    scale += 0.1;
+            lienzo.addEventListener("mousedown", (e) => {{
+                isDragging = true;
+                startX = e.clientX - translateX;
+                startY = e.clientY - translateY;
+                lienzo.style.cursor = "grabbing";
+            }});
+
+            document.addEventListener("mousemove", (e) => {{
+                if (isDragging) {{
+                    translateX = e.clientX - startX;
+                    translateY = e.clientY - startY;
                     updateTransform();
                 }}
+            }});
 
-                function zoomOut() {{
-                    scale = Math.max(0.1, scale - 0.1);
-                    updateTransform();
+            // Asegurar que los eventos funcionen también si el ratón sale de la imagen
+            document.addEventListener("mouseup", (e) => {{
+                if (isDragging) {{
+                    isDragging = false;
+                    lienzo.style.cursor = "grab";
                 }}
+            }});
 
-                function rotateLeft() {{
-                    rotation -= 15;
-                    updateTransform();
-                }}
+            // Prevenir el comportamiento por defecto de arrastre de la imagen
+            lienzo.addEventListener("dragstart", (e) => {{
+                e.preventDefault();
+            }});
 
-                function rotateRight() {{
-                    rotation += 15;
-                    updateTransform();
-                }}
+            function zoomIn() {{
+                scale *= 1.25;
+                updateTransform();
+            }}
 
-                function updateTransform() {{
-                    img.style.transform = `translate(${{translateX}}px, ${{translateY}}px) scale(${{scale}}) rotate(${{rotation}}deg)`;
-                    // Guardar las transformaciones
-                    saveTransformations();
-                }}
-            </script>
-        </body>
-        </html>
-        """
+            function zoomOut() {{
+                scale = Math.max(0.01, scale / 1.25);
+                updateTransform();
+            }}
 
-        # Mostrar la imagen con funcionalidad de arrastre, zoom y rotación
-        st.components.v1.html(draggable_image_html, height=800)  # Ajustar la altura a 800
+            function rotateLeft() {{
+                rotation -= 15;
+                updateTransform();
+            }}
 
-        # Descargar DICOM modificado y PNG de alta resolución, y botón "Analizar mamografía"
-        st.subheader("Descargar Imagen Modificada")
+            function rotateRight() {{
+                rotation += 15;
+                updateTransform();
+            }}
 
-        # Convertir la imagen editada a escala de grises para guardar en DICOM
-        imagen_gris = imagen_editada.convert("L")
-        pixel_data = np.array(imagen_gris)
+            function updateTransform() {{
+                lienzo.style.transform = matriz().toString();
+                // Guardar las transformaciones
+                saveTransformations();
+                programarTeselas();
+            }}
 
-        # Botones para descargar en DICOM, PNG y Analizar mamografía
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            dicom_buffer = BytesIO()
-            try:
-                # Aplicar los cambios al dataset DICOM
-                ds.PixelData = pixel_data.tobytes()
-                ds.Rows, ds.Columns = pixel_data.shape
-
-                ds.save_as(dicom_buffer)
-                dicom_buffer.seek(0)
-
-                # Preparar el archivo para descarga
-                st.download_button(
-                    label="Descargar DICOM Modificado",
-                    data=dicom_buffer,
-                    file_name=f"modificado_{selected_file.name}",
-                    mime="application/dicom",
-                    key="download_dicom"
-                )
-            except Exception as e:
-                st.error(f"Error al preparar el archivo DICOM: {e}")
+            loadTransformations();
+            updateTransform();
+        </script>
+    </body>
+    </html>
+    """
 
-        with col2:
-            try:
-                png_buffer = BytesIO()
-                # Guardar la imagen editada en el buffer con alta calidad
-                imagen_editada.save(png_buffer, format="PNG")
-                png_buffer.seek(0)
-
-                # Preparar el archivo para descarga
-                st.download_button(
-                    label="Descargar PNG de Alta Resolución",
-                    data=png_buffer,
-                    file_name=f"modificado_{selected_file.name}.png",
-                    mime="image/png",
-                    key="download_png"
-                )
-            except Exception as e:
-                st.error(f"Error al preparar la imagen PNG: {e}")
+def hash_archivo(archivo):
+    """
+    Calcula el hash SHA-256 del contenido de un archivo subido sin copiar sus bytes.
+    """
+    if hasattr(archivo, 'getbuffer'):
+        with archivo.getbuffer() as buffer:
+            return hashlib.sha256(buffer).hexdigest()
+    return hashlib.sha256(archivo.getvalue()).hexdigest()
+
+def _tamano_decodificada(decodificada):
+    # Memoria aproximada de la entrada: píxeles codificados y matriz decodificada del dataset, LUT base e imagen de 8 bits
+    ds = decodificada['ds']
+    tamano = len(ds.get('PixelData') or b'')
+    pixel_array = getattr(ds, '_pixel_array', None)
+    if pixel_array is not None:
+        tamano += pixel_array.nbytes
+    if decodificada['ventana'] is not None:
+        tamano += decodificada['ventana']['base'].nbytes
+    imagen = decodificada['imagen']
+    if imagen is not None:
+        tamano += imagen.width * imagen.height * len(imagen.getbands())
+    return tamano
 
-        with col3:
-            analizar = st.button("Analizar mamografía", key=f"analizar_{selected_file.name}")
+def obtener_imagen_dicom(dicom_file):
+    """
+    Devuelve el archivo DICOM decodificado para el visor, decodificándolo solo si no está en la caché.
+    """
+    clave = hash_archivo(dicom_file)
+    decodificada = _cache_decodificadas.obtener(clave)
+    if decodificada is None:
+        decodificada = decodificar_para_visor(dicom_file)
+        if decodificada is not None:
+            decodificada['clave'] = clave
+            _cache_decodificadas.guardar(clave, decodificada, _tamano_decodificada(decodificada))
+    return decodificada
+
+def decodificar_para_visor(dicom_file):
+    """
+    Decodifica un archivo DICOM para el visor.
+    Devuelve un diccionario con el dataset, el pixel spacing y el estado del motor de ventana
+    o, si la imagen no es monocromo de un cuadro, la imagen normalizada de 8 bits.
+    """
+    try:
+        ds = pydicom.dcmread(BytesIO(dicom_file.getvalue()))
+        ventana = preparar_ventana(ds)
+    except Exception as e:
+        logger.error(f"Error al procesar el archivo DICOM: {e}")
+        st.error(f"Error al procesar el archivo DICOM: {e}")
+        return None
+
+    imagen = None
+    if ventana is None:
+        imagen, ds, _ = procesar_imagen_dicom(dicom_file)
+        if imagen is None:
+            return None
+
+    return {
+        'ds': ds,
+        'pixel_spacing': obtener_pixel_spacing(ds),
+        'ventana': ventana,
+        'imagen': imagen
+    }
+
+def niveles_para_piramide(decodificada):
+    """
+    Niveles de índices de la pirámide de teselas de un archivo decodificado: los índices de la LUT de ventana
+    o, si no hay motor de ventana, los valores de la imagen de 8 bits.
+    """
+    ventana = decodificada['ventana']
+    if ventana is None:
+        return niveles_indices(np.asarray(decodificada['imagen'].convert('L')))
+    indices, _ = indices_navegador(ventana, MAX_ENTRADAS_LUT_NAVEGADOR)
+    return niveles_indices(indices, promediar=indices_monotonos(ventana))
 
-        if analizar:
-            # Preparar las opciones para el procesamiento individual
-            opciones_procesamiento = {
-                'uploaded_image': selected_file
-            }
-            procesamiento_individual(opciones_procesamiento)
+def obtener_descarga(clave, generar):
+    """
+    Devuelve los bytes de un archivo de descarga, generándolos con generar() solo si no están en la caché.
+    """
+    datos = _cache_descargas.obtener(clave)
+    if datos is None:
+        datos = generar()
+        _cache_descargas.guardar(clave, datos, len(datos))
+    return datos
+
+def _copiar_dataset_sin_pixeles(ds):
+    # Copia profunda de todos los elementos salvo PixelData, que se va a reemplazar:
+    # el dataset compartido por la caché del visor no se modifica y no se duplican los píxeles originales
+    copia = pydicom.Dataset()
+    for elemento in ds:
+        if elemento.tag != 0x7FE00010:
+            copia.add(copy.deepcopy(elemento))
+    file_meta = getattr(ds, 'file_meta', None)
+    if file_meta is not None:
+        copia.file_meta = copy.deepcopy(file_meta)
+    copia.preamble = getattr(ds, 'preamble', None)
+    return copia
+
+# Elementos que describen los píxeles originales y dejan de ser válidos con los de 8 bits ya ajustados
+_ELEMENTOS_PIXELES_ORIGINALES = (
+    'WindowCenter', 'WindowWidth', 'WindowCenterWidthExplanation', 'VOILUTFunction', 'VOILUTSequence',
+    'RescaleSlope', 'RescaleIntercept', 'RescaleType', 'ModalityLUTSequence', 'PixelPaddingValue',
+    'PixelPaddingRangeLimit', 'SmallestImagePixelValue', 'LargestImagePixelValue', 'PlanarConfiguration',
+    'NumberOfFrames'
+)
+
+def generar_dicom_modificado(ds, imagen):
+    """
+    Genera un archivo DICOM con los píxeles de la imagen editada sobre una copia del dataset.
+    La imagen ya tiene aplicados la ventana y la inversión de MONOCHROME1, por lo que se guarda como
+    MONOCHROME2 de 8 bits sin VOI LUT ni reescalado. El archivo generado se vuelve a leer para comprobar
+    que sus píxeles se decodifican igual.
+    """
+    inicio = time.perf_counter()
+    try:
+        # Convertir la imagen editada a escala de grises para guardar en DICOM
+        pixel_data = np.array(imagen.convert("L"))
+
+        copia = _copiar_dataset_sin_pixeles(ds)
+        for nombre in _ELEMENTOS_PIXELES_ORIGINALES:
+            if nombre in copia:
+                delattr(copia, nombre)
+        copia.Rows, copia.Columns = pixel_data.shape
+        copia.SamplesPerPixel = 1
+        copia.PhotometricInterpretation = 'MONOCHROME2'
+        copia.BitsAllocated = 8
+        copia.BitsStored = 8
+        copia.HighBit = 7
+        copia.PixelRepresentation = 0
+        copia.PixelData = pixel_data.tobytes()
+        # Los nuevos píxeles no están comprimidos
+        transfer_syntax = getattr(getattr(copia, 'file_meta', None), 'TransferSyntaxUID', None)
+        if transfer_syntax is not None and transfer_syntax.is_compressed:
+            copia.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+
+        dicom_buffer = BytesIO()
+        copia.save_as(dicom_buffer)
+
+        releido = pydicom.dcmread(BytesIO(dicom_buffer.getvalue())).pixel_array
+        if not np.array_equal(releido, pixel_data):
+            raise ValueError("los píxeles del DICOM generado no coinciden con la imagen editada")
+    except Exception as e:
+        logger.error(f"Error al preparar el archivo DICOM: {e}")
+        raise
+    logger.info(f"DICOM modificado generado en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+    return dicom_buffer.getvalue()
 
-    else:
-        st.error(f"No se pudo procesar la imagen {selected_file.name}")
+def estadisticas_cache_visor():
+    """
+    Devuelve las estadísticas de la caché de imágenes decodificadas del visor.
+    """
+    return _cache_decodificadas.estadisticas()
 
 def procesar_imagen_dicom(dicom_file):
     """
@@ -324,32 +849,12 @@ def procesar_imagen_dicom(dicom_file):
     """
     try:
         dicom = pydicom.dcmread(BytesIO(dicom_file.getvalue()))
-        original_image = dicom.pixel_array
 
         # Obtener Pixel Spacing si está disponible
-        pixel_spacing = dicom.get('PixelSpacing', None)
-        if pixel_spacing is not None:
-            pixel_spacing = [float(spacing) for spacing in pixel_spacing]
-        else:
-            # Intentar con ImagerPixelSpacing
-            pixel_spacing = dicom.get('ImagerPixelSpacing', None)
-            if pixel_spacing is not None:
-                pixel_spacing = [float(spacing) for spacing in pixel_spacing]
-            else:
-                # Si no está disponible, usar valores por defecto
-                pixel_spacing = [1, 1]
-
-        # Aplicar VOI LUT si está disponible
-        img_windowed = apply_voi_lut(original_image, dicom)
-
-        # Manejar Photometric Interpretation
-        photometric_interpretation = dicom.get('PhotometricInterpretation', 'UNKNOWN')
-        if photometric_interpretation == 'MONOCHROME1':
-            img_windowed = np.max(img_windowed) - img_windowed
-
-        # Normalizar la imagen para mostrar
-        img_normalized_display = (img_windowed - np.min(img_windowed)) / (np.max(img_windowed) - np.min(img_windowed))
-        img_normalized_display = (img_normalized_display * 255).astype(np.uint8)
+        pixel_spacing = obtener_pixel_spacing(dicom)
+
+        # VOI LUT, MONOCHROME1 y normalización a 8 bits
+        img_normalized_display = normalizar_dicom(dicom)
 
         # Crear imagen para mostrar
         image_display = Image.fromarray(img_normalized_display).convert('L')
@@ -361,6 +866,19 @@ def procesar_imagen_dicom(dicom_file):
         st.error(f"Error al procesar el archivo DICOM: {e}")
         return None, None, None
 
+def obtener_pixel_spacing(dicom):
+    """
+    Devuelve el Pixel Spacing del dataset, o ImagerPixelSpacing, o [1, 1] si no está disponible.
+    """
+    pixel_spacing = dicom.get('PixelSpacing', None)
+    if pixel_spacing is None:
+        # Intentar con ImagerPixelSpacing
+        pixel_spacing = dicom.get('ImagerPixelSpacing', None)
+    if pixel_spacing is not None:
+        return [float(spacing) for spacing in pixel_spacing]
+    # Si no está disponible, usar valores por defecto
+    return [1, 1]
+
 def ajustar_brillo_contraste(imagen, brillo, contraste):
     """
     Ajusta el brillo y contraste de una imagen PIL.
@@ -377,3 +895,14 @@ def ajustar_brillo_contraste(imagen, brillo, contraste):
         logger.error(f"Error al ajustar brillo y contraste: {e}")
         st.error(f"Error al ajustar brillo y contraste: {e}")
         return imagen
+
+def lut_brillo_contraste(histograma, brillo, contraste):
+    """
+    LUT de 8 bits que aproxima ajustar_brillo_contraste() a partir del histograma de la imagen,
+    para aplicar el ajuste en el navegador sin recalcular la imagen.
+    """
+    valores = np.arange(256, dtype=np.float64)
+    brillante = np.floor(np.clip(valores * (1 + brillo / 100), 0, 255))
+    histograma = np.asarray(histograma, dtype=np.float64)
+    media = int(np.dot(histograma, brillante) / max(histograma.sum(), 1) + 0.5)
+    return np.clip(np.floor(media + (brillante - media) * (1 + contraste / 100)), 0, 255).astype(np.uint8)
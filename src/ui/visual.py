@@ -5,14 +5,31 @@ from PIL import Image
 import os
 import logging
 from src.modulos.gestion_dicom import gestionar_dicom
-from src.modulos.procesamiento_m import procesamiento_masivo
+from src.modulos.procesamiento_m import procesamiento_masivo, trabajos_sesion, CLAVE_TRABAJO_MASIVO
+from src.modulos.trabajos import obtener_gestor_trabajos
+from src.modulos.registro_modelos import estadisticas_modelos, liberar_todos
+from src.modulos.cache_clasificacion import obtener_cache_clasificacion
+from src.modulos import metricas
+from src.modulos.configuracion import TAMANO_LOTE, NUM_TRABAJADORES_DECODIFICACION, PROFUNDIDAD_COLA, MODO_LIGERO_MASIVO
+from src.modulos.configuracion import DECODIFICACION_REDUCIDA_MASIVA
+from src.modulos.configuracion import FORMATO_VISTA_PREVIA, CALIDAD_VISTA_PREVIA, CLASIFICACION_ESPECULATIVA
 
 # Configuración del logger
 logging.basicConfig(level=logging.ERROR)
 logger = logging.getLogger(__name__)
 
 
+# Clave de session_state con las medidas por etapa de la sesión
+CLAVE_METRICAS = 'metricas_sesion'
+
 def main():
+    # Las medidas por etapa de esta ejecución del script (y de los trabajos que envía) son las de la sesión
+    if CLAVE_METRICAS not in st.session_state:
+        st.session_state[CLAVE_METRICAS] = metricas.Metricas()
+    with metricas.ambito(st.session_state[CLAVE_METRICAS]):
+        mostrar_aplicacion()
+
+def mostrar_aplicacion():
     # Configurar el título de la página en el navegador
     st.set_page_config(page_title="MamoViewer AI", layout="wide")
 
@@ -252,6 +269,25 @@ def main():
         # Establecer directamente la subsección a "Visor DICOM"
         opciones['subseccion'] = "Visor DICOM"  # Establecer directamente sin opciones adicionales
 
+        # Vista previa en pantalla cuando el servidor no sirve la pirámide de teselas (que siempre es PNG sin pérdida);
+        # las descargas siempre se generan a resolución completa
+        formatos_vista = ["JPEG", "WEBP", "PNG"]
+        opciones['formato_vista_previa'] = st.sidebar.selectbox(
+            "Formato de la vista previa", formatos_vista,
+            index=formatos_vista.index(FORMATO_VISTA_PREVIA) if FORMATO_VISTA_PREVIA in formatos_vista else 0)
+        opciones['calidad_vista_previa'] = st.sidebar.slider(
+            "Calidad de la vista previa", 30, 100, CALIDAD_VISTA_PREVIA,
+            disabled=opciones['formato_vista_previa'] == "PNG")
+
+        # Opciones del análisis de la imagen abierta en el visor
+        opciones['baja_latencia'] = st.sidebar.checkbox(
+            "Modo de baja latencia", value=CLASIFICACION_ESPECULATIVA,
+            help="Ejecuta el modelo primario y los secundarios en paralelo y conserva solo el secundario "
+                 "que corresponde a la predicción primaria. Reduce la latencia a costa de más CPU.")
+        opciones['usar_cache'] = st.sidebar.checkbox(
+            "Usar caché de clasificaciones", value=True, key="usar_cache_individual",
+            help="Reutiliza el resultado si la imagen ya se clasificó con la misma revisión de los modelos.")
+
         gestionar_dicom(opciones)
 
     elif tipo_carga == "Procesamiento Masivo":
@@ -265,9 +301,127 @@ def main():
         )
         opciones['uploaded_images'] = uploaded_images
 
-        if uploaded_images:
-            procesamiento_masivo(opciones)
-        else:
+        # Parámetros de la inferencia por lotes
+        opciones['tamano_lote'] = st.sidebar.number_input(
+            "Tamaño de lote", min_value=1, max_value=128, value=TAMANO_LOTE, step=1)
+        opciones['evaluar_con_nombres'] = st.sidebar.checkbox(
+            "Evaluar con etiquetas del nombre de archivo", value=True,
+            help="Compara las predicciones con el prefijo del nombre (mass_, calc_, no_). "
+                 "Desactívalo para datos sin etiquetar.")
+        opciones['num_trabajadores'] = st.sidebar.number_input(
+            "Hilos de decodificación", min_value=1, max_value=32, value=NUM_TRABAJADORES_DECODIFICACION, step=1)
+        opciones['profundidad_cola'] = st.sidebar.number_input(
+            "Profundidad de la cola", min_value=1, max_value=256, value=PROFUNDIDAD_COLA, step=1)
+        opciones['usar_cache'] = st.sidebar.checkbox(
+            "Usar caché de clasificaciones", value=True,
+            help="Reutiliza los resultados de imágenes ya clasificadas con la misma revisión de los modelos.")
+        opciones['modo_ligero'] = st.sidebar.checkbox(
+            "Modo ligero (solo clasificación)", value=MODO_LIGERO_MASIVO,
+            help="No genera la imagen para mostrar de cada archivo y libera sus buffers en cuanto está lista la "
+                 "imagen para el modelo. Reduce la memoria en lotes grandes sin cambiar los resultados.")
+        opciones['decodificacion_reducida'] = st.sidebar.checkbox(
+            "Decodificación reducida", value=DECODIFICACION_REDUCIDA_MASIVA,
+            help="Decodifica cada imagen directamente a la resolución del modelo. Es mucho más rápido, pero los "
+                 "resultados pueden diferir ligeramente de los de la decodificación completa.")
+
+        if not uploaded_images:
             st.sidebar.info(
                 "Por favor, carga una o más imágenes DICOM, PNG o JPG para realizar el procesamiento masivo.")
+        # Sin imágenes cargadas se sigue mostrando el trabajo al que está conectada la sesión
+        procesamiento_masivo(opciones)
+        mostrar_panel_trabajos()
+
+    mostrar_panel_modelos()
+    mostrar_panel_cache()
+    mostrar_panel_metricas()
+
+
+def mostrar_panel_modelos():
+    # Estado del registro de modelos compartido por todas las sesiones
+    with st.sidebar.expander("Modelos en memoria"):
+        estadisticas = estadisticas_modelos()
+        if not estadisticas:
+            st.write("No hay modelos cargados.")
+            return
+
+        for entrada in estadisticas:
+            st.write(f"**{entrada['modelo']}** ({entrada['revision']}, {entrada['dispositivo']}, {entrada['backend']})")
+            st.write(f"Carga: {entrada['tiempo_carga']:.2f} s · Memoria: {entrada['memoria_mb']:.1f} MB · Usos: {entrada['usos']}")
+
+        if st.button("Liberar modelos", key="liberar_modelos"):
+            liberar_todos()
+            st.success("Modelos liberados. Se volverán a cargar en el próximo análisis.")
+
+
+def conectar_trabajo(id_trabajo):
+    st.session_state[CLAVE_TRABAJO_MASIVO] = id_trabajo
+
+
+def mostrar_panel_trabajos():
+    # Trabajos de clasificación masiva de esta sesión: los que envió y aquellos a los que se conectó con su entrada
+    with st.sidebar.expander("Trabajos en segundo plano"):
+        gestor = obtener_gestor_trabajos()
+        trabajos = trabajos_sesion(gestor)
+        if not trabajos:
+            st.write("No hay trabajos.")
+            return
+
+        conectado = st.session_state.get(CLAVE_TRABAJO_MASIVO)
+        for trabajo in trabajos:
+            estado = trabajo.instantanea()
+            st.write(f"**{estado['id']}**{' (esta sesión)' if estado['id'] == conectado else ''}: {estado['descripcion']}")
+            st.write(f"{estado['estado'].replace('_', ' ').capitalize()} · {estado['completados']} de {estado['total']} "
+                     f"· {estado['duracion_s']:.0f} s")
+            col1, col2 = st.columns(2)
+            col1.button("Ver", key=f"ver_trabajo_{estado['id']}", on_click=conectar_trabajo, args=(estado['id'],),
+                        disabled=estado['id'] == conectado)
+            if not trabajo.terminado:
+                col2.button("Cancelar", key=f"cancelar_trabajo_{estado['id']}", on_click=gestor.cancelar,
+                            args=(estado['id'],), disabled=estado['cancelacion_solicitada'])
+
+
+def mostrar_panel_cache():
+    # Estado de la caché persistente de clasificaciones
+    cache = obtener_cache_clasificacion()
+    if cache is None:
+        return
+
+    with st.sidebar.expander("Caché de clasificaciones"):
+        estadisticas = cache.estadisticas()
+        st.write(f"Entradas: {estadisticas['entradas']} de {estadisticas['max_entradas']}")
+        st.write(f"Aciertos: {estadisticas['aciertos']} · Fallos: {estadisticas['fallos']} "
+                 f"({estadisticas['tasa_aciertos'] * 100:.1f}% de aciertos)")
+        st.write(f"Expulsiones: {estadisticas['expulsiones']} · Invalidaciones: {estadisticas['invalidaciones']}")
+
+        if st.button("Vaciar caché", key="vaciar_cache_clasificacion"):
+            cache.vaciar()
+            st.success("Caché de clasificaciones vaciada.")
+
+
+def mostrar_panel_metricas():
+    # Tiempo propio de cada etapa en la última ejecución de la sesión (suma de todos los hilos)
+    with st.sidebar.expander("Rendimiento por etapa"):
+        activas = st.checkbox("Medir tiempos por etapa", value=metricas.activas(), key="metricas_activas")
+        if activas != metricas.activas():
+            metricas.activar(activas)
+
+        filas = metricas.resumen()
+        if not filas:
+            st.write("No hay medidas de la ejecución actual.")
+            return
+
+        st.dataframe(
+            [{'Etapa': fila['etapa'], 'N': fila['n'], 'Total (s)': round(fila['total_s'], 2),
+              'p50 (ms)': round(fila['p50_ms'], 1), 'p95 (ms)': round(fila['p95_ms'], 1),
+              'Máx. (ms)': round(fila['max_ms'], 1)} for fila in filas],
+            width="stretch", hide_index=True)
 
+        col1, col2 = st.columns(2)
+        col1.download_button("JSON", data=metricas.exportar_json(), file_name="metricas.json",
+                             mime="application/json", key="descargar_metricas_json")
+        col2.download_button("Prometheus", data=metricas.exportar_prometheus(), file_name="metricas.prom",
+                             mime="text/plain", key="descargar_metricas_prometheus")
+        if st.button("Reiniciar medidas", key="reiniciar_metricas"):
+            # Solo las medidas de esta sesión
+            metricas.reiniciar()
+            st.success("Medidas reiniciadas.")